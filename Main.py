@@ -1,12 +1,10 @@
 # Import statements MUST be first
+import os
 import streamlit as st
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
-from datetime import datetime
 import time
 
+run_started = time.perf_counter()
+
 # Configure page - MUST be first Streamlit command
 st.set_page_config(
     page_title="Weather Forecast Pro",
@@ -17,11 +15,25 @@ st.set_page_config(
 
 # Import your backend function AFTER set_page_config
 try:
-    from backend import get_data
+    from backend import (get_data_nowait, get_data_result, get_data_many, forecast_frame,
+                         forecast_version, cache_stats, coalescing_stats, get_client, get_store,
+                         configure, start_prefetcher, suggest_places, forecast_diff, forecast_history,
+                         quota_stats, QuotaExceeded, subscribe, get_city_grid, locate, BACKGROUND,
+                         ServiceSource, TEMPERATURE_SCALE)
+    import timing
 except ImportError:
     st.error("❌ Backend module not found. Please ensure 'backend.py' exists with the 'get_data' function.")
     st.stop()
 
+# Hand the API key to the backend so it never has to import Streamlit itself.
+# Reading st.secrets without a secrets.toml puts an error on the page, so the
+# environment is checked first and the secrets only when the file exists.
+api_key = os.environ.get("OPENWEATHER_API_KEY")
+if not api_key and st.secrets.load_if_toml_exists():
+    api_key = st.secrets.get("openweather", {}).get("api_key")
+if api_key:
+    configure(api_key=api_key)
+
 # Custom CSS for modern styling
 st.markdown("""
 <style>
@@ -204,6 +216,82 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Only the place, the forecast duration and the sidebar options rerun the whole
+# page. Everything else is drawn by a fragment: it is called with the data it
+# reads and reruns on its own when one of its widgets changes.
+
+
+@st.fragment
+def cache_panel(prefetcher):
+    # Upstream call budget left; behind the forecast service that is the service's budget
+    client = get_client()
+    service = client.service_stats() if isinstance(client, ServiceSource) else None
+    quota = service["quota"] if service is not None else quota_stats()
+    if quota["per_minute"]:
+        st.progress(quota["minute"] / quota["per_minute"],
+                    text=f"🚦 {quota['minute']:.0f}/{quota['per_minute']} calls left this minute")
+    if quota["per_day"]:
+        st.progress(quota["day"] / quota["per_day"],
+                    text=f"📆 {quota['day']:.0f}/{quota['per_day']} calls left today")
+
+    # Forecast cache counters
+    with st.expander("🗄️ Forecast Cache"):
+        st.button("🔄 Refresh counters", key="refresh_cache_stats", use_container_width=True)
+        stats = cache_stats()
+        cache_col1, cache_col2, cache_col3 = st.columns(3)
+        cache_col1.metric("Hits", stats["hits"])
+        cache_col2.metric("Misses", stats["misses"])
+        cache_col3.metric("Evictions", stats["evictions"])
+        st.caption(f"{stats['size']}/{stats['max_entries']} places cached · "
+                   f"{stats['hit_rate']:.0%} hit rate")
+        latency = client.latency_stats()
+        st.caption(f"Upstream: {latency['requests']} requests · {latency['retries']} retries · "
+                   f"p50 {latency['p50_ms']:.0f} ms · p95 {latency['p95_ms']:.0f} ms")
+        if isinstance(client, ServiceSource):
+            service_panel(client, service)
+        if prefetcher is not None:
+            prefetch = prefetcher.stats()
+            st.caption(f"Prefetch: {prefetch['targets']} places · {prefetch['refreshed']} refreshed · "
+                       f"{prefetch['skipped']} already fresh · {prefetch['shed']} shed · "
+                       f"{prefetch['errors']} errors")
+        for name, counts in quota["classes"].items():
+            st.caption(f"Quota {name}: {counts['admitted']} admitted · {counts['queued']} queued · "
+                       f"{counts['shed']} shed · {counts['stale']} served stale")
+        flights = coalescing_stats()
+        st.caption(f"Coalesced {flights['coalesced']} of {flights['calls']} fetches into "
+                   f"{flights['upstream']} upstream calls")
+        store = get_store()
+        if store is not None:
+            store_stats = store.stats()
+            st.caption(f"Disk store: {store_stats['rows']} forecasts · {store_stats['bytes'] / 1024:.0f} KiB · "
+                       f"{store_stats['hits']} warm loads")
+
+
+def service_panel(client, service):
+    # Counters of the forecast service shared by all dashboard processes
+    if service is None:
+        st.caption(f"⚠️ Forecast service unreachable, fetching directly ({client.fallbacks} fallbacks)")
+        return
+    total = service["total"]
+    st.caption(f"Service: {total['requests']} requests from {len(service['workers'])} workers · "
+               f"{total['hit_rate']:.0%} hit rate · {total['upstream']} upstream calls")
+    for worker, counts in sorted(service["workers"].items()):
+        this = " (this worker)" if worker == client.worker else ""
+        st.caption(f"Worker {worker}{this}: {counts['requests']} requests · {counts['hit_rate']:.0%} hits · "
+                   f"{counts['upstream']} upstream calls")
+
+
+# Seconds between checks for a refreshed forecast
+LIVE_INTERVALS = {"Off": None, "15 s": 15, "1 min": 60, "5 min": 300}
+
+
+def watch_forecast(subscription):
+    # Rerun the page only once a newer forecast for this place has been published
+    if subscription.updated():
+        st.rerun()
+    st.caption(f"🟢 Live · checked {time.strftime('%H:%M:%S')}")
+
+
 # Sidebar for controls
 with st.sidebar:
     st.markdown("### 🎛️ Control Panel")
@@ -215,6 +303,14 @@ with st.sidebar:
         help="Enter any city name to get weather forecast"
     )
 
+    # Type-ahead from the local city index
+    suggestions = [s for s in suggest_places(place, limit=4) if s.lower() != place.strip().lower()] if place else []
+    if suggestions:
+        st.caption("Did you mean")
+        for i, suggestion in enumerate(suggestions):
+            if st.button(suggestion, key=f"suggestion_{i}", use_container_width=True):
+                st.session_state.quick_location = suggestion
+
     # Days slider with custom styling
     days = st.slider(
         "📅 Forecast Duration",
@@ -224,19 +320,18 @@ with st.sidebar:
         help="Select number of days for weather forecast"
     )
 
-    # Data type selection
-    option = st.selectbox(
-        "📊 Data Visualization",
-        ("Temperature", "Sky", "Detailed Analysis"),
-        help="Choose what weather data to display"
-    )
-
     # Additional controls
     st.markdown("---")
     st.markdown("### ⚙️ Display Options")
 
-    show_metrics = st.checkbox("Show Key Metrics", value=True)
-    animate_charts = st.checkbox("Animated Charts", value=True)
+    stale_while_revalidate = st.checkbox(
+        "Show Cached While Refreshing", value=True,
+        help="Display the last cached forecast immediately while a fresh one is fetched"
+    )
+    live_interval = st.selectbox(
+        "🔴 Live Updates", list(LIVE_INTERVALS), index=2,
+        help="How often an open page checks for a refreshed forecast; checks never call the forecast service"
+    )
 
     # Quick location buttons
     st.markdown("### 🌏 Quick Locations")
@@ -252,152 +347,242 @@ with st.sidebar:
             if col2.button(location, key=f"quick_{i}"):
                 st.session_state.quick_location = location
 
-# Use quick location if selected
-if 'quick_location' in st.session_state:
-    place = st.session_state.quick_location
+    # Keep the quick locations (and the most requested places) warm in the background
+    prefetcher = start_prefetcher(quick_locations)
 
-# Main content area
-if place:
-    # Create columns for layout
-    col1, col2, col3 = st.columns([1, 2, 1])
+    cache_panel(prefetcher)
 
-    with col2:
-        st.markdown(f"""
-        <div style="text-align: center; margin: 2rem 0;">
-            <h2 style="color: #1f2937; font-weight: 600;">
-                {option} forecast for the next {days} {'day' if days == 1 else 'days'} in 
-                <span style="color: #ff6b6b;">{place}</span>
-            </h2>
-        </div>
-        """, unsafe_allow_html=True)
+    # One switch for the whole process: the last session to flip it decides for every
+    # session, so the box shows the current setting rather than this session's last click
+    st.session_state.diagnostics = timing.enabled()
+    st.checkbox(
+        "🩺 Diagnostics", key="diagnostics",
+        on_change=lambda: timing.enable(st.session_state.diagnostics),
+        help="Time fetch, parse and render stages and show p50/p95/p99 per stage. "
+             "Shared by every session of this dashboard: turning it on or off does so for everyone"
+    )
+    diagnostics_panel = st.empty()
 
-    try:
-        # Show loading animation
-        with st.spinner('🌐 Fetching weather data...'):
-            time.sleep(1)  # Simulate loading
-            filtered_data = get_data(place, days)
+# Views offered by the visualization fragment
+VIEWS = ("Temperature", "Sky", "Detailed Analysis", "City Comparison", "Forecast Drift", "Regional Map")
 
-        if not filtered_data:
-            st.error("❌ No data available for this location")
-            st.stop()
+# Most markers (cities or clusters) the map draws and fetches at once
+MAP_MARKERS = 150
 
-        # Key metrics display
-        if show_metrics:
-            st.markdown("### 📈 Key Weather Metrics")
-
-            # Calculate metrics
-            temperatures = [d["main"]["temp"] / 10 for d in filtered_data]
-            avg_temp = sum(temperatures) / len(temperatures)
-            max_temp = max(temperatures)
-            min_temp = min(temperatures)
-
-            # Weather conditions summary
-            conditions = [d["weather"][0]["main"] for d in filtered_data]
-            most_common = max(set(conditions), key=conditions.count)
-
-            # Display metrics in columns
-            metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
-
-            with metric_col1:
-                st.metric(
-                    label="🌡️ Avg Temperature",
-                    value=f"{avg_temp:.1f}°C",
-                    delta=f"{avg_temp - 20:.1f}°C from comfort zone"
-                )
-
-            with metric_col2:
-                st.metric(
-                    label="🔥 Max Temperature",
-                    value=f"{max_temp:.1f}°C",
-                    delta=f"{max_temp - avg_temp:.1f}°C above avg"
-                )
-
-            with metric_col3:
-                st.metric(
-                    label="❄️ Min Temperature",
-                    value=f"{min_temp:.1f}°C",
-                    delta=f"{min_temp - avg_temp:.1f}°C below avg"
-                )
-
-            with metric_col4:
-                st.metric(
-                    label="🌤️ Dominant Weather",
-                    value=most_common,
-                    delta="Most frequent condition"
-                )
 
-        # Weather visualization based on selected option
-        if option == "Temperature":
-            st.markdown("### 🌡️ Temperature Trends")
+def render_figure(view, key, version, build, refresh=None):
+    """Draw the cached figure for ``key`` and return its serialized size."""
+    with timing.stage("figure.build"):
+        fig = charts.figure_cache.get(key, version, build, refresh)
+    with timing.stage(f"chart.{view}"):
+        st.plotly_chart(fig, use_container_width=True, theme=None)
+    size = charts.figure_cache.size(key)
+    return size if size is not None else len(fig.to_json())
 
-            # Prepare data
-            temperatures = [d["main"]["temp"] / 10 for d in filtered_data]
-            dates = [d["dt_txt"] for d in filtered_data]
-
-            # Create DataFrame
-            df = pd.DataFrame({
-                'Date': pd.to_datetime(dates),
-                'Temperature': temperatures
-            })
-
-            # Create enhanced temperature chart
-            fig = go.Figure()
-
-            # Add temperature line
-            fig.add_trace(go.Scatter(
-                x=df['Date'],
-                y=df['Temperature'],
-                mode='lines+markers',
-                name='Temperature',
-                line=dict(color='#3b82f6', width=3, shape='spline'),
-                marker=dict(size=8, color='#fff', line=dict(color='#3b82f6', width=2)),
-                fill='tonexty',
-                fillcolor='rgba(59, 130, 246, 0.1)'
-            ))
-
-            # Add temperature range bands
-            fig.add_hline(y=20, line_dash="dash", line_color="rgba(100,116,139,0.5)",
-                          annotation_text="Comfort Zone", annotation_position="bottom right")
-
-            # Update layout
-            fig.update_layout(
-                title=dict(
-                    text=f"Temperature Forecast - {place}",
-                    font=dict(size=24, color='#1e293b', family='Inter'),
-                    x=0.5
-                ),
-                xaxis_title="Date & Time",
-                yaxis_title="Temperature (°C)",
-                font=dict(color='#374151', family='Inter'),
-                paper_bgcolor='rgba(255,255,255,0.98)',
-                plot_bgcolor='rgba(255,255,255,0.98)',
-                xaxis=dict(gridcolor='rgba(148,163,184,0.3)', showgrid=True),
-                yaxis=dict(gridcolor='rgba(148,163,184,0.3)', showgrid=True),
-                showlegend=False,
-                height=500
-            )
 
-            st.plotly_chart(fig, use_container_width=True)
+@st.fragment
+def metrics_row(summary):
+    # Key metrics display
+    if not st.checkbox("Show Key Metrics", value=True, key="show_metrics"):
+        return
 
-            # Temperature distribution
-            st.markdown("### 📊 Temperature Distribution")
+    with timing.stage("fragment.metrics"):
+        st.markdown("### 📈 Key Weather Metrics")
+
+        # Calculate metrics
+        key_metrics = summary.metrics()
+        avg_temp = key_metrics["avg"]
+        max_temp = key_metrics["max"]
+        min_temp = key_metrics["min"]
 
-            hist_fig = px.histogram(
-                df, x='Temperature', nbins=15,
-                title="Temperature Distribution",
-                color_discrete_sequence=['#3b82f6']
+        # Weather conditions summary
+        most_common = key_metrics["dominant"]
+
+        # Display metrics in columns
+        metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
+
+        with metric_col1:
+            st.metric(
+                label="🌡️ Avg Temperature",
+                value=f"{avg_temp:.1f}°C",
+                delta=f"{avg_temp - 20:.1f}°C from comfort zone"
+            )
+
+        with metric_col2:
+            st.metric(
+                label="🔥 Max Temperature",
+                value=f"{max_temp:.1f}°C",
+                delta=f"{max_temp - avg_temp:.1f}°C above avg"
             )
 
-            hist_fig.update_layout(
-                font=dict(color='#374151', family='Inter'),
-                paper_bgcolor='rgba(255,255,255,0.98)',
-                plot_bgcolor='rgba(255,255,255,0.98)',
-                xaxis=dict(gridcolor='rgba(148,163,184,0.3)'),
-                yaxis=dict(gridcolor='rgba(148,163,184,0.3)'),
-                height=400
+        with metric_col3:
+            st.metric(
+                label="❄️ Min Temperature",
+                value=f"{min_temp:.1f}°C",
+                delta=f"{min_temp - avg_temp:.1f}°C below avg"
             )
 
-            st.plotly_chart(hist_fig, use_container_width=True)
+        with metric_col4:
+            st.metric(
+                label="🌤️ Dominant Weather",
+                value=most_common,
+                delta="Most frequent condition"
+            )
+
+
+@st.fragment
+def comparison_view(place, days, quick_locations):
+    compare_input = st.text_input(
+        "Compare with",
+        value=", ".join(city for city in quick_locations if city.lower() != place.lower()),
+        help="Comma-separated list of cities to plot alongside the selected location"
+    )
+
+    with timing.stage("fragment.comparison"):
+        compare_places = [place] + [city.strip() for city in compare_input.split(",") if city.strip()]
+
+        # Versions are read first: a refresh landing in between then only files newer
+        # data under an older version, which no later run asks for
+        versions = tuple(forecast_version(city) for city in compare_places)
+
+        # Fetch every city concurrently in one batch
+        with st.spinner(f'🌐 Fetching {len(compare_places)} cities...'):
+            start = time.perf_counter()
+            results, errors = get_data_many(compare_places, days)
+            elapsed = time.perf_counter() - start
+
+        for city, error in errors.items():
+            st.warning(f"⚠️ Could not load '{city}': {error}")
+
+        loaded = [city for city in compare_places if city in results]
+        if not loaded:
+            st.warning("⚠️ None of the cities could be loaded, so there is nothing to compare.")
+            return
+
+        # One columnar frame for every city, in the order they were asked for
+        compare_df = forecast_frame({city: results[city] for city in loaded})
+
+        versions = tuple(version for city, version in zip(compare_places, versions) if city in results)
+        size = render_figure("City Comparison", (tuple(loaded), days, "City Comparison"),
+                             None if None in versions else versions,
+                             lambda: charts.comparison_figure(compare_df))
+        st.caption(f"Fetched {len(results)} of {len(compare_places)} cities in {elapsed:.2f}s · "
+                   f"{size / 1024:.1f} KiB chart")
+
+
+@st.fragment
+def drift_view(place, days):
+    lookback = st.slider("Look back (days)", min_value=1, max_value=7, value=2,
+                         help="Include slots up to this many days in the past")
+
+    with timing.stage("fragment.drift"):
+        now = time.time()
+        # Reads only the archive partitions for the slots in range
+        with timing.stage("archive.query"):
+            history = forecast_history(place, now - lookback * 86400, now + days * 86400)
+
+        if history is None:
+            st.info("💡 Set WEATHER_ARCHIVE_DIR to archive every fetched forecast and chart how it drifts.")
+        elif history['fetched_at'].nunique() < 2:
+            st.info("📭 Not enough archived fetches yet: drift shows up once this place has been "
+                    "fetched in more than one forecast cycle.")
+        else:
+            from metrics import forecast_drift
+
+            drift = forecast_drift(history)
+            render_figure("Forecast Drift", (place, days, "Forecast Drift"), None,
+                          lambda: charts.drift_figure(history, drift, place))
+            st.caption(f"{history['fetched_at'].nunique()} archived fetches · {len(history)} slot values")
+
+
+@st.fragment
+def map_view(place):
+    grid = get_city_grid()
+    if grid is None:
+        st.info("💡 Set WEATHER_CITY_LIST to an OpenWeatherMap city list to map its cities.")
+        return
+
+    if st.session_state.get("map_place") != place:
+        st.session_state.map_place = place
+        st.session_state.map_center = locate(place) or (20.0, 0.0)
+
+    zoom_col, hours_col = st.columns(2)
+    zoom = zoom_col.slider("🔍 Zoom", min_value=0, max_value=10, value=3, key="map_zoom")
+    hours = hours_col.select_slider("🕒 Forecast", options=list(range(0, 120, 3)), value=0, key="map_hours",
+                                    format_func=lambda h: "Now" if h == 0 else f"+{h} h")
+
+    # Pan by half a viewport; the viewport is twice as wide as it is high
+    lat, lon = st.session_state.map_center
+    width = 360 / 2 ** zoom
+    height = width / 2
+    pan_cols = st.columns(5)
+    moves = {"⬅️": (0, -width / 2), "⬆️": (height / 2, 0), "⬇️": (-height / 2, 0), "➡️": (0, width / 2)}
+    for col, (label, (dlat, dlon)) in zip(pan_cols, moves.items()):
+        if col.button(label, key=f"map_pan_{dlat}_{dlon}", use_container_width=True):
+            lat, lon = lat + dlat, lon + dlon
+    if pan_cols[4].button("🎯", key="map_recenter", use_container_width=True, help="Centre on the location"):
+        lat, lon = locate(place) or (lat, lon)
+    lat = min(max(lat, -90 + height / 2), 90 - height / 2)
+    lon = min(max(lon, -180 + width / 2), 180 - width / 2)
+    st.session_state.map_center = (lat, lon)
+    viewport = (lon - width / 2, lat - height / 2, lon + width / 2, lat + height / 2)
+
+    with timing.stage("fragment.map"):
+        # Only the cities in view, or one cluster per grid cell when there are too many
+        start = time.perf_counter()
+        with timing.stage("map.query"):
+            markers = grid.query(*viewport, max_markers=MAP_MARKERS)
+        query_ms = (time.perf_counter() - start) * 1000
+        cities = [grid.cities[i] for i in markers.city]
+
+        # Bulk fetch as background work: the map never eats into the interactive quota
+        with st.spinner(f'🌐 Fetching {len(cities)} cities...'):
+            results, errors = get_data_many([f"id:{city.id}" for city in cities], priority=BACKGROUND)
+        slot = hours // 3
+        points = []
+        for city in cities:
+            forecast = results.get(f"id:{city.id}")
+            points.append(forecast[slot] if forecast is not None and len(forecast) > slot else None)
+
+        render_figure("Regional Map", (viewport, hours, "Regional Map"), None,
+                      lambda: charts.map_figure(markers, cities, points, viewport))
+        kind = ("cluster" if markers.clustered else "city") if len(cities) == 1 else \
+            ("clusters" if markers.clustered else "cities")
+        st.caption(f"{len(cities)} {kind} of {len(grid):,} in view · grid level {markers.zoom} · "
+                   f"query {query_ms:.2f} ms · {len(results)} forecasts, {len(errors)} not loaded yet")
+
+
+@st.fragment
+def visualization(place, days, df, summary, version, quick_locations):
+    view_col, animate_col = st.columns([3, 1])
+    option = view_col.selectbox(
+        "📊 Data Visualization",
+        VIEWS,
+        key="view",
+        help="Choose what weather data to display"
+    )
+    animate_col.checkbox("Animated Charts", value=True, key="animate_charts")
+
+    # Serialized size of every figure sent by this run, by view
+    chart_sizes = {}
+
+    with timing.stage("fragment.visualization"):
+        # Weather visualization based on selected option
+        if option == "Temperature":
+            st.markdown("### 🌡️ Temperature Trends")
+
+            chart_sizes["Temperature"] = render_figure(
+                "Temperature", (place, days, "Temperature"), version,
+                lambda: charts.temperature_figure(df, place),
+                lambda fig: charts.refresh_temperature_figure(fig, df))
+
+            # Temperature distribution
+            st.markdown("### 📊 Temperature Distribution")
+
+            chart_sizes["Temperature Distribution"] = render_figure(
+                "Temperature Distribution", (place, days, "Temperature Distribution"), version,
+                lambda: charts.histogram_figure(df),
+                lambda fig: charts.refresh_histogram_figure(fig, df))
 
         elif option == "Sky":
             st.markdown("### 🌤️ Sky Conditions")
@@ -414,25 +599,16 @@ if place:
             }
 
             # Group data by day
-            daily_weather = {}
-            for data_point in filtered_data:
-                date = data_point["dt_txt"].split()[0]
-                condition = data_point["weather"][0]["main"]
-
-                if date not in daily_weather:
-                    daily_weather[date] = []
-                daily_weather[date].append(condition)
+            daily_weather = summary.daily()['condition']
 
             # Create weather cards
             cols = st.columns(min(len(daily_weather), 5))
 
-            for idx, (date, conditions) in enumerate(daily_weather.items()):
-                most_common_condition = max(set(conditions), key=conditions.count)
+            for idx, (date, most_common_condition) in enumerate(daily_weather.items()):
                 icon = weather_icons.get(most_common_condition, "🌤️")
 
                 # Format date
-                date_obj = datetime.strptime(date, "%Y-%m-%d")
-                formatted_date = date_obj.strftime("%a, %b %d")
+                formatted_date = date.strftime("%a, %b %d")
 
                 with cols[idx % 5]:
                     st.markdown(f"""
@@ -462,98 +638,23 @@ if place:
             # Weather conditions pie chart
             st.markdown("### 📊 Weather Conditions Distribution")
 
-            all_conditions = [d["weather"][0]["main"] for d in filtered_data]
-            condition_counts = pd.Series(all_conditions).value_counts()
-
-            pie_fig = px.pie(
-                values=condition_counts.values,
-                names=condition_counts.index,
-                title="Weather Conditions Distribution",
-                color_discrete_sequence=['#3b82f6', '#10b981', '#f59e0b', '#ef4444', '#8b5cf6']
-            )
-
-            pie_fig.update_layout(
-                font=dict(color='#374151', family='Inter'),
-                paper_bgcolor='rgba(255,255,255,0.98)',
-                height=500
-            )
-
-            st.plotly_chart(pie_fig, use_container_width=True)
+            chart_sizes["Weather Conditions"] = render_figure(
+                "Weather Conditions", (place, days, "Weather Conditions"), version,
+                lambda: charts.conditions_pie_figure(df),
+                lambda fig: charts.refresh_conditions_pie_figure(fig, df))
 
         elif option == "Detailed Analysis":
             st.markdown("### 📊 Comprehensive Weather Analysis")
 
-            # Prepare comprehensive data
-            df = pd.DataFrame({
-                'DateTime': pd.to_datetime([d["dt_txt"] for d in filtered_data]),
-                'Temperature': [d["main"]["temp"] / 10 for d in filtered_data],
-                'Humidity': [d.get("main", {}).get("humidity", 50) for d in filtered_data],
-                'Pressure': [d.get("main", {}).get("pressure", 1013) for d in filtered_data],
-                'Condition': [d["weather"][0]["main"] for d in filtered_data]
-            })
-
-            # Create subplots
-            fig = make_subplots(
-                rows=2, cols=2,
-                subplot_titles=('Temperature Trend', 'Humidity Levels', 'Atmospheric Pressure', 'Weather Timeline'),
-                specs=[[{"secondary_y": False}, {"secondary_y": False}],
-                       [{"secondary_y": False}, {"secondary_y": False}]]
-            )
-
-            # Temperature
-            fig.add_trace(
-                go.Scatter(x=df['DateTime'], y=df['Temperature'],
-                           name='Temperature', line=dict(color='#3b82f6')),
-                row=1, col=1
-            )
-
-            # Humidity
-            fig.add_trace(
-                go.Scatter(x=df['DateTime'], y=df['Humidity'],
-                           name='Humidity', line=dict(color='#10b981')),
-                row=1, col=2
-            )
-
-            # Pressure
-            fig.add_trace(
-                go.Scatter(x=df['DateTime'], y=df['Pressure'],
-                           name='Pressure', line=dict(color='#f59e0b')),
-                row=2, col=1
-            )
-
-            # Weather conditions as bar chart
-            condition_counts = df['Condition'].value_counts()
-            fig.add_trace(
-                go.Bar(x=condition_counts.index, y=condition_counts.values,
-                       name='Conditions', marker_color='#8b5cf6'),
-                row=2, col=2
-            )
-
-            fig.update_layout(
-                height=800,
-                showlegend=False,
-                font=dict(color='#374151', family='Inter'),
-                paper_bgcolor='rgba(255,255,255,0.98)',
-                plot_bgcolor='rgba(255,255,255,0.98)'
-            )
-
-            # Update all subplot backgrounds
-            for i in range(1, 3):
-                for j in range(1, 3):
-                    fig.update_xaxes(gridcolor='rgba(148,163,184,0.3)', row=i, col=j)
-                    fig.update_yaxes(gridcolor='rgba(148,163,184,0.3)', row=i, col=j)
-
-            st.plotly_chart(fig, use_container_width=True)
+            chart_sizes["Detailed Analysis"] = render_figure(
+                "Detailed Analysis", (place, days, "Detailed Analysis"), version,
+                lambda: charts.analysis_figure(df),
+                lambda fig: charts.refresh_analysis_figure(fig, df))
 
             # Data summary table
             st.markdown("### 📋 Weather Data Summary")
 
-            summary_df = df.groupby(df['DateTime'].dt.date).agg({
-                'Temperature': ['mean', 'min', 'max'],
-                'Humidity': 'mean',
-                'Pressure': 'mean',
-                'Condition': lambda x: x.mode().iloc[0] if not x.mode().empty else 'Unknown'
-            }).round(2)
+            summary_df = summary.daily().rename_axis('DateTime').round(2)
 
             summary_df.columns = ['Avg Temp (°C)', 'Min Temp (°C)', 'Max Temp (°C)',
                                   'Avg Humidity (%)', 'Avg Pressure (hPa)', 'Dominant Condition']
@@ -564,21 +665,118 @@ if place:
                 height=300
             )
 
+        elif option == "City Comparison":
+            st.markdown("### 🌍 City Comparison")
+            comparison_view(place, days, quick_locations)
+
+        elif option == "Forecast Drift":
+            st.markdown("### 🕰️ Forecast Drift")
+            drift_view(place, days)
+
+        elif option == "Regional Map":
+            st.markdown("### 🗺️ Regional Map")
+            map_view(place)
+
+    if chart_sizes:
+        with st.expander("📦 Chart Payload"):
+            for view, size in chart_sizes.items():
+                st.caption(f"{view}: {size / 1024:.1f} KiB")
+            figure_stats = charts.figure_cache.stats()
+            st.caption(f"Figures reused {figure_stats['hits']} · refreshed {figure_stats['refreshes']} · "
+                       f"built {figure_stats['builds']}")
+
+
+# Use quick location if selected
+if 'quick_location' in st.session_state:
+    place = st.session_state.quick_location
+
+# Main content area
+if place:
+    # Create columns for layout
+    col1, col2, col3 = st.columns([1, 2, 1])
+
+    with col2:
+        st.markdown(f"""
+        <div style="text-align: center; margin: 2rem 0;">
+            <h2 style="color: #1f2937; font-weight: 600;">
+                Forecast for the next {days} {'day' if days == 1 else 'days'} in 
+                <span style="color: #ff6b6b;">{place}</span>
+            </h2>
+        </div>
+        """, unsafe_allow_html=True)
+
+    # Refreshes of this place by any session or the prefetcher are pushed to the page
+    subscription = st.session_state.get("subscription")
+    if subscription is None or subscription.place != place:
+        subscription = st.session_state.subscription = subscribe(place)
+    if subscription is not None:
+        subscription.mark_seen()
+
+    try:
+        # Reruns for the same place count once toward the prefetcher's popular places
+        track = st.session_state.get("tracked_place") != place
+
+        # Serve cached data straight away; only wait on the network when nothing is cached.
+        # The version comes with the data, so cached figures and summaries never pair
+        # a newer version with older data when a refresh lands during this run.
+        filtered_data, version, pending = get_data_nowait(place, days, stale_while_revalidate, track)
+        if filtered_data is None:
+            with st.spinner('🌐 Fetching weather data...'):
+                with timing.stage("fetch.wait"):
+                    filtered_data, version = get_data_result(pending, days)
+        elif pending is not None:
+            st.caption("🔄 Showing the last cached forecast while a fresh one loads.")
+
+        if not filtered_data:
+            st.error("❌ No data available for this location")
+            st.stop()
+        st.session_state.tracked_place = place
+
+        # Plotting is only loaded once there is something to plot
+        import charts
+
+        # Parse once into the columnar frame every view reads from
+        df = forecast_frame(filtered_data)
+        df['temperature'] = df['temp'] * TEMPERATURE_SCALE
+
+        last_refresh = forecast_diff(place)
+        if last_refresh is not None:
+            st.caption(f"🔁 Last refresh: {len(last_refresh.added)} new, {len(last_refresh.changed)} changed, "
+                       f"{len(last_refresh.dropped)} expired slots")
+
+        # Per-day aggregates; after a refresh only the days with changed slots are recomputed
+        from metrics import summary_cache
+
+        with timing.stage("metrics.compute"):
+            summary = summary_cache.get((place, days), version, filtered_data, scale=TEMPERATURE_SCALE)
+
+        if subscription is not None and LIVE_INTERVALS[live_interval]:
+            st.fragment(watch_forecast, run_every=LIVE_INTERVALS[live_interval])(subscription)
+
+        metrics_row(summary)
+        visualization(place, days, df, summary, version, quick_locations)
+
     except KeyError as e:
         st.error(f"❌ Location '{place}' not found. Please check the spelling and try again.")
         st.info("💡 **Tip**: Try searching for major cities or include country names for better results.")
 
-        # Suggest popular locations
-        st.markdown("### 🌟 Popular Locations to Try:")
-        popular_cities = ["New York, USA", "London, UK", "Tokyo, Japan", "Paris, France", "Sydney, Australia"]
+        # Suggest close matches from the city index, or popular locations
+        close_matches = getattr(e, "suggestions", None)
+        st.markdown("### 🔎 Did You Mean:" if close_matches else "### 🌟 Popular Locations to Try:")
+        popular_cities = close_matches[:5] if close_matches else [
+            "New York, USA", "London, UK", "Tokyo, Japan", "Paris, France", "Sydney, Australia"]
 
         cols = st.columns(len(popular_cities))
         for i, city in enumerate(popular_cities):
             with cols[i]:
                 if st.button(city, key=f"popular_{i}"):
-                    st.session_state.quick_location = city.split(',')[0]
+                    st.session_state.quick_location = city if close_matches else city.split(',')[0]
                     st.rerun()
 
+    except QuotaExceeded as e:
+        st.warning(f"🚦 The forecast service's call budget is used up for now; "
+                   f"try again in {e.retry_after:.0f} seconds.")
+
     except Exception as e:
         st.error(f"❌ An unexpected error occurred: {str(e)}")
         st.info("🔄 Please try again or contact support if the issue persists.")
@@ -621,4 +819,17 @@ st.markdown("""
 <div style="text-align: center; color: #6b7280; padding: 1rem;">
     <p>🌤️ Weather Forecast Pro | Built with Streamlit & Plotly | Data powered by your backend API</p>
 </div>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+# Diagnostics
+if timing.enabled():
+    timing.record("render.total", time.perf_counter() - run_started)
+    with diagnostics_panel.container():
+        stage_rows = [
+            {"Stage": name, "Count": stats["count"], "p50 (ms)": stats["p50"] * 1000,
+             "p95 (ms)": stats["p95"] * 1000, "p99 (ms)": stats["p99"] * 1000}
+            for name, stats in timing.summary().items()
+        ]
+        st.dataframe(stage_rows, use_container_width=True, hide_index=True)
+        st.download_button("Export Prometheus", timing.prometheus_text(), file_name="weather_stages.prom")
+        st.download_button("Export JSON Lines", timing.json_lines(), file_name="weather_stages.jsonl")
@@ -0,0 +1,172 @@
+"""Append-only on-disk archive of every fetched forecast.
+
+Each fetch of a place adds one row per slot: fetch time, slot time and
+the slot's values. Rows are fixed-size binary records (``RECORD``)
+appended to ``<root>/<YYYY-MM-DD>/<place key>.bin``, partitioned by the
+UTC date of the slot, so a query for a place and a time range opens only
+the files for those dates, memory-mapped. Condition names are stored as
+codes into ``<root>/conditions.txt``, one name per line. That file is
+only ever appended to and a name's code is the position of its first
+line, so processes sharing the archive agree on every code without a
+lock; each rereads it when it grew before assigning a code or reading
+rows.
+
+    archive = ForecastArchive("forecast-archive")
+    rows = archive.query("id:2643743", start, end)     # structured array
+    frame = archive.frame("id:2643743", start, end)    # pandas DataFrame
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+RECORD = np.dtype([
+    ("fetched_at", "<i8"),
+    ("dt", "<i8"),
+    ("temp", "<f4"),
+    ("humidity", "<f4"),
+    ("pressure", "<f4"),
+    ("wind_speed", "<f4"),
+    ("condition", "u1"),
+])
+
+
+def _slug(key):
+    return "".join(c if c.isalnum() or c in "-." else "_" for c in key)
+
+
+def _day(seconds):
+    return np.datetime64(int(seconds) // SECONDS_PER_DAY, "D").astype(str)
+
+
+class ForecastArchive:
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._vocabulary_path = os.path.join(root, "conditions.txt")
+        self.conditions = []
+        self._codes = {}
+        self._vocabulary_read = 0
+        legacy = os.path.join(root, "conditions.json")
+        if not os.path.exists(self._vocabulary_path) and os.path.exists(legacy):
+            # Archives written before the append-only vocabulary
+            with open(legacy, encoding="utf-8") as f:
+                self._append_names(json.load(f))
+        self._reload_vocabulary()
+        self.appends = 0
+
+    def _append_names(self, names):
+        # One O_APPEND write per batch, so lines from several processes never interleave
+        fd = os.open(self._vocabulary_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, "".join(name + "\n" for name in names).encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def _reload_vocabulary(self):
+        try:
+            if os.path.getsize(self._vocabulary_path) == self._vocabulary_read:
+                return
+            with open(self._vocabulary_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A line still being written has no newline yet and waits for the next reload
+        end = data.rfind(b"\n") + 1
+        for name in data[self._vocabulary_read:end].decode("utf-8").split("\n")[:-1]:
+            if name not in self._codes:
+                self._codes[name] = len(self.conditions)
+                self.conditions.append(name)
+        self._vocabulary_read = end
+
+    def _code(self, name):
+        code = self._codes.get(name)
+        if code is None:
+            self._reload_vocabulary()
+            if name not in self._codes:
+                self._append_names([name])
+                self._reload_vocabulary()
+            code = self._codes[name]
+        if code > 255:
+            raise ValueError(f"too many distinct weather conditions to archive {name!r}")
+        return code
+
+    def _path(self, day, key):
+        return os.path.join(self.root, day, _slug(key) + ".bin")
+
+    def append(self, key, forecast, fetched_at):
+        """Archive one fetch of ``key``; ``forecast`` is a ``backend.Forecast``."""
+        n = len(forecast)
+        if not n:
+            return
+        rows = np.empty(n, dtype=RECORD)
+        rows["fetched_at"] = int(fetched_at)
+        rows["dt"] = np.frombuffer(forecast.dt, dtype=np.int64)
+        for name in ("temp", "humidity", "pressure", "wind_speed"):
+            rows[name] = np.frombuffer(getattr(forecast, name), dtype=np.float32)
+        days = rows["dt"] // SECONDS_PER_DAY
+        with self._lock:
+            rows["condition"] = [self._code(name) for name in forecast.conditions()]
+            for day in np.unique(days):
+                path = self._path(_day(day * SECONDS_PER_DAY), key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "ab") as f:
+                    f.write(rows[days == day].tobytes())
+            self.appends += 1
+
+    def partitions(self, start=None, end=None):
+        """Partition dates (``YYYY-MM-DD``) overlapping ``[start, end]`` epoch seconds."""
+        days = sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+        if start is not None:
+            days = [day for day in days if day >= _day(start)]
+        if end is not None:
+            days = [day for day in days if day <= _day(end)]
+        return days
+
+    def query(self, key, start, end, fetched_after=None):
+        """Rows for ``key`` with slot time in ``[start, end]`` (epoch seconds),
+        optionally only from fetches at or after ``fetched_after``, sorted by
+        slot time and then fetch time."""
+        parts = []
+        for day in self.partitions(start, end):
+            path = self._path(day, key)
+            if not os.path.exists(path) or not os.path.getsize(path):
+                continue
+            rows = np.memmap(path, dtype=RECORD, mode="r")
+            mask = (rows["dt"] >= start) & (rows["dt"] <= end)
+            if fetched_after is not None:
+                mask &= rows["fetched_at"] >= fetched_after
+            parts.append(np.array(rows[mask]))
+        with self._lock:
+            # Rows read above may use codes another process added since
+            self._reload_vocabulary()
+        if not parts:
+            return np.empty(0, dtype=RECORD)
+        rows = np.concatenate(parts)
+        return rows[np.lexsort((rows["fetched_at"], rows["dt"]))]
+
+    def frame(self, key, start, end, fetched_after=None):
+        """``query`` as a DataFrame with datetime ``time``/``fetched`` columns
+        and condition names."""
+        import pandas as pd
+
+        rows = self.query(key, start, end, fetched_after)
+        frame = pd.DataFrame({name: rows[name] for name in RECORD.names if name != "condition"})
+        frame["time"] = pd.to_datetime(frame["dt"], unit="s")
+        frame["fetched"] = pd.to_datetime(frame["fetched_at"], unit="s")
+        frame["condition"] = pd.Categorical.from_codes(rows["condition"].astype(np.int16),
+                                                       categories=list(self.conditions))
+        return frame
+
+    def stats(self):
+        files = size = 0
+        for day in self.partitions():
+            for name in os.listdir(os.path.join(self.root, day)):
+                files += 1
+                size += os.path.getsize(os.path.join(self.root, day, name))
+        return {"partitions": len(self.partitions()), "files": files, "rows": size // RECORD.itemsize,
+                "bytes": size, "appends": self.appends}
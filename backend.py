@@ -1,15 +1,1937 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+import zlib
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
 import requests
-import streamlit as st
+from requests.adapters import HTTPAdapter
+
+try:
+    from orjson import loads as _loads
+except ImportError:
+    _loads = json.loads
+
+import timing
+from geocode import GeoIndex, PlaceNotFound
+
+log = logging.getLogger(__name__)
+
+API_URL = "https://api.openweathermap.org/data/2.5/forecast"
+
+# OpenWeatherMap's 5 day forecast is 40 slots, one every 3 hours
+SLOTS_PER_DAY = 8
+MAX_SLOTS = 40
+FORECAST_CADENCE = 3 * 60 * 60
+
+# The dashboard has shown the API's metric temperatures divided by ten since
+# its first version; every view scales them by this one factor
+TEMPERATURE_SCALE = 0.1
+
+# Priority classes for upstream fetches, most important first
+INTERACTIVE, BACKGROUND, BATCH = 0, 1, 2
+PRIORITY_NAMES = ("interactive", "background", "batch")
+
+
+_conditions = []
+_condition_codes = {}
+_conditions_lock = threading.Lock()
+
+
+def intern_condition(name):
+    """Return the process-wide small-int code of a condition name."""
+    code = _condition_codes.get(name)
+    if code is None:
+        with _conditions_lock:
+            code = _condition_codes.get(name)
+            if code is None:
+                if len(_conditions) == 256:
+                    raise ValueError(f"too many distinct weather conditions to intern {name!r}")
+                code = len(_conditions)
+                _conditions.append(sys.intern(name))
+                _condition_codes[name] = code
+    return code
+
+
+def condition_name(code):
+    return _conditions[code]
+
+
+class ForecastPoint:
+    """One 3-hour forecast slot."""
+
+    __slots__ = ("dt", "temp", "humidity", "pressure", "wind_speed", "condition")
+
+    def __init__(self, dt, temp, humidity, pressure, wind_speed, condition):
+        self.dt = dt
+        self.temp = temp
+        self.humidity = humidity
+        self.pressure = pressure
+        self.wind_speed = wind_speed
+        self.condition = condition
+
+    @property
+    def dt_txt(self):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.dt))
+
+    def __repr__(self):
+        return (f"ForecastPoint(dt={self.dt}, temp={self.temp:.2f}, humidity={self.humidity:g}, "
+                f"pressure={self.pressure:g}, wind_speed={self.wind_speed:.2f}, "
+                f"condition={self.condition!r})")
+
+
+class Forecast:
+    """Struct-of-arrays forecast for one place.
+
+    ``dt`` holds epoch seconds (int64), the measurements are float32 and
+    ``condition`` holds interned condition codes (uint8, see
+    ``intern_condition``), each in a compact ``array.array``. Indexing
+    yields a ``ForecastPoint``, slicing yields another ``Forecast``.
+    Forecasts are shared through the caches and must not be mutated.
+    """
+
+    __slots__ = ("dt", "temp", "humidity", "pressure", "wind_speed", "condition")
+
+    def __init__(self, dt, temp, humidity, pressure, wind_speed, condition):
+        self.dt = dt
+        self.temp = temp
+        self.humidity = humidity
+        self.pressure = pressure
+        self.wind_speed = wind_speed
+        self.condition = condition
+
+    @classmethod
+    def from_records(cls, records):
+        """Build from forecast entries as the API returns them, reading only
+        ``dt``, ``main.temp``/``humidity``/``pressure``, ``wind.speed`` and
+        ``weather[0].main``."""
+        dt, temp, humidity, pressure = array("q"), array("f"), array("f"), array("f")
+        wind_speed, condition = array("f"), array("B")
+        for d in records:
+            main = d.get("main", {})
+            dt.append(d["dt"])
+            temp.append(main["temp"])
+            humidity.append(main.get("humidity", 50))
+            pressure.append(main.get("pressure", 1013))
+            wind_speed.append(d.get("wind", {}).get("speed", 0.0))
+            condition.append(intern_condition(d["weather"][0]["main"]))
+        return cls(dt, temp, humidity, pressure, wind_speed, condition)
+
+    @classmethod
+    def from_response(cls, data):
+        # Unknown places come back without a "list" and raise KeyError here
+        return cls.from_records(data["list"])
+
+    def to_json(self):
+        return {
+            "dt": self.dt.tolist(), "temp": self.temp.tolist(), "humidity": self.humidity.tolist(),
+            "pressure": self.pressure.tolist(), "wind_speed": self.wind_speed.tolist(),
+            "condition": [_conditions[code] for code in self.condition],
+        }
+
+    @classmethod
+    def from_json(cls, obj):
+        if isinstance(obj, list):
+            # Rows written before the columnar format hold the raw entries
+            return cls.from_records(obj)
+        return cls(array("q", obj["dt"]), array("f", obj["temp"]), array("f", obj["humidity"]),
+                   array("f", obj["pressure"]), array("f", obj["wind_speed"]),
+                   array("B", map(intern_condition, obj["condition"])))
+
+    def conditions(self):
+        return [_conditions[code] for code in self.condition]
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in
+                   (self.dt, self.temp, self.humidity, self.pressure, self.wind_speed, self.condition))
+
+    def __len__(self):
+        return len(self.dt)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Forecast(self.dt[index], self.temp[index], self.humidity[index],
+                            self.pressure[index], self.wind_speed[index], self.condition[index])
+        return ForecastPoint(self.dt[index], self.temp[index], self.humidity[index],
+                             self.pressure[index], self.wind_speed[index],
+                             _conditions[self.condition[index]])
+
+    def __iter__(self):
+        for i in range(len(self.dt)):
+            yield self[i]
+
+    def __repr__(self):
+        return f"Forecast({len(self)} slots)"
+
+
+ForecastDiff = namedtuple("ForecastDiff", "added dropped changed unchanged")
+ForecastDiff.__doc__ = """Slot ``dt`` values a newer forecast added, dropped or changed
+relative to an older one; ``unchanged`` is a count."""
+
+
+def diff_forecasts(old, new):
+    """Compare two ``Forecast`` objects slot by slot, matching slots by ``dt``."""
+    old_index = {dt: i for i, dt in enumerate(old.dt)}
+    added, changed = [], []
+    unchanged = 0
+    for j, dt in enumerate(new.dt):
+        i = old_index.pop(dt, None)
+        if i is None:
+            added.append(dt)
+        elif (old.temp[i] != new.temp[j] or old.humidity[i] != new.humidity[j]
+              or old.pressure[i] != new.pressure[j] or old.wind_speed[i] != new.wind_speed[j]
+              or old.condition[i] != new.condition[j]):
+            changed.append(dt)
+        else:
+            unchanged += 1
+    return ForecastDiff(tuple(added), tuple(sorted(old_index)), tuple(changed), unchanged)
+
+
+def normalize_place(place):
+    """Fold case and whitespace so "london", " London " and "LONDON" share a key."""
+    return " ".join(place.split()).casefold()
+
+
+_geo_index = None
+_geo_index_lock = threading.Lock()
+
+
+def get_geo_index():
+    """Return the geocoding index, loading it on first use from the city list
+    named by ``WEATHER_CITY_LIST``; ``None`` when no list is configured."""
+    global _geo_index
+    path = os.environ.get("WEATHER_CITY_LIST")
+    with _geo_index_lock:
+        if _geo_index is None and path:
+            _geo_index = GeoIndex.load(path)
+        return _geo_index
+
+
+def set_geo_index(index):
+    global _geo_index
+    with _geo_index_lock:
+        _geo_index = index
+
+
+_city_grid = None
+
+
+def get_city_grid():
+    """Return the ``spatial.CityGrid`` over the geocoding index's cities for
+    the map view, building it on first use; ``None`` without a city list."""
+    global _city_grid
+    index = get_geo_index()
+    if index is None:
+        return None
+    with _geo_index_lock:
+        if _city_grid is None or _city_grid[0] is not index:
+            from spatial import CityGrid
+
+            _city_grid = (index, CityGrid(index.cities()))
+        return _city_grid[1]
+
+
+def locate(place):
+    """``(lat, lon)`` of ``place``, or ``None`` when it can't be placed without
+    a network call."""
+    coordinates = _coordinates(place)
+    if coordinates is not None:
+        return coordinates
+    index = get_geo_index()
+    if index is None:
+        return None
+    try:
+        city = index.resolve(place)
+    except PlaceNotFound:
+        return None
+    return city.lat, city.lon
+
+
+def _coordinates(place):
+    lat, sep, lon = place.partition(",")
+    if not sep:
+        return None
+    try:
+        lat, lon = float(lat), float(lon)
+    except ValueError:
+        return None
+    if -90 <= lat <= 90 and -180 <= lon <= 180:
+        return lat, lon
+    return None
+
+
+def resolve_place(place):
+    """Return ``(key, query)``: the cache key for ``place`` and the upstream
+    query parameters that fetch it.
+
+    "lat, lon" strings are fetched by coordinates and "id:<city id>", the
+    key itself, by city ID. With a geocoding index loaded, names resolve to
+    canonical city IDs, so spellings of the same city share one key and
+    unknown places raise ``PlaceNotFound`` without a network call. Without
+    one, places go upstream as ``q=``.
+    """
+    if place.startswith("id:") and place[3:].isdigit():
+        return place, {"id": int(place[3:])}
+    coordinates = _coordinates(place)
+    if coordinates is not None:
+        lat, lon = (round(c, 2) for c in coordinates)
+        return f"coord:{lat:.2f},{lon:.2f}", {"lat": lat, "lon": lon}
+    index = get_geo_index()
+    if index is None:
+        return normalize_place(place), {"q": place}
+    city = index.resolve(place)
+    return f"id:{city.id}", {"id": city.id}
+
+
+def suggest_places(text, limit=8):
+    """Type-ahead suggestions for ``text``; empty without a geocoding index."""
+    index = get_geo_index()
+    return index.suggest(text, limit) if index is not None else []
+
+
+class ForecastCache:
+    """Process-wide LRU cache of full forecast lists keyed by ``resolve_place`` key.
+
+    Entries expire after ``ttl`` seconds, or at the next 3-hour forecast
+    boundary when ``align`` is set, whichever comes first. Expired entries
+    stay around until evicted so ``get_stale`` can serve them while a
+    refresh is in flight.
+    """
+
+    def __init__(self, ttl=FORECAST_CADENCE, max_entries=256, align=True, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.align = align
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self._version = 0
+
+    def _expiry(self, now):
+        expires = now + self.ttl
+        if self.align:
+            boundary = (now // FORECAST_CADENCE + 1) * FORECAST_CADENCE
+            expires = min(expires, boundary)
+        return expires
+
+    def get(self, key):
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key, stale=False):
+        """Like ``get`` but without touching LRU order or counters; with
+        ``stale`` expired entries are returned too."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] <= self._clock() and not stale):
+                return None
+            return entry[1]
+
+    def get_stale(self, key):
+        """Return ``(value, fresh, version)``, serving expired entries with
+        ``fresh=False``. ``version`` is read with the value, so it always
+        belongs to it."""
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, False, None
+            self._entries.move_to_end(key)
+            if entry[0] <= now:
+                self.stale_hits += 1
+                return entry[1], False, entry[2]
+            self.hits += 1
+            return entry[1], True, entry[2]
+
+    def put(self, key, value, fetched_at=None):
+        if self.max_entries <= 0:
+            return
+        expires = self._expiry(self._clock() if fetched_at is None else fetched_at)
+        with self._lock:
+            self._version += 1
+            self._entries[key] = (expires, value, self._version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def version(self, key, value=None):
+        """Return a counter that changes every time ``key`` is stored, or None.
+
+        With ``value``, None unless the entry still holds that very object,
+        so a version looked up after the value can't be a newer one's.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (value is not None and entry[1] is not value):
+                return None
+            return entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_hits": self.stale_hits,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+forecast_cache = ForecastCache(
+    ttl=int(os.environ.get("WEATHER_CACHE_TTL", FORECAST_CADENCE)),
+    max_entries=int(os.environ.get("WEATHER_CACHE_SIZE", 256)),
+)
+
+
+def cache_stats():
+    return forecast_cache.stats()
+
+
+class ForecastStore:
+    """SQLite-backed store of fetched forecasts so a restarted process can
+    serve popular places from disk while they are still fresh.
+
+    Every fetch is a row keyed by (place, fetched_at) holding the
+    zlib-compressed forecast JSON. ``compact`` drops rows that have expired
+    or been superseded and then the oldest rows until the database fits in
+    ``max_bytes``. It is scheduled on open and every ``compact_every``
+    saves and runs on a background thread with its own connection, so
+    requests never wait on it. ``timeout`` is how long a statement waits
+    on another connection's lock before failing.
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, compact_every=100, cache=None, timeout=1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compact_every = compact_every
+        self.timeout = timeout
+        self._cache = cache or forecast_cache
+        self._lock = threading.Lock()
+        self._saves = 0
+        self.hits = 0
+        self.misses = 0
+        self._db = self._connect()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS forecasts ("
+            " place TEXT NOT NULL, fetched_at REAL NOT NULL, payload BLOB NOT NULL,"
+            " PRIMARY KEY (place, fetched_at))"
+        )
+        self._compact_lock = threading.Lock()
+        self._compact_db = None
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="forecast-store")
+        self._compaction = None
+        self.schedule_compaction()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, isolation_level=None)
+
+    def load(self, key):
+        """Return ``(forecast, fetched_at)`` for the newest fresh row, or ``(None, None)``."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT payload, fetched_at FROM forecasts WHERE place = ? ORDER BY fetched_at DESC LIMIT 1",
+                (key,)).fetchone()
+        if row is None or self._cache._expiry(row[1]) <= self._cache._clock():
+            self.misses += 1
+            return None, None
+        self.hits += 1
+        return Forecast.from_json(json.loads(zlib.decompress(row[0]))), row[1]
+
+    def save(self, key, forecast, fetched_at):
+        payload = zlib.compress(json.dumps(forecast.to_json(), separators=(",", ":")).encode())
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?)", (key, fetched_at, payload))
+            self._saves += 1
+            due = self._saves % self.compact_every == 0
+        if due:
+            self.schedule_compaction()
+
+    def schedule_compaction(self):
+        """Queue ``compact`` on the background thread unless a run is already
+        queued; returns its Future."""
+        with self._lock:
+            if self._compaction is None or self._compaction.done():
+                self._compaction = self._compactor.submit(self._compact_in_background)
+            return self._compaction
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except sqlite3.Error:
+            log.warning("compacting forecast store %s failed", self.path, exc_info=True)
+
+    @staticmethod
+    def _size(db):
+        page_count = db.execute("PRAGMA page_count").fetchone()[0]
+        page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    def compact(self):
+        # Anything fetched before the oldest still-fresh fetch time has expired
+        oldest_fresh = self._cache._clock() - self._cache.ttl
+        if self._cache.align:
+            oldest_fresh = max(oldest_fresh, self._cache._clock() // FORECAST_CADENCE * FORECAST_CADENCE)
+        with self._compact_lock:
+            if self._compact_db is None:
+                self._compact_db = self._connect()
+            db = self._compact_db
+            db.execute("DELETE FROM forecasts WHERE fetched_at < ?", (oldest_fresh,))
+            db.execute(
+                "DELETE FROM forecasts WHERE fetched_at < "
+                "(SELECT MAX(fetched_at) FROM forecasts AS newer WHERE newer.place = forecasts.place)")
+            while self._size(db) > self.max_bytes:
+                # Drop the oldest tenth of what is left, then reclaim the pages
+                rows = db.execute("SELECT COUNT(*) FROM forecasts").fetchone()[0]
+                if not rows:
+                    break
+                db.execute(
+                    "DELETE FROM forecasts WHERE rowid IN "
+                    "(SELECT rowid FROM forecasts ORDER BY fetched_at LIMIT ?)", (max(1, rows // 10),))
+                db.execute("VACUUM")
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def stats(self):
+        with self._lock:
+            rows = self._db.execute("SELECT COUNT(*) FROM forecasts").fetchone()[0]
+            return {"rows": rows, "bytes": self._size(self._db), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self._compactor.shutdown(wait=True)
+        with self._compact_lock:
+            if self._compact_db is not None:
+                self._compact_db.close()
+        with self._lock:
+            self._db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the on-disk store, opening it on first use when
+    ``WEATHER_STORE_PATH`` is set; ``None`` when persistence is off."""
+    global _store
+    path = os.environ.get("WEATHER_STORE_PATH")
+    with _store_lock:
+        if _store is None and path:
+            _store = ForecastStore(path, max_bytes=int(os.environ.get("WEATHER_STORE_MAX_BYTES", 50 * 1024 * 1024)))
+        return _store
+
+
+def set_store(store):
+    global _store
+    with _store_lock:
+        _store = store
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive():
+    """Return the forecast archive, opening it on first use when
+    ``WEATHER_ARCHIVE_DIR`` is set; ``None`` when archiving is off."""
+    global _archive
+    path = os.environ.get("WEATHER_ARCHIVE_DIR")
+    with _archive_lock:
+        if _archive is None and path:
+            from archive import ForecastArchive
+            _archive = ForecastArchive(path)
+        return _archive
+
+
+def set_archive(archive):
+    global _archive
+    with _archive_lock:
+        _archive = archive
+
+
+class Subscription:
+    """One subscriber's interest in a place: ``updated`` tells whether a
+    refresh was published since ``mark_seen``, and ``event`` is set on
+    every publish for subscribers that would rather block on it."""
+
+    __slots__ = ("key", "place", "seen", "event", "_hub", "__weakref__")
+
+    def __init__(self, hub, key, place):
+        self._hub = hub
+        self.key = key
+        self.place = place
+        self.seen = hub.version(key)
+        self.event = threading.Event()
+
+    def updated(self):
+        return self._hub.version(self.key) != self.seen
+
+    def mark_seen(self):
+        self.event.clear()
+        self.seen = self._hub.version(self.key)
+
+
+class ForecastHub:
+    """In-process publish/subscribe of forecast refreshes, keyed by place key.
+
+    Every fetch that lands in the cache is published, whichever session or
+    background job made it. Subscriptions are held weakly, so one a session
+    drops simply stops counting; checking one for updates is a dictionary
+    lookup and never touches upstream.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._subscribers = {}
+        self.published = 0
+
+    def subscribe(self, key, place=None):
+        subscription = Subscription(self, key, place)
+        with self._lock:
+            self._subscribers.setdefault(key, weakref.WeakSet()).add(subscription)
+        return subscription
+
+    def publish(self, key):
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self.published += 1
+            subscribers = list(self._subscribers.get(key, ()))
+        for subscription in subscribers:
+            subscription.event.set()
+
+    def version(self, key):
+        return self._versions.get(key, 0)
+
+    def places(self):
+        """The place of one live subscription per subscribed key."""
+        places = []
+        with self._lock:
+            for subs in self._subscribers.values():
+                for subscription in list(subs):
+                    if subscription.place is not None:
+                        places.append(subscription.place)
+                        break
+        return places
+
+    def stats(self):
+        with self._lock:
+            counts = [len(subs) for subs in self._subscribers.values()]
+            return {"places": sum(1 for n in counts if n), "subscribers": sum(counts),
+                    "published": self.published}
+
+
+hub = ForecastHub()
+
+
+def subscribe(place):
+    """Subscribe to refreshes of ``place``; ``None`` if it can't be resolved."""
+    try:
+        key, _ = resolve_place(place)
+    except PlaceNotFound:
+        return None
+    return hub.subscribe(key, place)
+
+
+def hub_stats():
+    return hub.stats()
+
+
+_diffs = OrderedDict()
+_diffs_lock = threading.Lock()
+
+
+def _remember(key, forecast):
+    fetched_at = forecast_cache._clock()
+    previous = forecast_cache.peek(key, stale=True)
+    if previous is not None:
+        diff = diff_forecasts(previous, forecast)
+        with _diffs_lock:
+            _diffs[key] = diff
+            _diffs.move_to_end(key)
+            while len(_diffs) > max(forecast_cache.max_entries, 1):
+                _diffs.popitem(last=False)
+    forecast_cache.put(key, forecast, fetched_at)
+    if get_client().persists:
+        _persist(key, forecast, fetched_at)
+    hub.publish(key.partition("#")[0])
+
+
+def _persist(key, forecast, fetched_at):
+    # The forecast is cached by now: a failing disk write must not fail the fetch
+    store = get_store()
+    if store is not None:
+        try:
+            store.save(key, forecast, fetched_at)
+        except sqlite3.Error:
+            log.warning("could not store forecast for %s", key, exc_info=True)
+    archive = get_archive()
+    if archive is not None:
+        try:
+            # Reduced-cnt fetches are archived under the place's own key
+            archive.append(key.partition("#")[0], forecast, fetched_at)
+        except OSError:
+            log.warning("could not archive forecast for %s", key, exc_info=True)
+
+
+def _warm_from_store(key):
+    """Load a still-fresh forecast for ``key`` from disk into the cache."""
+    store = get_store()
+    if store is None:
+        return None
+    try:
+        forecast, fetched_at = store.load(key)
+    except sqlite3.Error:
+        log.warning("could not load forecast for %s from the store", key, exc_info=True)
+        return None
+    if forecast is not None:
+        forecast_cache.put(key, forecast, fetched_at)
+    return forecast
+
+
+def _caching():
+    """Whether anything keeps a fetched forecast beyond the current request."""
+    return forecast_cache.max_entries > 0 or get_store() is not None
+
+
+def _upstream(place, forecast_days=None):
+    """``resolve_place`` plus the slot count to request. The full 5 days are
+    fetched whenever they can be cached for later, longer requests;
+    otherwise only the slots needed (``cnt=``), under their own key."""
+    key, query = resolve_place(place)
+    if forecast_days is not None and not _caching():
+        cnt = SLOTS_PER_DAY * forecast_days
+        key, query = f"{key}#cnt={cnt}", dict(query, cnt=cnt)
+    return key, query
+
+
+def query_key(query):
+    """The cache key of an upstream query, as ``_upstream`` would have built
+    it; lets a forecast service cache queries sent by other processes."""
+    if "id" in query:
+        key = f"id:{int(query['id'])}"
+    elif "lat" in query:
+        key = f"coord:{float(query['lat']):.2f},{float(query['lon']):.2f}"
+    else:
+        key = normalize_place(str(query["q"]))
+    return f"{key}#cnt={int(query['cnt'])}" if "cnt" in query else key
+
+
+def forecast_diff(place):
+    """How the latest refresh of ``place`` differed from the forecast it
+    replaced, as a ``ForecastDiff``; ``None`` before the first refresh."""
+    try:
+        key, _ = resolve_place(place)
+    except PlaceNotFound:
+        return None
+    with _diffs_lock:
+        return _diffs.get(key)
+
+
+def forecast_history(place, start, end):
+    """Archived forecasts of ``place`` for slots between ``start`` and ``end``
+    (epoch seconds) as a DataFrame with one row per (fetch, slot), or
+    ``None`` when archiving is off."""
+    archive = get_archive()
+    if archive is None:
+        return None
+    key, _ = resolve_place(place)
+    return archive.frame(key, start, end)
+
+
+def forecast_version(place):
+    """The cache version of ``place``, which changes whenever a refresh of it
+    lands. Read it before the data it tags: a version read afterwards may
+    already belong to a newer forecast."""
+    try:
+        key, _ = resolve_place(place)
+    except PlaceNotFound:
+        return None
+    return forecast_cache.version(key)
+
+
+_configured_api_key = None
+
+
+def configure(api_key=None):
+    """Set the OpenWeatherMap API key used when a client was not given one."""
+    global _configured_api_key
+    _configured_api_key = api_key
+
+
+def _api_key():
+    # Explicit configuration first, then the environment, then Streamlit
+    # secrets for callers running inside the dashboard without configuring
+    key = _configured_api_key or os.environ.get("OPENWEATHER_API_KEY")
+    if key:
+        return key
+    import streamlit as st
+    return st.secrets["openweather"]["api_key"]
+
+
+def fixture_name(query):
+    """File name a response to ``query`` is recorded under, e.g.
+    ``id=2643743.json`` or ``q=new_york.json``. ``cnt`` is left out, as a
+    full recording serves any slot count."""
+    parts = []
+    for name, value in sorted(query.items()):
+        if name in ("cnt", "units", "appid"):
+            continue
+        if name == "q":
+            value = "".join(c if c.isalnum() else "_" for c in normalize_place(str(value)))
+        parts.append(f"{name}={value}")
+    return "_".join(parts) + ".json"
+
+
+class ForecastSource:
+    """Where forecasts come from. ``get_client`` returns the process-wide
+    source: the live ``WeatherClient``, a ``ReplaySource`` with
+    ``WEATHER_REPLAY_DIR`` set, or a ``ServiceSource`` with
+    ``WEATHER_SERVICE_URL`` set. Subclasses implement ``forecast`` and
+    append each request's duration to ``latencies``. ``priority`` is the
+    quota class of a fetch; ``admit`` takes it from this process's quota
+    before a fetch, except for sources that leave the quota to the service
+    behind them. ``persists`` tells whether this process writes what the
+    source returns to its store and archive.
+    """
+
+    persists = True
+
+    def __init__(self):
+        self.latencies = deque(maxlen=1000)
+        self.retries = 0
+
+    def admit(self, priority=INTERACTIVE):
+        quota.acquire(priority)
+
+    def forecast(self, place=None, priority=INTERACTIVE, **query):
+        raise NotImplementedError
+
+    def forecast_many(self, queries, concurrency=10, rate_per_host=20.0, priority=INTERACTIVE):
+        """Fetch ``{label: query}`` concurrently; returns ``(results, errors)``."""
+        results, errors = {}, {}
+
+        def run_one(label):
+            try:
+                results[label] = self.forecast(priority=priority, **queries[label])
+            except Exception as e:
+                errors[label] = e
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            list(pool.map(run_one, queries))
+        return results, errors
+
+    def latency_stats(self):
+        samples = sorted(self.latencies)
+        if not samples:
+            return {"requests": 0, "retries": self.retries, "p50_ms": 0.0, "p95_ms": 0.0}
+        return {
+            "requests": len(samples),
+            "retries": self.retries,
+            "p50_ms": samples[len(samples) // 2] * 1000,
+            "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        }
+
+    def close(self):
+        pass
+
+
+class WeatherClient(ForecastSource):
+    """OpenWeatherMap client holding a pooled keep-alive session.
+
+    Requests use strict (connect, read) timeouts and are retried with
+    exponential backoff on connection errors, 429 and 5xx responses,
+    honoring ``Retry-After`` when the server sends one. Every retry is an
+    upstream call too and takes another one from the quota of the fetch's
+    priority; when the quota sheds it, the fetch fails with
+    ``QuotaExceeded``. Pass ``base_url``
+    to point the client at a local stub server, and ``record_dir`` to save
+    every successful response there as a ``ReplaySource`` fixture.
+    """
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(self, api_key=None, base_url=API_URL, pool_size=10,
+                 connect_timeout=3.05, read_timeout=10.0, max_retries=3,
+                 backoff=0.5, max_backoff=30.0, sleep=time.sleep, record_dir=None):
+        super().__init__()
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._sleep = sleep
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.record_dir = record_dir
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+
+    def _retry_delay(self, attempt, response=None):
+        delay = self.backoff * 2 ** attempt
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+        return min(max(delay, 0.0), self.max_backoff)
+
+    def get(self, params, priority=INTERACTIVE):
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            if attempt:
+                self.admit(priority)
+            start = time.perf_counter()
+            try:
+                response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                self.latencies.append(time.perf_counter() - start)
+                if last_attempt:
+                    raise
+                delay = self._retry_delay(attempt)
+            else:
+                self.latencies.append(time.perf_counter() - start)
+                if response.status_code not in self.RETRY_STATUSES or last_attempt:
+                    return response
+                delay = self._retry_delay(attempt, response)
+                response.close()
+            self.retries += 1
+            self._sleep(delay)
+
+    def forecast(self, place=None, priority=INTERACTIVE, **query):
+        """Fetch the forecast list for ``place`` (sent as ``q=``) or for
+        explicit query parameters such as ``id=`` or ``lat=``/``lon=``."""
+        query = {"q": place} if place is not None else dict(query)
+        params = dict(query, units="metric", appid=self.api_key or _api_key())
+        with timing.stage("upstream.http"):
+            response = self.get(params, priority)
+        with timing.stage("upstream.decode"):
+            forecast = Forecast.from_response(_loads(response.content))
+        self.record(query, response.content)
+        return forecast
+
+    def forecast_many(self, queries, concurrency=10, rate_per_host=20.0, priority=INTERACTIVE):
+        return asyncio.run(fetch_many(queries, concurrency=concurrency, rate_per_host=rate_per_host,
+                                      client=self, priority=priority))
+
+    def record(self, query, body):
+        if self.record_dir:
+            with open(os.path.join(self.record_dir, fixture_name(query)), "wb") as f:
+                f.write(body)
+
+    def close(self):
+        self.session.close()
+
+
+class ReplaySource(ForecastSource):
+    """Serves recorded OpenWeatherMap responses from ``directory`` instead
+    of the network, for benchmarks and regression runs.
+
+    Fixtures are raw response bodies named by ``fixture_name``; record them
+    with ``WeatherClient(record_dir=...)`` or ``WEATHER_RECORD_DIR``. A
+    query without a fixture fails with KeyError, like an unknown place
+    upstream. ``latency`` (seconds, or a ``(low, high)`` range) is slept
+    before every answer and ``error_rate`` of the requests fail with a
+    ConnectionError; both draw from a generator seeded with ``seed``, so a
+    run with the same requests in the same order is repeatable.
+    """
+
+    def __init__(self, directory, latency=0.0, error_rate=0.0, seed=0, sleep=time.sleep):
+        super().__init__()
+        self.directory = directory
+        self.latency = latency if isinstance(latency, tuple) else (latency, latency)
+        self.error_rate = error_rate
+        self._sleep = sleep
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._fixtures = {}
+        self.errors = 0
+
+    def _fixture(self, name):
+        with self._lock:
+            forecast = self._fixtures.get(name)
+        if forecast is None:
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path):
+                raise KeyError(f"no replay fixture {name}")
+            with open(path, "rb") as f:
+                forecast = Forecast.from_response(_loads(f.read()))
+            with self._lock:
+                self._fixtures[name] = forecast
+        return forecast
+
+    def forecast(self, place=None, priority=INTERACTIVE, **query):
+        query = {"q": place} if place is not None else dict(query)
+        start = time.perf_counter()
+        with self._lock:
+            delay = self._random.uniform(*self.latency)
+            fail = self._random.random() < self.error_rate
+        with timing.stage("upstream.http"):
+            self._sleep(delay)
+        self.latencies.append(time.perf_counter() - start)
+        if fail:
+            self.errors += 1
+            raise requests.ConnectionError("injected replay failure")
+        forecast = self._fixture(fixture_name(query))
+        return forecast[:query["cnt"]] if "cnt" in query else forecast
+
+
+class ServiceError(RuntimeError):
+    """A fetch failed inside the forecast service with an error this process
+    can't rebuild, such as a connection error upstream."""
+
+
+def encode_error(error):
+    """JSON form of a fetch error, for ``decode_error`` in another process."""
+    obj = {"type": type(error).__name__, "message": error.args[0] if error.args else str(error)}
+    if isinstance(error, QuotaExceeded):
+        obj.update(priority=error.priority, retry_after=error.retry_after)
+    return obj
+
+
+def decode_error(obj):
+    if obj["type"] == "QuotaExceeded":
+        return QuotaExceeded(obj["priority"], obj["retry_after"])
+    if obj["type"] == "KeyError":
+        return KeyError(obj["message"])
+    return ServiceError(f"{obj['type']}: {obj['message']}")
+
+
+class ServiceSource(ForecastSource):
+    """Fetches through a ``forecast_service`` at ``url`` that owns the cache,
+    upstream connection pool, coalescing and quota for every dashboard
+    process on the host.
+
+    Each request names this process as ``worker`` so the service can report
+    hits and upstream calls per process. Quota is taken by the service, so
+    ``admit`` is a no-op here. The service is also the only writer of the
+    store and archive, so nothing fetched through this source is persisted
+    by this process, not even fetches that went to ``direct`` under this
+    process's own quota while the service couldn't be reached; the service
+    is tried again after ``retry_interval`` seconds.
+    """
+
+    persists = False
+
+    def __init__(self, url, direct, worker=None, connect_timeout=0.5, read_timeout=30.0,
+                 retry_interval=10.0):
+        super().__init__()
+        self.url = url.rstrip("/")
+        self.direct = direct
+        self.worker = worker or f"pid {os.getpid()}"
+        self.timeout = (connect_timeout, read_timeout)
+        self.retry_interval = retry_interval
+        self.session = requests.Session()
+        self.fallbacks = 0
+        self._down_until = 0.0
+
+    def admit(self, priority=INTERACTIVE):
+        pass
+
+    def _call(self, queries, priority):
+        """POST ``{label: query}`` to the service; ``None`` while it is down."""
+        if time.monotonic() < self._down_until:
+            return None
+        body = json.dumps({"worker": self.worker, "priority": priority, "queries": queries},
+                          separators=(",", ":"))
+        start = time.perf_counter()
+        try:
+            with timing.stage("service.http"):
+                response = self.session.post(f"{self.url}/fetch", data=body, timeout=self.timeout,
+                                             headers={"Content-Type": "application/json"})
+                response.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError):
+            self._down_until = time.monotonic() + self.retry_interval
+            return None
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+        with timing.stage("service.decode"):
+            data = _loads(response.content)
+            return ({label: Forecast.from_json(obj) for label, obj in data["results"].items()},
+                    {label: decode_error(obj) for label, obj in data["errors"].items()})
+
+    def forecast(self, place=None, priority=INTERACTIVE, **query):
+        query = {"q": place} if place is not None else dict(query)
+        answer = self._call({"q": query}, priority)
+        if answer is None:
+            self.fallbacks += 1
+            self.direct.admit(priority)
+            return self.direct.forecast(priority=priority, **query)
+        results, errors = answer
+        if "q" in errors:
+            raise errors["q"]
+        return results["q"]
+
+    def forecast_many(self, queries, concurrency=10, rate_per_host=20.0, priority=INTERACTIVE):
+        answer = self._call(queries, priority) if queries else ({}, {})
+        if answer is not None:
+            return answer
+        self.fallbacks += 1
+        admitted, shed = {}, {}
+        for label, query in queries.items():
+            try:
+                self.direct.admit(priority)
+                admitted[label] = query
+            except QuotaExceeded as e:
+                shed[label] = e
+        results, errors = self.direct.forecast_many(admitted, concurrency=concurrency,
+                                                    rate_per_host=rate_per_host, priority=priority)
+        errors.update(shed)
+        return results, errors
+
+    def service_stats(self):
+        """The service's per-worker and total counters, or ``None`` while it
+        can't be reached."""
+        if time.monotonic() < self._down_until:
+            return None
+        try:
+            response = self.session.get(f"{self.url}/stats", timeout=self.timeout)
+            response.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError):
+            self._down_until = time.monotonic() + self.retry_interval
+            return None
+        return _loads(response.content)
+
+    def close(self):
+        self.session.close()
+        self.direct.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _parse_latency(value):
+    low, _, high = value.partition("-")
+    return (float(low), float(high or low))
+
+
+def get_client():
+    """Return the process-wide forecast source, creating it on first use:
+    a ``ReplaySource`` over ``WEATHER_REPLAY_DIR`` when that is set (with
+    ``WEATHER_REPLAY_LATENCY`` such as ``0.05`` or ``0.02-0.2`` seconds and
+    ``WEATHER_REPLAY_ERROR_RATE``), otherwise the live ``WeatherClient``.
+    With ``WEATHER_SERVICE_URL`` set, that source is only the fallback of a
+    ``ServiceSource`` fetching through the forecast service there."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            replay_dir = os.environ.get("WEATHER_REPLAY_DIR")
+            if replay_dir:
+                _client = ReplaySource(
+                    replay_dir,
+                    latency=_parse_latency(os.environ.get("WEATHER_REPLAY_LATENCY", "0")),
+                    error_rate=float(os.environ.get("WEATHER_REPLAY_ERROR_RATE", 0)),
+                    seed=int(os.environ.get("WEATHER_REPLAY_SEED", 0)))
+            else:
+                _client = WeatherClient(pool_size=int(os.environ.get("WEATHER_POOL_SIZE", 10)),
+                                        record_dir=os.environ.get("WEATHER_RECORD_DIR"))
+            service_url = os.environ.get("WEATHER_SERVICE_URL")
+            if service_url:
+                _client = ServiceSource(service_url, _client)
+        return _client
+
+
+def set_client(client):
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def fetch_forecast(place=None, priority=INTERACTIVE, **query):
+    return get_client().forecast(place, priority=priority, **query)
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight block until it finishes and get its result or exception.
+    Calls carry a priority class (lower is more urgent, as in the quota):
+    a caller only waits on a call of its own class or a more urgent one and
+    otherwise runs its own, which later callers then share. ``admit`` runs
+    before a call is registered, so nobody ever waits on a call that is
+    still queued for the upstream quota.
+    """
+
+    class _Call:
+        __slots__ = ("done", "result", "error", "priority")
+
+        def __init__(self, priority):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.priority = priority
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def _joinable(self, key, priority):
+        call = self._calls.get(key)
+        return call if call is not None and call.priority <= priority else None
+
+    def _finish(self, led, results, errors):
+        with self._lock:
+            for key, call in led.items():
+                # A more urgent call may have taken the key over meanwhile
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+        for key, call in led.items():
+            if call.error is None:
+                if key in results:
+                    call.result = results[key]
+                else:
+                    call.error = errors.setdefault(key, KeyError(key))
+            call.done.set()
+
+    def do(self, key, fn, priority=INTERACTIVE, admit=None):
+        with self._lock:
+            self.calls += 1
+            call = self._joinable(key, priority)
+        if call is None and admit is not None:
+            admit()
+        with self._lock:
+            call = call or self._joinable(key, priority)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call(priority)
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        results, errors = {}, {}
+        try:
+            results[key] = fn()
+            return results[key]
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish({key: call}, results, errors)
+
+    def do_many(self, keys, fn, priority=INTERACTIVE, admit=None):
+        """Batch ``do``. ``admit`` is given the keys no running call serves
+        and returns ``(admitted, errors)``; ``fn`` is then called once with
+        the admitted keys and returns ``(results, errors)`` dicts for them.
+        Returns ``(results, errors)`` for every key in ``keys``."""
+        followed = {}
+        with self._lock:
+            self.calls += len(keys)
+            for key in keys:
+                call = self._joinable(key, priority)
+                if call is not None:
+                    followed[key] = call
+        rest = [key for key in keys if key not in followed]
+        admitted, errors = admit(rest) if admit is not None and rest else (rest, {})
+        errors = dict(errors)
+        led = {}
+        with self._lock:
+            for key in admitted:
+                call = self._joinable(key, priority)
+                if call is not None:
+                    followed[key] = call
+                else:
+                    led[key] = self._calls[key] = self._Call(priority)
+            self.executions += len(led)
+            self.coalesced += len(followed)
+        results = {}
+        try:
+            if led:
+                results, fetch_errors = fn(list(led))
+                errors.update(fetch_errors)
+        except BaseException as e:
+            for call in led.values():
+                call.error = e
+            raise
+        finally:
+            self._finish(led, results, errors)
+        for key, call in followed.items():
+            call.done.wait()
+            if call.error is not None:
+                errors[key] = call.error
+            else:
+                results[key] = call.result
+        return results, errors
+
+    def stats(self):
+        with self._lock:
+            return {"calls": self.calls, "upstream": self.executions, "coalesced": self.coalesced,
+                    "in_flight": len(self._calls)}
+
+
+_flights = SingleFlight()
+
+
+def coalescing_stats():
+    return _flights.stats()
+
+
+# OpenWeatherMap free plan: 60 calls a minute and 1,000,000 a month
+QUOTA_PER_MINUTE = 60
+QUOTA_PER_DAY = 1_000_000 // 31
+
+
+class QuotaExceeded(RuntimeError):
+    """An upstream fetch was shed because the call budget had no room for it."""
+
+    def __init__(self, priority, retry_after):
+        super().__init__(f"upstream quota exhausted for {PRIORITY_NAMES[priority]} fetches, "
+                         f"retry in {retry_after:.0f}s")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """``capacity`` tokens, refilled continuously over ``period`` seconds."""
+
+    def __init__(self, capacity, period, now):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self._updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, reserve, now):
+        """Seconds until a token can be taken without dipping into the
+        ``reserve`` fraction of capacity."""
+        self.refill(now)
+        missing = reserve * self.capacity + 1 - self.tokens
+        return max(missing, 0.0) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class QuotaGovernor:
+    """Token buckets for the per-minute and per-day upstream call limits,
+    shared by every fetch in the process.
+
+    Each priority class may draw the buckets down only to its reserve, a
+    fraction of their capacity, which leaves headroom for interactive
+    fetches whatever background and batch work is running. A fetch without
+    a token waits up to its class's ``max_wait`` if the budget refills in
+    time, holding back lower classes while it waits, and is otherwise shed
+    with ``QuotaExceeded``. A limit of ``None`` or 0 is not enforced.
+    """
+
+    # priority: (reserve, max_wait seconds)
+    POLICIES = {INTERACTIVE: (0.0, 5.0), BACKGROUND: (0.2, 0.0), BATCH: (0.5, 60.0)}
+
+    def __init__(self, per_minute=QUOTA_PER_MINUTE, per_day=QUOTA_PER_DAY, policies=None,
+                 clock=time.monotonic):
+        self.per_minute = per_minute or None
+        self.per_day = per_day or None
+        self.policies = {**self.POLICIES, **(policies or {})}
+        self._clock = clock
+        now = clock()
+        self._minute = TokenBucket(per_minute, 60, now) if self.per_minute else None
+        self._day = TokenBucket(per_day, 24 * 60 * 60, now) if self.per_day else None
+        self._cond = threading.Condition()
+        self._waiting = [0] * len(PRIORITY_NAMES)
+        self.admitted = [0] * len(PRIORITY_NAMES)
+        self.queued = [0] * len(PRIORITY_NAMES)
+        self.shed = [0] * len(PRIORITY_NAMES)
+        self.stale = [0] * len(PRIORITY_NAMES)
+
+    def _buckets(self):
+        return [bucket for bucket in (self._minute, self._day) if bucket is not None]
+
+    def acquire(self, priority=INTERACTIVE):
+        """Take one call from the budget, waiting or raising ``QuotaExceeded``
+        according to the policy of ``priority``."""
+        reserve, max_wait = self.policies[priority]
+        with self._cond:
+            deadline = self._clock() + max_wait
+            queued = False
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = self._clock()
+                    wait = max((bucket.wait_time(reserve, now) for bucket in self._buckets()), default=0.0)
+                    ahead = any(self._waiting[:priority])
+                    if not wait and not ahead:
+                        for bucket in self._buckets():
+                            bucket.take()
+                        self.admitted[priority] += 1
+                        self.queued[priority] += queued
+                        return
+                    if now + wait > deadline or now >= deadline:
+                        self.shed[priority] += 1
+                        raise QuotaExceeded(priority, max(wait, deadline - now))
+                    queued = True
+                    self._cond.wait(wait or deadline - now)
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def served_stale(self, priority):
+        with self._cond:
+            self.stale[priority] += 1
+
+    def stats(self):
+        with self._cond:
+            now = self._clock()
+            for bucket in self._buckets():
+                bucket.refill(now)
+            return {
+                "per_minute": self.per_minute,
+                "minute": self._minute.tokens if self._minute else None,
+                "per_day": self.per_day,
+                "day": self._day.tokens if self._day else None,
+                "classes": {name: {"admitted": self.admitted[p], "queued": self.queued[p],
+                                   "shed": self.shed[p], "stale": self.stale[p], "waiting": self._waiting[p]}
+                            for p, name in enumerate(PRIORITY_NAMES)},
+            }
+
+
+quota = QuotaGovernor(
+    per_minute=int(os.environ.get("WEATHER_QUOTA_PER_MINUTE", QUOTA_PER_MINUTE)),
+    per_day=int(os.environ.get("WEATHER_QUOTA_PER_DAY", QUOTA_PER_DAY)),
+)
+
+
+def quota_stats():
+    return quota.stats()
+
+
+def _fetch_shared(key, query, priority=INTERACTIVE):
+    """Fetch ``query`` upstream, sharing one in-flight request per key.
+
+    The fetch takes a call from the quota budget of ``priority`` before it
+    is shared, and only joins requests of its own class or a more urgent
+    one (see ``SingleFlight``). When the quota sheds it, here or in a shared
+    request, interactive and batch fetches fall back to the expired cache
+    entry if there is one; background refreshes, which exist to replace
+    it, fail.
+    """
+    client = get_client()
+
+    def admit():
+        with timing.stage("quota.wait"):
+            client.admit(priority)
+
+    def fetch():
+        # A flight for this key may have landed between our cache miss and now
+        forecast = forecast_cache.peek(key)
+        if forecast is None:
+            forecast = client.forecast(priority=priority, **query)
+            _remember(key, forecast)
+        return forecast
+
+    try:
+        forecast = forecast_cache.peek(key)
+        return forecast if forecast is not None else _flights.do(key, fetch, priority, admit)
+    except QuotaExceeded:
+        forecast = forecast_cache.peek(key, stale=True) if priority != BACKGROUND else None
+        if forecast is None:
+            raise
+        quota.served_stale(priority)
+        return forecast
+
+
+def _slice(forecast, forecast_days):
+    if forecast_days is None:
+        return forecast
+    nr_values = SLOTS_PER_DAY * forecast_days
+    return forecast[:nr_values]
+
+
+@timing.timed("frame.build")
+def forecast_frame(forecast, city=None):
+    """Build the typed, columnar frame every dashboard view reads from.
+
+    The ``Forecast`` arrays become int64 epoch seconds, float32 measurement
+    columns and a categorical condition column whose categories are sorted,
+    so its codes can feed ``metrics`` directly. ``forecast`` may also be a
+    ``{city: forecast}`` mapping, which yields one long frame with a
+    categorical ``city`` column instead of one frame per city. Lists of raw
+    API entries are accepted too.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(forecast, dict):
+        batches = list(forecast.items())
+    else:
+        batches = [(city, forecast)]
+    forecasts = [f if isinstance(f, Forecast) else Forecast.from_records(f) for _, f in batches]
+
+    def column(name, dtype):
+        parts = [np.frombuffer(getattr(f, name), dtype=dtype) for f in forecasts]
+        if len(parts) == 1:
+            return parts[0].copy()
+        # An empty mapping still gets typed, zero-length columns
+        return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+    dt = column("dt", np.int64)
+    condition = column("condition", np.uint8)
+    # Renumber the interned codes alphabetically so frame codes are stable across forecasts
+    used = np.flatnonzero(np.bincount(condition, minlength=1))
+    categories = sorted(condition_name(code) for code in used)
+    remap = np.zeros(max(len(_conditions), 1), dtype=np.int8)
+    remap[[intern_condition(c) for c in categories]] = np.arange(len(categories), dtype=np.int8)
+    columns = {
+        "dt": dt,
+        "time": dt.astype("datetime64[s]").astype("datetime64[ns]"),
+        "temp": column("temp", np.float32),
+        "humidity": column("humidity", np.float32),
+        "pressure": column("pressure", np.float32),
+        "wind_speed": column("wind_speed", np.float32),
+        "condition": pd.Categorical.from_codes(remap[condition], categories=categories),
+    }
+    if isinstance(forecast, dict):
+        sizes = [len(f) for f in forecasts]
+        columns["city"] = pd.Categorical.from_codes(np.repeat(np.arange(len(batches), dtype=np.int32), sizes),
+                                                    categories=[c for c, _ in batches])
+    return pd.DataFrame(columns, copy=False)
+
+
+class PlaceTraffic:
+    """Request counts per place that decay with a half-life of one forecast
+    cycle, so ``top`` reflects recent traffic rather than all-time totals."""
+
+    def __init__(self, half_life=FORECAST_CADENCE, max_places=1000, clock=time.time):
+        self.half_life = half_life
+        self.max_places = max_places
+        self._clock = clock
+        self._scores = {}
+        self._lock = threading.Lock()
+
+    def _decayed(self, entry, now):
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.half_life)
+
+    def record(self, key, place):
+        now = self._clock()
+        with self._lock:
+            entry = self._scores.get(key)
+            score = self._decayed(entry, now) + 1 if entry is not None else 1.0
+            self._scores[key] = (score, now, place)
+            if len(self._scores) > 2 * self.max_places:
+                keep = sorted(self._scores.items(), key=lambda item: self._decayed(item[1], now),
+                              reverse=True)[:self.max_places]
+                self._scores = dict(keep)
+
+    def top(self, n):
+        now = self._clock()
+        with self._lock:
+            ranked = sorted(self._scores.values(), key=lambda entry: self._decayed(entry, now), reverse=True)
+        return [entry[2] for entry in ranked[:n]]
+
+
+place_traffic = PlaceTraffic()
+
 
 def get_data(place, forecast_days=None):
-    API_KEY = st.secrets["openweather"]["api_key"]
-    url = f"https://api.openweathermap.org/data/2.5/forecast?q={place}&units=metric&appid={API_KEY}"
-    response = requests.get(url)
-    data = response.json()
-    filtered_data = data["list"]
-    nr_values = 8 * forecast_days
-    filtered_data = filtered_data[:nr_values]
-    return filtered_data
+    key, query = _upstream(place, forecast_days)
+    forecast = forecast_cache.get(key)
+    if forecast is None:
+        forecast = _warm_from_store(key)
+    if forecast is None:
+        forecast = _fetch_shared(key, query)
+    # Only places that turned out to exist count toward the popular ones
+    place_traffic.record(key, place)
+    return _slice(forecast, forecast_days)
+
+
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("WEATHER_FETCH_WORKERS", 4)),
+                               thread_name_prefix="forecast-fetch")
+_refreshing = {}
+_refreshing_lock = threading.Lock()
+
+
+def _refresh(key, query, priority):
+    try:
+        forecast = _fetch_shared(key, query, priority)
+        return forecast, forecast_cache.version(key, forecast)
+    finally:
+        with _refreshing_lock:
+            _refreshing.pop(key, None)
+
+
+def refresh_in_background(place, forecast_days=None, priority=BACKGROUND):
+    """Schedule a fetch of ``place`` on the fetch executor and return its
+    Future, which resolves to ``(forecast, version)``.
+
+    Only one refresh per place is in flight at a time; later callers get the
+    Future of the refresh already running. ``forecast_days`` lets the fetch
+    ask for fewer slots when nothing would cache the rest; ``priority`` is
+    its quota class.
+    """
+    key, query = _upstream(place, forecast_days)
+    with _refreshing_lock:
+        future = _refreshing.get(key)
+        if future is None:
+            future = _executor.submit(_refresh, key, query, priority)
+            _refreshing[key] = future
+    return future
+
+
+def get_data_nowait(place, forecast_days=None, stale_while_revalidate=True, track=True):
+    """Non-blocking ``get_data``.
+
+    Returns ``(data, version, pending)``. ``data`` is the cached forecast,
+    or ``None`` when nothing usable is cached, and ``version`` its cache
+    version (see ``forecast_version``); ``pending`` is the Future of a
+    background refresh, or ``None`` when the cached data is fresh. With
+    ``stale_while_revalidate`` an expired forecast is returned as ``data``
+    while it is refreshed. Resolve ``pending`` with ``get_data_result``.
+
+    With ``track`` the request counts toward ``place_traffic`` once it has
+    a forecast, so places that fail to fetch never become prefetch targets.
+    Callers that rerun for the same request, such as a page redrawn on a
+    widget change, pass ``track=False`` after the first time.
+    """
+    key, _ = resolve_place(place)
+    forecast, fresh, version = forecast_cache.get_stale(key)
+    if not fresh:
+        warm = _warm_from_store(key)
+        if warm is not None:
+            forecast, fresh, version = warm, True, forecast_cache.version(key, warm)
+    if track and forecast is not None:
+        place_traffic.record(key, place)
+    if forecast is not None and fresh:
+        return _slice(forecast, forecast_days), version, None
+    # Someone is waiting on this refresh unless the stale copy is shown meanwhile
+    serving_stale = forecast is not None and stale_while_revalidate
+    pending = refresh_in_background(place, forecast_days, BACKGROUND if serving_stale else INTERACTIVE)
+    if track and forecast is None:
+        def record(done):
+            if not done.cancelled() and done.exception() is None:
+                place_traffic.record(key, place)
+        pending.add_done_callback(record)
+    if serving_stale:
+        return _slice(forecast, forecast_days), version, pending
+    return None, None, pending
+
+
+def get_data_result(pending, forecast_days=None, timeout=None):
+    """``(data, version)`` of a refresh ``get_data_nowait`` started."""
+    forecast, version = pending.result(timeout)
+    return _slice(forecast, forecast_days), version
+
+
+class PrefetchScheduler:
+    """Background thread that keeps pinned places, the ``top_n`` most
+    requested ones and every place a session subscribed to on the hub fresh
+    in the forecast cache.
+
+    It warms every target on start, then runs once per forecast cycle,
+    ``delay`` seconds after each 3-hour boundary to give the upstream model
+    update time to land. Refreshes within a run are spread over ``spread``
+    seconds with some jitter rather than fired as one burst, and places
+    something else already refreshed this cycle, in the cache or the store,
+    are skipped.
+    """
+
+    def __init__(self, places=(), top_n=10, delay=600, spread=900, traffic=None, clock=time.time):
+        self.places = list(places)
+        self.top_n = top_n
+        self.delay = delay
+        self.spread = spread
+        self._traffic = traffic or place_traffic
+        self._clock = clock
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.refreshed = 0
+        self.skipped = 0
+        self.shed = 0
+        self.errors = 0
+        self.next_run = None
+
+    def targets(self):
+        targets = {}
+        # Places open on some screen stay fresh with one fetch per cycle, however many screens
+        for place in self.places + self._traffic.top(self.top_n) + hub.places():
+            try:
+                key, query = resolve_place(place)
+            except PlaceNotFound:
+                continue
+            targets.setdefault(key, query)
+        return targets
+
+    def seconds_until_next_run(self):
+        now = self._clock()
+        cycle_start = (now - self.delay) // FORECAST_CADENCE * FORECAST_CADENCE
+        self.next_run = cycle_start + FORECAST_CADENCE + self.delay
+        return self.next_run - now
+
+    def run_once(self, spread=None):
+        targets = self.targets()
+        spread = self.spread if spread is None else spread
+        gap = spread / len(targets) if targets else 0
+        for key, query in targets.items():
+            if self._stop.is_set():
+                break
+            # After a restart the store usually still holds this cycle's forecast
+            if forecast_cache.peek(key) is not None or _warm_from_store(key) is not None:
+                self.skipped += 1
+                continue
+            try:
+                _fetch_shared(key, query, BACKGROUND)
+                self.refreshed += 1
+            except QuotaExceeded:
+                self.shed += 1
+            except Exception:
+                self.errors += 1
+            self._stop.wait(gap * random.uniform(0.75, 1.25))
+        self.runs += 1
+
+    def _run(self):
+        # Warm quickly on start; later runs are paced over the full spread
+        self.run_once(spread=min(self.spread, len(self.places)))
+        while not self._stop.wait(self.seconds_until_next_run()):
+            self.run_once()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="forecast-prefetch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {"targets": len(self.targets()), "runs": self.runs, "refreshed": self.refreshed,
+                "skipped": self.skipped, "shed": self.shed, "errors": self.errors, "next_run": self.next_run}
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def start_prefetcher(places, **kwargs):
+    """Start the process-wide prefetcher once; later calls add new pinned
+    places to it. Returns ``None`` when ``WEATHER_PREFETCH=0``."""
+    global _prefetcher
+    if os.environ.get("WEATHER_PREFETCH", "1") == "0":
+        return None
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = PrefetchScheduler(places, **kwargs).start()
+        else:
+            _prefetcher.places.extend(p for p in places if p not in _prefetcher.places)
+        return _prefetcher
+
+
+class RateLimiter:
+    """Spaces out request starts so at most ``rate`` begin per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def fetch_many(places, concurrency=10, rate_per_host=20.0, client=None, priority=INTERACTIVE):
+    """Fetch full forecasts for ``places`` concurrently.
+
+    ``places`` is a list of place names (sent as ``q=``) or a ``{label:
+    query}`` mapping of upstream query parameters. Returns ``(results,
+    errors)`` dicts keyed by the names or labels passed in; a failing place
+    lands in ``errors`` without affecting the others. First attempts are
+    expected to be admitted by the caller; retries take their call from the
+    quota of ``priority`` here.
+    """
+    import aiohttp
+
+    client = client or get_client()
+    api_key = client.api_key or _api_key()
+    semaphore = asyncio.Semaphore(concurrency)
+    limiters = {}
+    results, errors = {}, {}
+    timeout = aiohttp.ClientTimeout(sock_connect=client.timeout[0], sock_read=client.timeout[1])
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    queries = places if isinstance(places, dict) else {place: {"q": place} for place in places}
+
+    async def fetch_one(session, place):
+        params = dict(queries[place], units="metric", appid=api_key)
+        limiter = limiters.setdefault(urlsplit(client.base_url).netloc, RateLimiter(rate_per_host))
+        for attempt in range(client.max_retries + 1):
+            if attempt:
+                # The governor may wait on its condition, so keep it off the event loop
+                await asyncio.to_thread(client.admit, priority)
+            await limiter.wait()
+            start = time.perf_counter()
+            try:
+                async with session.get(client.base_url, params=params) as response:
+                    if response.status in client.RETRY_STATUSES and attempt < client.max_retries:
+                        delay = client._retry_delay(attempt, response)
+                    else:
+                        body = await response.read()
+                        data = _loads(body)
+                        if "list" not in data:
+                            raise KeyError(data.get("message", place))
+                        forecast = Forecast.from_response(data)
+                        client.record(queries[place], body)
+                        return forecast
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == client.max_retries:
+                    raise
+                delay = client._retry_delay(attempt)
+            finally:
+                client.latencies.append(time.perf_counter() - start)
+            client.retries += 1
+            await asyncio.sleep(delay)
+
+    async def run_one(session, place):
+        try:
+            async with semaphore:
+                results[place] = await fetch_one(session, place)
+        except Exception as e:
+            errors[place] = e
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector,
+                                     headers={"Accept-Encoding": "gzip, deflate"}) as session:
+        await asyncio.gather(*(run_one(session, place) for place in queries))
+    return results, errors
+
+
+def fetch_queries(queries, priority=INTERACTIVE, concurrency=10, rate_per_host=20.0):
+    """Serve ``{key: query}`` (``resolve_place`` keys and upstream queries)
+    from the cache and fetch the misses concurrently, each admitted by the
+    quota of ``priority`` first. Misses another caller of the same class or
+    a more urgent one is already fetching wait for that fetch instead of
+    going upstream again. A miss the quota
+    sheds falls back to its expired cache entry when there is one. Returns
+    ``(results, errors)`` keyed like ``queries``."""
+    results, misses = {}, []
+    for key, query in queries.items():
+        forecast = forecast_cache.get(key)
+        if forecast is None:
+            forecast = _warm_from_store(key)
+        if forecast is not None:
+            results[key] = forecast
+        else:
+            misses.append(key)
+
+    client = get_client()
+
+    def admit(keys):
+        admitted, shed = [], {}
+        for key in keys:
+            try:
+                # A flight for this key may have landed since our cache miss; fetch() serves it
+                if forecast_cache.peek(key) is None:
+                    with timing.stage("quota.wait"):
+                        client.admit(priority)
+                admitted.append(key)
+            except QuotaExceeded as e:
+                shed[key] = e
+        return admitted, shed
+
+    def fetch(keys):
+        fetched, errors, todo = {}, {}, {}
+        for key in keys:
+            forecast = forecast_cache.peek(key)
+            if forecast is not None:
+                fetched[key] = forecast
+            else:
+                todo[key] = queries[key]
+        if todo:
+            with timing.stage("upstream.batch"):
+                batch, errors = client.forecast_many(todo, concurrency=concurrency,
+                                                     rate_per_host=rate_per_host, priority=priority)
+            for key, forecast in batch.items():
+                _remember(key, forecast)
+            fetched.update(batch)
+        return fetched, errors
+
+    fetched, fetch_errors = _flights.do_many(misses, fetch, priority, admit) if misses else ({}, {})
+    results.update(fetched)
+    errors = {}
+    for key, error in fetch_errors.items():
+        # Shed calls fall back to the expired forecast when there is one
+        stale = forecast_cache.peek(key, stale=True) if isinstance(error, QuotaExceeded) else None
+        if stale is None:
+            errors[key] = error
+        else:
+            quota.served_stale(priority)
+            results[key] = stale
+    return results, errors
+
+
+def get_data_many(places, forecast_days=None, concurrency=10, rate_per_host=20.0, priority=INTERACTIVE):
+    """Batch version of ``get_data``: cached places are served from memory and
+    the rest are fetched concurrently through ``fetch_queries``. Returns
+    ``(results, errors)`` keyed by the places passed in."""
+    errors, keys, queries = {}, {}, {}
+    for place in places:
+        try:
+            key, query = _upstream(place, forecast_days)
+        except PlaceNotFound as e:
+            errors[place] = e
+            continue
+        keys[place] = key
+        queries.setdefault(key, query)
+    fetched, fetch_errors = fetch_queries(queries, priority, concurrency, rate_per_host)
+    results = {}
+    for place, key in keys.items():
+        if key in fetched:
+            results[place] = _slice(fetched[key], forecast_days)
+        else:
+            errors[place] = fetch_errors[key]
+    return results, errors
 
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+"""Headless batch export of forecasts for a list of cities.
+
+Reads one city per line (blank lines and ``#`` comments are skipped),
+fetches them in chunks through ``backend.get_data_many`` and appends one
+row per (city, 3-hour slot) to CSV, JSON Lines or Parquet (which needs
+pyarrow) as each chunk lands, so memory stays flat however long the list
+is. The format follows the output extension and defaults to CSV. Fetches
+run in the upstream quota's batch class, which never draws the budget
+below half.
+The quota is per process, so the export only queues behind dashboard
+users when it fetches through the forecast service they share, with
+``WEATHER_SERVICE_URL`` set. Completed cities are recorded in a SQLite
+progress file that is looked up one chunk at a time; rerunning the same
+command after an interruption skips them and keeps appending.
+
+    python batch_export.py cities.txt -o forecasts.csv
+    python batch_export.py cities.txt -o forecasts.jsonl --days 2 --concurrency 32
+    python batch_export.py cities.txt -o forecasts/ --format parquet
+    WEATHER_SERVICE_URL=http://127.0.0.1:8765 python batch_export.py cities.txt -o forecasts.csv
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import backend
+
+COLUMNS = ["city", "dt", "time", "temp", "humidity", "pressure", "wind_speed", "condition"]
+MEASUREMENTS = ["temp", "humidity", "pressure", "wind_speed"]
+
+
+class ExportError(Exception):
+    """The export can't start as asked, e.g. a missing optional dependency."""
+
+
+def read_cities(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            city = line.strip()
+            if city and not city.startswith("#"):
+                yield city
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.path = path
+        self._header = not os.path.exists(path) or os.path.getsize(path) == 0
+
+    def write(self, frame):
+        frame.to_csv(self.path, mode="a", header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        pass
+
+
+class JsonLinesWriter:
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, frame):
+        frame.to_json(self._file, orient="records", lines=True, date_format="iso")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Writes each chunk as its own part file in a dataset directory, which
+    keeps appends (and resumed runs) cheap."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet output needs pyarrow: pip install pyarrow") from None
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._part = len([name for name in os.listdir(path) if name.endswith(".parquet")])
+
+    def write(self, frame):
+        frame.to_parquet(os.path.join(self.path, f"part-{self._part:05d}.parquet"), index=False)
+        self._part += 1
+
+    def close(self):
+        pass
+
+
+WRITERS = {"csv": CsvWriter, "jsonl": JsonLinesWriter, "parquet": ParquetWriter}
+
+
+def guess_format(output):
+    ext = os.path.splitext(output.rstrip("/"))[1].lower()
+    if ext == ".parquet":
+        return "parquet"
+    if not ext and (output.endswith("/") or os.path.isdir(output)):
+        raise ExportError(f"can't tell the format of directory {output!r}; pass --format parquet")
+    return {".jsonl": "jsonl", ".json": "jsonl"}.get(ext, "csv")
+
+
+class Progress:
+    """Cities already exported, in a SQLite file so a resumed run looks up
+    one chunk at a time instead of holding every finished city in memory."""
+
+    # Stays below SQLite's limit on bound parameters per statement
+    BATCH = 500
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, isolation_level=None)
+        try:
+            self._db.execute("CREATE TABLE IF NOT EXISTS done (city TEXT PRIMARY KEY)")
+        except sqlite3.DatabaseError as e:
+            self._db.close()
+            raise ExportError(f"progress file {path!r} is not a SQLite database ({e}); earlier versions "
+                              f"wrote plain text, so pass another --progress file") from None
+
+    def done(self, cities):
+        found = set()
+        for i in range(0, len(cities), self.BATCH):
+            batch = cities[i:i + self.BATCH]
+            found.update(city for city, in self._db.execute(
+                f"SELECT city FROM done WHERE city IN ({','.join('?' * len(batch))})", batch))
+        return found
+
+    def mark(self, cities):
+        with self._db:
+            self._db.executemany("INSERT OR IGNORE INTO done VALUES (?)", ((city,) for city in cities))
+
+    def close(self):
+        self._db.close()
+
+
+def export(cities_path, output, fmt=None, days=None, chunk_size=200, concurrency=16,
+           rate_per_host=20.0, progress_path=None, log=sys.stderr):
+    fmt = fmt or guess_format(output)
+    progress_path = progress_path or output.rstrip("/") + ".progress"
+    writer = WRITERS[fmt](output)
+    exported = failed = skipped = 0
+    start = time.perf_counter()
+    try:
+        progress = Progress(progress_path)
+        try:
+            for chunk in chunked(read_cities(cities_path), chunk_size):
+                done = progress.done(chunk)
+                todo = [city for city in chunk if city not in done]
+                skipped += len(chunk) - len(todo)
+                if not todo:
+                    continue
+                results, errors = backend.get_data_many(todo, days, concurrency=concurrency,
+                                                        rate_per_host=rate_per_host, priority=backend.BATCH)
+                ordered = {city: results[city] for city in todo if city in results}
+                if ordered:
+                    frame = backend.forecast_frame(ordered)[COLUMNS]
+                    # The API reports 2 decimals; widen float32 so files don't show float noise
+                    frame = frame.astype({column: "float64" for column in MEASUREMENTS}).round(
+                        {column: 2 for column in MEASUREMENTS})
+                    writer.write(frame)
+                # Only mark cities done once their rows are on disk
+                progress.mark(ordered)
+                for city, error in errors.items():
+                    print(f"failed: {city}: {error}", file=log)
+                exported += len(ordered)
+                failed += len(errors)
+                print(f"{exported} exported, {failed} failed, {skipped} skipped "
+                      f"({time.perf_counter() - start:.1f}s)", file=log)
+        finally:
+            progress.close()
+    finally:
+        writer.close()
+    return {"exported": exported, "failed": failed, "skipped": skipped}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export forecasts for a list of cities.")
+    parser.add_argument("cities", help="text file with one city per line")
+    parser.add_argument("-o", "--output", required=True,
+                        help="output file (.csv, .jsonl) or directory for Parquet parts")
+    parser.add_argument("--format", choices=sorted(WRITERS),
+                        help="defaults to the output extension, or csv when it has none")
+    parser.add_argument("--days", type=int, choices=range(1, 6), help="days per city (default: all 5)")
+    parser.add_argument("--chunk-size", type=int, default=200, help="cities fetched and written per batch")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent upstream requests")
+    parser.add_argument("--rate", type=float, default=20.0, help="max requests started per second")
+    parser.add_argument("--progress", help="progress file (default: <output>.progress)")
+    parser.add_argument("--api-key", help="OpenWeatherMap key (default: OPENWEATHER_API_KEY)")
+    args = parser.parse_args(argv)
+
+    if args.api_key:
+        backend.configure(api_key=args.api_key)
+    try:
+        summary = export(args.cities, args.output, fmt=args.format, days=args.days,
+                         chunk_size=args.chunk_size, concurrency=args.concurrency,
+                         rate_per_host=args.rate, progress_path=args.progress)
+    except ExportError as e:
+        parser.exit(2, f"{parser.prog}: {e}\n")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
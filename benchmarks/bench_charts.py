@@ -0,0 +1,65 @@
+"""Figure build time and JSON payload versus point count.
+
+Builds the Temperature and City Comparison figures with the WebGL switch and
+LTTB downsampling on (the defaults) and off, for growing series lengths
+and city counts, and reports build + serialization time and JSON size.
+
+Run from the repository root: ``python benchmarks/bench_charts.py``
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import charts  # noqa: E402
+
+DEFAULTS = (charts.GL_THRESHOLD, charts.MAX_POINTS)
+
+
+def series_frame(points, cities=1, seed=0):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2024-01-01T00:00:00", "ns")
+    time_column = start + np.arange(points) * np.timedelta64(3, "h")
+    frames = []
+    for city in range(cities):
+        temp = 150 + np.cumsum(rng.normal(0, 5, points))
+        frames.append(pd.DataFrame({"time": time_column, "temp": temp, "temperature": temp / 10,
+                                    "city": f"City {city}"}))
+    frame = pd.concat(frames, ignore_index=True)
+    frame["city"] = frame["city"].astype("category")
+    return frame
+
+
+def measure(build):
+    start = time.perf_counter()
+    payload = len(build().to_json())
+    return time.perf_counter() - start, payload
+
+
+def row(label, build):
+    results = []
+    for settings in (DEFAULTS, (None, None)):
+        charts.GL_THRESHOLD, charts.MAX_POINTS = settings
+        results.append(measure(build))
+    charts.GL_THRESHOLD, charts.MAX_POINTS = DEFAULTS
+    (fast_time, fast_size), (slow_time, slow_size) = results
+    print(f"  {label:<22} {slow_time * 1000:9.1f} ms {slow_size / 1024:9.1f} KiB   "
+          f"{fast_time * 1000:9.1f} ms {fast_size / 1024:9.1f} KiB")
+
+
+if __name__ == "__main__":
+    # Warm up Plotly's validators so the first row isn't charged for them
+    charts.temperature_figure(series_frame(40), "Bench").to_json()
+    print(f"  {'':<22} {'SVG, all points':>24}   {'auto (GL + LTTB)':>24}")
+    print("Temperature view, one series")
+    for points in (40, 400, 4000, 40000, 200000):
+        df = series_frame(points)
+        row(f"{points} points", lambda: charts.temperature_figure(df, "Bench"))
+    print("City Comparison, 40 slots per city")
+    for cities in (5, 25, 100, 500):
+        df = series_frame(40, cities)
+        row(f"{cities} cities", lambda: charts.comparison_figure(df))
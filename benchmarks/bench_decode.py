@@ -0,0 +1,66 @@
+"""Compare decoding a forecast response in full with backend's decoder.
+
+Decodes recorded responses the way ``WeatherClient.forecast`` used to
+(``json.loads`` and keep the whole "list") and the way it does now (orjson
+when installed, straight into a columnar ``Forecast``), reporting time per
+response, peak memory while decoding and the size of what stays cached.
+
+Run from the repository root: ``python benchmarks/bench_decode.py [DIR]``
+where DIR holds recorded ``*.json`` responses; without it synthetic 40 slot
+payloads are used.
+"""
+import glob
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend  # noqa: E402
+from payloads import forecast_payload  # noqa: E402
+
+
+def recorded(directory):
+    bodies = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, "rb") as f:
+            bodies.append(f.read())
+    return bodies
+
+
+def synthetic(count=100):
+    return [json.dumps(forecast_payload(f"City {i}", seed=i)).encode() for i in range(count)]
+
+
+def full(body):
+    return json.loads(body)["list"]
+
+
+def columnar(body):
+    return backend.Forecast.from_response(backend._loads(body))
+
+
+def measure(label, fn, bodies, number):
+    elapsed = timeit.timeit(lambda: [fn(body) for body in bodies], number=number) / number
+    tracemalloc.start()
+    kept = [fn(body) for body in bodies]
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    print(f"  {label:<14} {elapsed / len(bodies) * 1e6:8.1f} us/response   "
+          f"peak {peak / 1024:8.1f} KiB   retained {retained / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    bodies = recorded(sys.argv[1]) if len(sys.argv) > 1 else synthetic()
+    if not bodies:
+        sys.exit("no *.json responses found")
+    decoder = "orjson" if backend._loads is not json.loads else "json (orjson not installed)"
+    print(f"{len(bodies)} responses, {sum(map(len, bodies)) / len(bodies) / 1024:.1f} KiB each; "
+          f"decoder: {decoder}")
+    assert all(array("f", [d["main"]["temp"] for d in full(b)]) == columnar(b).temp for b in bodies)
+    measure("full json", full, bodies, 20)
+    measure("Forecast", columnar, bodies, 20)
@@ -0,0 +1,71 @@
+"""Refreshing per-day aggregates incrementally versus from scratch.
+
+Simulates a wall display whose cities all refresh after one forecast cycle:
+the new forecasts drop the first slot, add one at the end and revise a few
+slots in between. Compares rebuilding the frame and summary per city with
+``ForecastSummary.refreshed``, and checks both give the same numbers.
+
+Run from the repository root: ``python benchmarks/bench_incremental.py``
+"""
+import os
+import random
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import TEMPERATURE_SCALE, Forecast, diff_forecasts, forecast_frame  # noqa: E402
+from metrics import ForecastSummary, frame_daily_summary, frame_metrics  # noqa: E402
+from payloads import forecast_payload  # noqa: E402
+
+CITIES = 500
+REVISED = 3
+
+
+def next_cycle(records, seed):
+    """The following fetch: shifted one slot, with a few revised slots."""
+    rng = random.Random(seed)
+    shifted = forecast_payload(slots=len(records) + 1, start=records[0]["dt"], seed=seed)["list"]
+    records = [dict(d) for d in records[1:]] + [shifted[-1]]
+    for i in rng.sample(range(len(records) - 1), REVISED):
+        records[i] = dict(records[i], main=dict(records[i]["main"], temp=records[i]["main"]["temp"] + 1))
+    return records
+
+
+def full(forecast):
+    df = forecast_frame(forecast)
+    df['temperature'] = df['temp'] * TEMPERATURE_SCALE
+    return frame_metrics(df), frame_daily_summary(df)
+
+
+def check(summary, forecast):
+    metrics, daily = full(forecast)
+    incremental = summary.daily()
+    assert list(incremental.index) == list(daily.index)
+    assert list(incremental["condition"]) == list(daily["condition"])
+    assert np.allclose(incremental.drop(columns="condition").to_numpy(float),
+                       daily.drop(columns="condition").to_numpy(float), atol=1e-4)
+    assert summary.metrics()["dominant"] == metrics["dominant"]
+    assert abs(summary.metrics()["avg"] - metrics["avg"]) < 1e-4
+
+
+if __name__ == "__main__":
+    old_records = [forecast_payload(f"City {i}", seed=i)["list"] for i in range(CITIES)]
+    old = [Forecast.from_records(records) for records in old_records]
+    new = [Forecast.from_records(next_cycle(records, i)) for i, records in enumerate(old_records)]
+    summaries = [ForecastSummary(forecast, scale=TEMPERATURE_SCALE) for forecast in old]
+    for summary, forecast in zip(summaries, new):
+        check(summary.refreshed(forecast), forecast)
+
+    diffs = [diff_forecasts(a, b) for a, b in zip(old, new)]
+    print(f"{CITIES} cities refreshed: +{len(diffs[0].added)} -{len(diffs[0].dropped)} "
+          f"~{len(diffs[0].changed)} slots each")
+    number = 5
+    rebuild = timeit.timeit(lambda: [full(f) for f in new], number=number) / number
+    refresh = timeit.timeit(lambda: [s.refreshed(f) for s, f in zip(summaries, new)], number=number) / number
+    diff_only = timeit.timeit(lambda: [diff_forecasts(a, b) for a, b in zip(old, new)], number=number) / number
+    print(f"  rebuild frame + summary   {rebuild * 1000:8.2f} ms  ({rebuild / CITIES * 1e6:7.1f} us/city)")
+    print(f"  incremental refresh       {refresh * 1000:8.2f} ms  ({refresh / CITIES * 1e6:7.1f} us/city)")
+    print(f"    of which diff           {diff_only * 1000:8.2f} ms")
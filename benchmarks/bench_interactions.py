@@ -0,0 +1,237 @@
+"""Server time and websocket bytes per interaction with the running dashboard.
+
+Starts ``streamlit run`` headless against replayed forecasts and drives it
+the way the browser does: a ``BackMsg`` with the widget states (and, for a
+widget inside a fragment, that fragment's id) goes out over
+``/_stcore/stream``, and the interaction lasts until the server's
+``script_finished``. Reports the median time and ``ForwardMsg`` bytes per
+interaction, so a full-page rerun and a fragment rerun can be compared.
+
+Run from the repository root::
+
+    python benchmarks/bench_interactions.py
+    python benchmarks/bench_interactions.py --rev HEAD~1    # Main.py at an older commit
+
+A live tick replays the timed rerun of a ``run_every`` fragment the way
+the browser's timer does. Interactions whose widget the script doesn't
+have are reported as ``n/a``.
+The server picks up the repository's ``.streamlit/config.toml``, which
+turns off Streamlit's post-run ``gc.collect``; set
+``STREAMLIT_RUNNER_POST_SCRIPT_GC=true`` to see the ~85 ms it adds per run.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from load_test import PLACES, synthesize  # noqa: E402
+
+# Stands in for the widget label of a timed fragment rerun
+AUTO_RERUN = object()
+
+# (label, widget label, value); value None just reruns the page
+SCENARIO = [
+    ("load", None, None),
+    ("enter place", "🌍 Enter Location", "London"),
+    ("hide metrics", "Show Key Metrics", False),
+    ("show metrics", "Show Key Metrics", True),
+    ("view: Sky", "📊 Data Visualization", "Sky"),
+    ("view: Detailed Analysis", "📊 Data Visualization", "Detailed Analysis"),
+    ("view: Temperature", "📊 Data Visualization", "Temperature"),
+    ("animated charts off", "Animated Charts", False),
+    ("animated charts on", "Animated Charts", True),
+    ("refresh cache counters", "🔄 Refresh counters", True),
+    ("live tick, no update", AUTO_RERUN, None),
+]
+
+WIDGETS = ("checkbox", "selectbox", "slider", "text_input", "button")
+
+
+class Session:
+    """One browser tab: the widgets it has seen and their current values."""
+
+    def __init__(self, ws):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        self._back, self._forward = BackMsg, ForwardMsg
+        self.ws = ws
+        self.widgets = {}
+        self.states = {}
+        self.auto_reruns = []
+        self.page_script_hash = ""
+
+    def _observe(self, msg):
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self.page_script_hash = msg.new_session.page_script_hash
+        elif kind == "auto_rerun" and msg.auto_rerun.fragment_id not in self.auto_reruns:
+            self.auto_reruns.append(msg.auto_rerun.fragment_id)
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element = msg.delta.new_element
+            widget = element.WhichOneof("type")
+            if widget in WIDGETS:
+                proto = getattr(element, widget)
+                self.widgets[proto.label] = (widget, proto, msg.delta.fragment_id)
+        return kind
+
+    def set(self, label, value):
+        """Set a widget's state; returns the fragment to rerun, or None if
+        the page has no such widget."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        if label not in self.widgets:
+            return None
+        widget, proto, fragment_id = self.widgets[label]
+        state = WidgetState(id=proto.id)
+        if widget == "checkbox":
+            state.bool_value = value
+        elif widget == "selectbox":
+            state.int_value = list(proto.options).index(value)
+        elif widget == "slider":
+            state.double_array_value.data.extend(value if isinstance(value, list) else [value])
+        elif widget == "text_input":
+            state.string_value = value
+        else:
+            state.trigger_value = True
+        self.states[proto.id] = state
+        return fragment_id
+
+    async def rerun(self, fragment_id="", auto=False, timeout=60.0):
+        msg = self._back()
+        client_state = msg.rerun_script
+        client_state.page_script_hash = self.page_script_hash
+        client_state.fragment_id = fragment_id
+        client_state.is_auto_rerun = auto
+        client_state.widget_states.widgets.extend(self.states.values())
+        received = 0
+        start = time.perf_counter()
+        await self.ws.send_bytes(msg.SerializeToString())
+        while True:
+            frame = await asyncio.wait_for(self.ws.receive(), timeout)
+            received += len(frame.data)
+            if self._observe(self._forward.FromString(frame.data)) == "script_finished":
+                break
+        elapsed = time.perf_counter() - start
+        # Status messages trailing the run still count against it
+        try:
+            while True:
+                frame = await asyncio.wait_for(self.ws.receive(), 0.05)
+                received += len(frame.data)
+                self._observe(self._forward.FromString(frame.data))
+        except asyncio.TimeoutError:
+            pass
+        # Buttons are one-shot, like in the browser
+        self.states = {key: state for key, state in self.states.items()
+                       if state.WhichOneof("value") != "trigger_value"}
+        return elapsed, received
+
+
+async def drive(port, rounds):
+    import aiohttp
+
+    samples = {label: [] for label, _, _ in SCENARIO}
+    async with aiohttp.ClientSession() as http:
+        async with http.ws_connect(f"ws://127.0.0.1:{port}/_stcore/stream", protocols=["streamlit"],
+                                   max_msg_size=0) as ws:
+            session = Session(ws)
+            for round_ in range(rounds):
+                for label, widget, value in SCENARIO:
+                    if widget is AUTO_RERUN:
+                        if session.auto_reruns:
+                            samples[label].append(await session.rerun(session.auto_reruns[0], auto=True))
+                        continue
+                    if widget is None:
+                        if round_:
+                            continue
+                        fragment_id = ""
+                    else:
+                        fragment_id = session.set(widget, value)
+                        if fragment_id is None:
+                            continue
+                    samples[label].append(await session.rerun(fragment_id))
+    return samples
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(script, fixtures, port):
+    env = dict(os.environ, WEATHER_REPLAY_DIR=fixtures, WEATHER_PREFETCH="0",
+               PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    return subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", script, "--server.headless", "true",
+         "--server.port", str(port), "--server.fileWatcherType", "none",
+         "--browser.gatherUsageStats", "false"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_healthy(port, timeout=60.0):
+    import aiohttp
+
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as http:
+        while time.monotonic() < deadline:
+            try:
+                async with http.get(f"http://127.0.0.1:{port}/_stcore/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"streamlit did not come up on port {port}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time interactions with the running dashboard.")
+    parser.add_argument("--script", default=os.path.join(ROOT, "Main.py"), help="Streamlit script to serve")
+    parser.add_argument("--rev", help="serve Main.py as of this git revision instead")
+    parser.add_argument("--fixtures", help="directory of recorded responses (default: synthetic)")
+    parser.add_argument("--rounds", type=int, default=5, help="times each interaction is repeated")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="weather-interactions-")
+    script = args.script
+    if args.rev:
+        script = os.path.join(workdir, "Main.py")
+        with open(script, "wb") as f:
+            f.write(subprocess.run(["git", "show", f"{args.rev}:Main.py"], cwd=ROOT,
+                                   capture_output=True, check=True).stdout)
+    fixtures = args.fixtures
+    if fixtures is None:
+        fixtures = os.path.join(workdir, "fixtures")
+        os.makedirs(fixtures)
+        synthesize(fixtures, PLACES)
+
+    port = free_port()
+    server = serve(script, fixtures, port)
+    try:
+        asyncio.run(wait_healthy(port))
+        samples = asyncio.run(drive(port, args.rounds))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{args.rev or os.path.relpath(script, ROOT)}: median over {args.rounds} rounds")
+    print(f"  {'interaction':<24} {'server ms':>10} {'sent KiB':>10}")
+    for label, runs in samples.items():
+        if not runs:
+            print(f"  {label:<24} {'n/a':>10} {'n/a':>10}")
+            continue
+        print(f"  {label:<24} {statistics.median(t for t, _ in runs) * 1000:10.1f} "
+              f"{statistics.median(b for _, b in runs) / 1024:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Map viewport query and figure time versus the number of indexed cities.
+
+Indexes synthetic cities in a ``spatial.CityGrid`` and times viewport
+queries from world to street level, plus building and serializing the map
+figure for the markers returned. For comparison, "scan" filters every
+city's coordinates and clusters them with ``np.unique`` per query, which
+grows with the city count where the grid query does not.
+
+Run from the repository root: ``python benchmarks/bench_map.py``
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import charts  # noqa: E402
+from backend import ForecastPoint  # noqa: E402
+from geocode import City  # noqa: E402
+from spatial import CityGrid  # noqa: E402
+
+MAX_MARKERS = 150
+VIEWPORTS = {
+    "world": (-180, -90, 180, 90),
+    "continent": (-15, 30, 35, 55),
+    "region": (-4, 50, 2, 53),
+    "city": (-0.3, 51.4, -0.1, 51.5),
+}
+
+
+def synthetic_cities(n, seed=0):
+    rng = np.random.default_rng(seed)
+    # Clustered around a few hundred centres, like real settlements
+    centres = rng.uniform((-55, -170), (70, 170), size=(300, 2))
+    picks = centres[rng.integers(0, len(centres), n)] + rng.normal(0, 3, size=(n, 2))
+    lat, lon = np.clip(picks[:, 0], -89, 89), np.clip(picks[:, 1], -179, 179)
+    population = rng.pareto(1.2, n) * 1000
+    return [City(i, f"City {i}", "XX", float(lat[i]), float(lon[i]), int(population[i])) for i in range(n)]
+
+
+def scan(lat, lon, viewport, max_markers=MAX_MARKERS):
+    west, south, east, north = viewport
+    inside = np.flatnonzero((lat >= south) & (lat <= north) & (lon >= west) & (lon <= east))
+    if len(inside) <= max_markers:
+        return inside
+    cell = max(east - west, north - south) / np.sqrt(max_markers)
+    keys = (lat[inside] // cell) * 1e6 + lon[inside] // cell
+    return np.unique(keys, return_counts=True)
+
+
+def timed(fn, number=50):
+    start = time.perf_counter()
+    for _ in range(number):
+        result = fn()
+    return (time.perf_counter() - start) / number * 1000, result
+
+
+if __name__ == "__main__":
+    point = ForecastPoint(0, 150.0, 60.0, 1013.0, 3.0, "Clouds")
+    print(f"{'cities':>8} {'build ms':>9}  {'viewport':<10} {'markers':>7} {'grid ms':>8} {'scan ms':>8} "
+          f"{'figure ms':>9} {'KiB':>6}")
+    for n in (1_000, 10_000, 50_000, 200_000):
+        cities = synthetic_cities(n)
+        start = time.perf_counter()
+        grid = CityGrid(cities)
+        build = (time.perf_counter() - start) * 1000
+        for name, viewport in VIEWPORTS.items():
+            grid_ms, markers = timed(lambda: grid.query(*viewport, max_markers=MAX_MARKERS))
+            scan_ms, _ = timed(lambda: scan(grid.lat, grid.lon, viewport))
+            shown = [grid.cities[i] for i in markers.city]
+            figure_ms, size = timed(lambda: len(charts.map_figure(markers, shown, [point] * len(shown),
+                                                                  viewport).to_json()), number=5)
+            print(f"{n:>8} {build:>9.0f}  {name:<10} {len(shown):>7} {grid_ms:>8.3f} {scan_ms:>8.3f} "
+                  f"{figure_ms:>9.1f} {size / 1024:>6.1f}")
@@ -0,0 +1,48 @@
+"""Per-city memory footprint of a cached forecast in each representation.
+
+Run from the repository root: ``python benchmarks/bench_memory.py``
+"""
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import Forecast  # noqa: E402
+from payloads import forecast_lists  # noqa: E402
+
+CITIES = 1000
+
+
+def slim_records(records):
+    # The nested dict entries cached before the Forecast container
+    return [{
+        "dt": d["dt"],
+        "dt_txt": d["dt_txt"],
+        "main": {"temp": d["main"]["temp"], "humidity": d["main"]["humidity"],
+                 "pressure": d["main"]["pressure"]},
+        "wind": {"speed": d["wind"]["speed"]},
+        "weather": [{"main": d["weather"][0]["main"]}],
+    } for d in records]
+
+
+def footprint(build, bodies):
+    gc.collect()
+    tracemalloc.start()
+    kept = [build(body) for body in bodies]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size / len(bodies)
+
+
+if __name__ == "__main__":
+    # Decode every representation from JSON text so nothing is shared between them
+    bodies = [json.dumps(records) for records in forecast_lists(CITIES)]
+    print(f"{CITIES} cities x 40 slots, retained per city")
+    for label, build in (("full API entries", json.loads),
+                         ("slim dict entries", lambda body: slim_records(json.loads(body))),
+                         ("Forecast", lambda body: Forecast.from_records(json.loads(body)))):
+        print(f"  {label:<18} {footprint(build, bodies) / 1024:8.2f} KiB")
@@ -0,0 +1,90 @@
+"""Compare the former Python/pandas metrics code with the vectorized metrics module.
+
+Run from the repository root: ``python benchmarks/bench_metrics.py``
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import TEMPERATURE_SCALE, forecast_frame  # noqa: E402
+from metrics import batch_metrics, frame_daily_summary, frame_metrics  # noqa: E402
+from payloads import forecast_lists  # noqa: E402
+
+
+def old_metrics(filtered_data):
+    temperatures = [d["main"]["temp"] / 10 for d in filtered_data]
+    conditions = [d["weather"][0]["main"] for d in filtered_data]
+    return {
+        "avg": sum(temperatures) / len(temperatures),
+        "max": max(temperatures),
+        "min": min(temperatures),
+        # max(set(...)) breaks ties in hash order; mode() is the deterministic equivalent
+        "dominant": max(set(conditions), key=conditions.count),
+        "mode": pd.Series(conditions).mode().iloc[0],
+    }
+
+
+def old_daily_summary(filtered_data):
+    df = pd.DataFrame({
+        'DateTime': pd.to_datetime([d["dt_txt"] for d in filtered_data]),
+        'Temperature': [d["main"]["temp"] / 10 for d in filtered_data],
+        'Humidity': [d.get("main", {}).get("humidity", 50) for d in filtered_data],
+        'Pressure': [d.get("main", {}).get("pressure", 1013) for d in filtered_data],
+        'Condition': [d["weather"][0]["main"] for d in filtered_data]
+    })
+    return df.groupby(df['DateTime'].dt.date).agg({
+        'Temperature': ['mean', 'min', 'max'],
+        'Humidity': 'mean',
+        'Pressure': 'mean',
+        'Condition': lambda x: x.mode().iloc[0] if not x.mode().empty else 'Unknown'
+    })
+
+
+def frame_for(forecast):
+    df = forecast_frame(forecast)
+    df['temperature'] = df['temp'].astype(np.float64) * TEMPERATURE_SCALE
+    return df
+
+
+def check_identical(forecasts):
+    for forecast in forecasts:
+        old, df = old_metrics(forecast), frame_for(forecast)
+        new = frame_metrics(df)
+        assert np.allclose([old["avg"], old["max"], old["min"]], [new["avg"], new["max"], new["min"]], atol=1e-4)
+        assert new["dominant"] == old["mode"]
+        old_daily, new_daily = old_daily_summary(forecast), frame_daily_summary(df)
+        assert np.allclose(old_daily.iloc[:, :5].to_numpy(float), new_daily.iloc[:, :5].to_numpy(float), atol=1e-3)
+        assert list(old_daily.iloc[:, 5]) == list(new_daily["condition"])
+
+
+def report(label, seconds, cities):
+    print(f"  {label:<28} {seconds * 1000:10.2f} ms  ({seconds / cities * 1e6:8.1f} us/city)")
+
+
+if __name__ == "__main__":
+    check_identical(forecast_lists(50))
+    print("vectorized results match the previous implementation for 50 cities")
+
+    for cities in (1, 1000, 5000):
+        forecasts = forecast_lists(cities)
+        number = 20 if cities == 1 else 1
+        print(f"{cities} cities x 40 slots")
+        if cities <= 1000:
+            report("old metrics + daily groupby",
+                   timeit.timeit(lambda: [(old_metrics(f), old_daily_summary(f)) for f in forecasts],
+                                 number=number) / number, cities)
+            frames = [frame_for(f) for f in forecasts]
+            report("metrics module per city",
+                   timeit.timeit(lambda: [(frame_metrics(df), frame_daily_summary(df)) for df in frames],
+                                 number=number) / number, cities)
+        batch = forecast_frame({f"City {i}": f for i, f in enumerate(forecasts)})
+        temperatures = (batch['temp'].to_numpy(np.float64) * TEMPERATURE_SCALE).reshape(cities, -1)
+        codes = batch['condition'].cat.codes.to_numpy().reshape(cities, -1)
+        categories = list(batch['condition'].cat.categories)
+        report("batch_metrics",
+               timeit.timeit(lambda: batch_metrics(temperatures, codes, categories), number=20) / 20, cities)
@@ -0,0 +1,61 @@
+"""Compare Main.py's former per-view list comprehensions with backend.forecast_frame.
+
+Run from the repository root: ``python benchmarks/bench_parse.py``
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import TEMPERATURE_SCALE, forecast_frame  # noqa: E402
+from payloads import forecast_lists  # noqa: E402
+
+
+def per_view_lists(filtered_data):
+    # What one Detailed Analysis rerun used to do, metrics row included
+    temperatures = [d["main"]["temp"] / 10 for d in filtered_data]
+    conditions = [d["weather"][0]["main"] for d in filtered_data]
+    max(set(conditions), key=conditions.count)
+    return pd.DataFrame({
+        'DateTime': pd.to_datetime([d["dt_txt"] for d in filtered_data]),
+        'Temperature': [d["main"]["temp"] / 10 for d in filtered_data],
+        'Humidity': [d.get("main", {}).get("humidity", 50) for d in filtered_data],
+        'Pressure': [d.get("main", {}).get("pressure", 1013) for d in filtered_data],
+        'Condition': [d["weather"][0]["main"] for d in filtered_data]
+    }), temperatures
+
+
+def columnar(filtered_data):
+    df = forecast_frame(filtered_data)
+    df['temperature'] = df['temp'] * TEMPERATURE_SCALE
+    return df
+
+
+def batched(forecasts):
+    df = forecast_frame({f"City {i}": f for i, f in enumerate(forecasts)})
+    df['temperature'] = df['temp'] * TEMPERATURE_SCALE
+    return df
+
+
+def measure(label, fn, forecasts, number, per_city=True):
+    run = (lambda: [fn(f) for f in forecasts]) if per_city else (lambda: fn(forecasts))
+    elapsed = timeit.timeit(run, number=number) / number
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<18} {elapsed * 1000:9.2f} ms   peak {peak / 1024:9.1f} KiB")
+
+
+if __name__ == "__main__":
+    for cities, number in ((1, 200), (100, 5)):
+        forecasts = forecast_lists(cities)
+        print(f"{cities} city x 40 slots")
+        measure("per-view lists", per_view_lists, forecasts, number)
+        measure("forecast_frame", columnar, forecasts, number)
+        if cities > 1:
+            measure("batched frame", batched, forecasts, number, per_city=False)
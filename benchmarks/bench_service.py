@@ -0,0 +1,118 @@
+"""Upstream calls made by several dashboard processes, with and without the
+shared forecast service.
+
+Starts ``--workers`` processes that each look up every place in a shuffled
+order, the way separate Streamlit workers serve their own users, first
+fetching directly (each process with its own cache and coalescing) and
+then through ``forecast_service.py`` started on a free port. Forecasts come
+from a ``backend.ReplaySource`` with ``--latency`` per call, so the runs
+never touch the network. Reports wall time, upstream calls in total and
+the service's per-worker hit rates.
+
+Run from the repository root::
+
+    python benchmarks/bench_service.py --workers 4 --places 50
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("WEATHER_PREFETCH", "0")
+
+import backend  # noqa: E402
+from bench_interactions import free_port  # noqa: E402
+from load_test import synthesize  # noqa: E402
+
+
+def run_worker(index, places, rounds):
+    """One dashboard process: returns the upstream calls it made itself and
+    the places it failed to get."""
+    random.seed(index)
+    failures = 0
+    for _ in range(rounds):
+        for place in random.sample(places, len(places)):
+            try:
+                backend.get_data(place)
+            except Exception:
+                failures += 1
+    client = backend.get_client()
+    direct = client.direct if isinstance(client, backend.ServiceSource) else client
+    return len(direct.latencies), failures
+
+
+def run(args, places, env):
+    # Spawned workers import backend afresh, under this run's settings
+    os.environ.update(env)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        outcomes = list(pool.map(run_worker, range(args.workers), [places] * args.workers,
+                                 [args.rounds] * args.workers))
+    return time.perf_counter() - start, outcomes
+
+
+def wait_healthy(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"forecast service did not come up at {url}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare upstream calls with and without the forecast service.")
+    parser.add_argument("--workers", type=int, default=4, help="dashboard processes")
+    parser.add_argument("--places", type=int, default=50, help="distinct places each worker looks up")
+    parser.add_argument("--rounds", type=int, default=2, help="times each worker looks up every place")
+    parser.add_argument("--latency", default="0.05", help="replayed upstream latency in seconds, or a range")
+    args = parser.parse_args(argv)
+
+    fixtures = tempfile.mkdtemp(prefix="weather-service-")
+    places = [f"City {i}" for i in range(args.places)]
+    synthesize(fixtures, places)
+    env = {"WEATHER_REPLAY_DIR": fixtures, "WEATHER_REPLAY_LATENCY": args.latency,
+           # Keep the whole run inside the per-minute budget
+           "WEATHER_QUOTA_PER_MINUTE": str(args.workers * args.places * args.rounds),
+           "WEATHER_QUOTA_PER_DAY": str(10 * args.workers * args.places * args.rounds)}
+
+    print(f"{args.workers} workers × {args.places} places × {args.rounds} rounds, latency {args.latency}s")
+    print(f"  {'mode':<10} {'wall s':>8} {'upstream':>9} {'failures':>9}")
+    elapsed, outcomes = run(args, places, dict(env, WEATHER_SERVICE_URL=""))
+    print(f"  {'direct':<10} {elapsed:8.2f} {sum(o[0] for o in outcomes):9d} {sum(o[1] for o in outcomes):9d}")
+
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    service = subprocess.Popen([sys.executable, os.path.join(ROOT, "forecast_service.py"), "--port", str(port)],
+                               env=dict(os.environ, **env), cwd=ROOT, stderr=subprocess.DEVNULL)
+    try:
+        wait_healthy(url)
+        elapsed, outcomes = run(args, places, dict(env, WEATHER_SERVICE_URL=url))
+        with urllib.request.urlopen(f"{url}/stats") as response:
+            stats = json.load(response)
+    finally:
+        service.terminate()
+        service.wait()
+    upstream = stats["total"]["upstream"] + sum(o[0] for o in outcomes)
+    print(f"  {'service':<10} {elapsed:8.2f} {upstream:9d} {sum(o[1] for o in outcomes):9d}")
+    for worker, counts in sorted(stats["workers"].items()):
+        print(f"    worker {worker:<12} {counts['requests']:5d} requests · {counts['hit_rate']:4.0%} hits · "
+              f"{counts['upstream']:4d} upstream")
+    total = stats["total"]
+    print(f"    {'total':<19} {total['requests']:5d} requests · {total['hit_rate']:4.0%} hits · "
+          f"{total['upstream']:4d} upstream · {stats['coalescing']['coalesced']} coalesced")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Cold import time and resident memory of the dashboard's startup paths.
+
+Each scenario runs in a fresh interpreter. "eager" reproduces the old
+module-level imports of Main.py and backend.py; the others are what the
+lazy import layout loads for each path.
+
+Run from the repository root: ``python benchmarks/bench_startup.py``
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "eager (old Main.py + backend.py)":
+        "import streamlit, pandas, requests, aiohttp, plotly.graph_objects, plotly.express, plotly.subplots",
+    "backend only (workers, CLI)": "import backend",
+    "welcome screen": "import streamlit, backend, timing",
+    "first chart": "import streamlit, backend, timing, charts, metrics; backend.forecast_frame([])",
+}
+
+PROBE = """
+import resource, sys, time
+start = time.perf_counter()
+exec(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def run(code, repeat=5):
+    times, rss = [], []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", PROBE, code], cwd=ROOT, capture_output=True,
+                             text=True, check=True).stdout.split()
+        times.append(float(out[0]))
+        rss.append(int(out[1]) / 1024)
+    return statistics.median(times), statistics.median(rss)
+
+
+if __name__ == "__main__":
+    for label, code in SCENARIOS.items():
+        seconds, rss_mib = run(code)
+        print(f"{label:<34} {seconds * 1000:8.1f} ms   RSS {rss_mib:7.1f} MiB")
@@ -0,0 +1,128 @@
+"""Headless load test of the dashboard against recorded API responses.
+
+Runs Main.py through Streamlit's ``AppTest`` for ``--sessions`` concurrent
+simulated users, one process each, so every session has its own forecast
+cache unless ``WEATHER_STORE_PATH`` points them at a shared store. Each
+user loads the page, then for ``--iterations`` rounds
+enters a place and switches through every view. Forecasts come from a
+``backend.ReplaySource`` with the given latency and error rate, so runs
+never touch the network and repeat exactly. Reports throughput and
+per-interaction latency percentiles.
+
+Run from the repository root::
+
+    python benchmarks/load_test.py --sessions 8 --iterations 3
+    python benchmarks/load_test.py --fixtures recorded/ --latency 0.05-0.3 --error-rate 0.02
+
+Without ``--fixtures``, synthetic responses are written for ``--places`` to
+a temporary directory. Record real ones by running the dashboard with
+``WEATHER_RECORD_DIR=recorded/``.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("WEATHER_PREFETCH", "0")
+
+import backend  # noqa: E402
+from payloads import forecast_payload  # noqa: E402
+
+PLACES = ["New York", "London", "Tokyo", "Paris", "Sydney", "Dubai"]
+VIEWS = ["Temperature", "Sky", "Detailed Analysis", "City Comparison"]
+
+
+def synthesize(directory, places):
+    for seed, place in enumerate(places):
+        with open(os.path.join(directory, backend.fixture_name({"q": place})), "w") as f:
+            json.dump(forecast_payload(place, seed=seed), f)
+
+
+def quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_session(index, args, fixtures):
+    """One simulated user, in its own process: ``AppTest`` keeps global
+    runtime state, so concurrent sessions cannot share an interpreter."""
+    from streamlit.testing.v1 import AppTest
+
+    source = backend.ReplaySource(fixtures, latency=backend._parse_latency(args.latency),
+                                  error_rate=args.error_rate, seed=args.seed + index)
+    backend.set_client(source)
+    if args.cache_size is not None:
+        backend.forecast_cache.max_entries = args.cache_size
+    samples, failures = [], 0
+
+    def run(label, action):
+        nonlocal failures
+        start = time.perf_counter()
+        at = action().run(timeout=args.timeout)
+        samples.append((label, time.perf_counter() - start))
+        if at.exception or at.error:
+            failures += 1
+
+    at = AppTest.from_file(os.path.join(ROOT, "Main.py"), default_timeout=args.timeout)
+    at.secrets["openweather"] = {"api_key": "replay"}
+    run("load", lambda: at)
+    for i in range(args.iterations):
+        place = args.places[(index + i) % len(args.places)]
+        run("place", lambda: at.sidebar.text_input[0].input(place))
+        for view in VIEWS:
+            run(view, lambda: at.selectbox(key="view").select(view))
+    return samples, failures, source.latency_stats()["requests"], source.errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the dashboard against replayed responses.")
+    parser.add_argument("--fixtures", help="directory of recorded responses (default: synthetic)")
+    parser.add_argument("--places", nargs="+", default=PLACES, help="places the sessions visit")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent simulated users")
+    parser.add_argument("--iterations", type=int, default=3, help="places each user visits")
+    parser.add_argument("--latency", default="0", help="injected latency in seconds, e.g. 0.05 or 0.02-0.2")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream requests that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache-size", type=int, help="forecast cache entries (0 disables the cache)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds allowed per script run")
+    args = parser.parse_args(argv)
+
+    fixtures = args.fixtures
+    if fixtures is None:
+        fixtures = tempfile.mkdtemp(prefix="weather-fixtures-")
+        synthesize(fixtures, sorted(set(args.places) | set(PLACES)))
+
+    # Import the view modules up front so forked sessions don't each pay for
+    # pandas and Plotly in their first measured run
+    import charts  # noqa: F401
+    import metrics  # noqa: F401
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.sessions) as pool:
+        outcomes = list(pool.map(run_session, range(args.sessions), [args] * args.sessions,
+                                 [fixtures] * args.sessions))
+    elapsed = time.perf_counter() - start
+
+    by_label = {}
+    for samples, _, _, _ in outcomes:
+        for label, seconds in samples:
+            by_label.setdefault(label, []).append(seconds)
+    runs = sum(len(samples) for samples in by_label.values())
+    failures = sum(outcome[1] for outcome in outcomes)
+    print(f"{args.sessions} sessions, {runs} script runs in {elapsed:.2f}s: {runs / elapsed:.1f} runs/s, "
+          f"{failures} with errors; upstream {sum(o[2] for o in outcomes)} requests, "
+          f"{sum(o[3] for o in outcomes)} injected failures")
+    print(f"  {'interaction':<18} {'runs':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, samples in list(by_label.items()) + [("all", [s for v in by_label.values() for s in v])]:
+        ordered = sorted(samples)
+        print(f"  {label:<18} {len(ordered):>5} " +
+              " ".join(f"{quantile(ordered, q) * 1000:8.1f}" for q in (0.5, 0.95, 0.99)))
+    return 1 if failures and not args.error_rate else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
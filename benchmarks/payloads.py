@@ -0,0 +1,38 @@
+"""Synthetic OpenWeatherMap 5 day / 3 hour forecast payloads for benchmarks."""
+import random
+import time
+
+CONDITIONS = ["Clear", "Clouds", "Rain", "Snow", "Drizzle", "Thunderstorm", "Mist"]
+
+
+def forecast_payload(city="London", slots=40, start=None, seed=0):
+    rng = random.Random(seed)
+    start = start or (int(time.time()) // 10800 + 1) * 10800
+    entries = []
+    for i in range(slots):
+        dt = start + i * 10800
+        temp = rng.uniform(-5, 30)
+        entries.append({
+            "dt": dt,
+            "main": {
+                "temp": temp, "feels_like": temp - 1.5, "temp_min": temp - 0.5, "temp_max": temp + 0.5,
+                "pressure": rng.randint(990, 1030), "sea_level": 1013, "grnd_level": 1001,
+                "humidity": rng.randint(30, 100), "temp_kf": 0,
+            },
+            "weather": [{"id": 800, "main": rng.choice(CONDITIONS), "description": "sky", "icon": "01d"}],
+            "clouds": {"all": rng.randint(0, 100)},
+            "wind": {"speed": rng.uniform(0, 12), "deg": rng.randint(0, 359), "gust": rng.uniform(0, 20)},
+            "visibility": 10000,
+            "pop": rng.random(),
+            "sys": {"pod": "d"},
+            "dt_txt": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(dt)),
+        })
+    return {
+        "cod": "200", "message": 0, "cnt": slots, "list": entries,
+        "city": {"id": 2643743, "name": city, "coord": {"lat": 51.5085, "lon": -0.1257},
+                 "country": "GB", "population": 1000000, "timezone": 0},
+    }
+
+
+def forecast_lists(cities, slots=40):
+    return [forecast_payload(f"City {i}", slots, seed=i)["list"] for i in range(cities)]
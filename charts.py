@@ -0,0 +1,363 @@
+"""Plotly figures for the dashboard views.
+
+The dashboard look lives in one registered template instead of being
+repeated in every ``update_layout`` call, and built figures are kept in a
+``FigureCache`` so reruns with unchanged data reuse them.
+
+Line charts with more than ``GL_THRESHOLD`` points in total switch from
+spline SVG traces to ``Scattergl``, and series are thinned with LTTB so a
+figure carries at most about ``MAX_POINTS`` line points. Set either to
+``None`` to turn it off.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.subplots import make_subplots
+
+from backend import TEMPERATURE_SCALE
+
+TEMPLATE = "weather_pro"
+PALETTE = ['#3b82f6', '#10b981', '#f59e0b', '#ef4444', '#8b5cf6', '#ec4899', '#14b8a6', '#64748b']
+GRID_COLOR = 'rgba(148,163,184,0.3)'
+BACKGROUND = 'rgba(255,255,255,0.98)'
+GL_THRESHOLD = 1000
+MAX_POINTS = 2000
+MIN_TRACE_POINTS = 20
+
+
+def register_template():
+    template = go.layout.Template(pio.templates["plotly_white"])
+    template.layout.update(
+        font=dict(color='#374151', family='Inter'),
+        title=dict(font=dict(color='#1e293b', family='Inter')),
+        paper_bgcolor=BACKGROUND,
+        plot_bgcolor=BACKGROUND,
+        colorway=PALETTE,
+        xaxis=dict(gridcolor=GRID_COLOR, showgrid=True),
+        yaxis=dict(gridcolor=GRID_COLOR, showgrid=True),
+    )
+    pio.templates[TEMPLATE] = template
+
+
+register_template()
+
+
+def lttb(x, y, n_out):
+    """Indices of the ``n_out`` points Largest-Triangle-Three-Buckets keeps
+    from the series ``(x, y)``; ``x`` may be numeric or datetime64."""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x)
+    x = (x.astype("int64") if x.dtype.kind == "M" else x).astype(np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # First and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def downsample(x, y, budget):
+    """``(x, y)`` thinned with LTTB to ``budget`` points, or unchanged when
+    already within it or ``budget`` is None."""
+    if budget is None or len(y) <= budget:
+        return x, y
+    keep = lttb(x, y, budget)
+    return np.asarray(x)[keep], np.asarray(y)[keep]
+
+
+def _budget(traces=1):
+    """Points each of ``traces`` line traces may keep."""
+    return max(MIN_TRACE_POINTS, MAX_POINTS // traces) if MAX_POINTS else None
+
+
+def _webgl(points):
+    return GL_THRESHOLD is not None and points > GL_THRESHOLD
+
+
+def _line(x, y, gl, traces=1, **kwargs):
+    """A Scatter line trace, or past the WebGL threshold a Scattergl one
+    without splines or markers, which WebGL does not draw."""
+    x, y = downsample(x, y, _budget(traces))
+    if not gl:
+        return go.Scatter(x=x, y=y, **kwargs)
+    kwargs.pop('marker', None)
+    if 'line' in kwargs:
+        kwargs['line'] = {k: v for k, v in kwargs['line'].items() if k != 'shape'}
+    kwargs['mode'] = 'lines'
+    return go.Scattergl(x=x, y=y, **kwargs)
+
+
+def condition_counts(df):
+    counts = df['condition'].value_counts()
+    return counts[counts > 0]
+
+
+def temperature_figure(df, place):
+    fig = go.Figure()
+    fig.add_trace(_line(
+        df['time'],
+        df['temperature'],
+        _webgl(len(df)),
+        mode='lines+markers',
+        name='Temperature',
+        line=dict(color='#3b82f6', width=3, shape='spline'),
+        marker=dict(size=8, color='#fff', line=dict(color='#3b82f6', width=2)),
+        fill='tonexty',
+        fillcolor='rgba(59, 130, 246, 0.1)'
+    ))
+    fig.add_hline(y=20, line_dash="dash", line_color="rgba(100,116,139,0.5)",
+                  annotation_text="Comfort Zone", annotation_position="bottom right")
+    fig.update_layout(
+        template=TEMPLATE,
+        title=dict(text=f"Temperature Forecast - {place}", font=dict(size=24), x=0.5),
+        xaxis_title="Date & Time",
+        yaxis_title="Temperature (°C)",
+        showlegend=False,
+        height=500
+    )
+    return fig
+
+
+def refresh_temperature_figure(fig, df):
+    x, y = downsample(df['time'], df['temperature'], _budget())
+    fig.data[0].update(x=x, y=y)
+
+
+def histogram_figure(df):
+    fig = go.Figure(go.Histogram(x=df['temperature'], nbinsx=15, marker_color='#3b82f6'))
+    fig.update_layout(
+        template=TEMPLATE,
+        title="Temperature Distribution",
+        xaxis_title="temperature",
+        yaxis_title="count",
+        height=400
+    )
+    return fig
+
+
+def refresh_histogram_figure(fig, df):
+    fig.data[0].x = df['temperature']
+
+
+def conditions_pie_figure(df):
+    counts = condition_counts(df)
+    fig = go.Figure(go.Pie(values=counts.values, labels=counts.index))
+    fig.update_layout(
+        template=TEMPLATE,
+        title="Weather Conditions Distribution",
+        piecolorway=PALETTE[:5],
+        height=500
+    )
+    return fig
+
+
+def refresh_conditions_pie_figure(fig, df):
+    counts = condition_counts(df)
+    fig.data[0].update(values=counts.values, labels=counts.index)
+
+
+def analysis_figure(df):
+    fig = make_subplots(
+        rows=2, cols=2,
+        subplot_titles=('Temperature Trend', 'Humidity Levels', 'Atmospheric Pressure', 'Weather Timeline')
+    )
+    gl = _webgl(3 * len(df))
+    fig.add_trace(_line(df['time'], df['temperature'], gl, traces=3, name='Temperature',
+                        line=dict(color='#3b82f6')), row=1, col=1)
+    fig.add_trace(_line(df['time'], df['humidity'], gl, traces=3, name='Humidity',
+                        line=dict(color='#10b981')), row=1, col=2)
+    fig.add_trace(_line(df['time'], df['pressure'], gl, traces=3, name='Pressure',
+                        line=dict(color='#f59e0b')), row=2, col=1)
+    counts = condition_counts(df)
+    fig.add_trace(go.Bar(x=counts.index, y=counts.values, name='Conditions',
+                         marker_color='#8b5cf6'), row=2, col=2)
+    fig.update_layout(template=TEMPLATE, height=800, showlegend=False)
+    return fig
+
+
+def refresh_analysis_figure(fig, df):
+    with fig.batch_update():
+        for trace, column in zip(fig.data[:3], ('temperature', 'humidity', 'pressure')):
+            x, y = downsample(df['time'], df[column], _budget(3))
+            trace.update(x=x, y=y)
+        counts = condition_counts(df)
+        fig.data[3].update(x=counts.index, y=counts.values)
+
+
+def comparison_figure(compare_df):
+    fig = go.Figure()
+    gl = _webgl(len(compare_df))
+    cities = compare_df['city'].nunique()
+    for idx, (city, city_df) in enumerate(compare_df.groupby('city', observed=True, sort=False)):
+        fig.add_trace(_line(
+            city_df['time'],
+            city_df['temp'] * TEMPERATURE_SCALE,
+            gl,
+            traces=cities,
+            mode='lines',
+            name=city,
+            line=dict(color=PALETTE[idx % len(PALETTE)], width=3, shape='spline')
+        ))
+    fig.update_layout(
+        template=TEMPLATE,
+        title=dict(text="Temperature Comparison", font=dict(size=24), x=0.5),
+        xaxis_title="Date & Time",
+        yaxis_title="Temperature (°C)",
+        height=500
+    )
+    return fig
+
+
+def drift_figure(history, drift, place, runs=8):
+    """Forecast runs for the same slots (newest darkest) above the mean
+    change from the newest run per day of lead time."""
+    fig = make_subplots(rows=2, cols=1, row_heights=[0.65, 0.35], vertical_spacing=0.12,
+                        subplot_titles=('Forecast Runs', 'Mean Change vs Latest Run by Lead Time'))
+    fetches = sorted(history['fetched_at'].unique())[-runs:]
+    for age, fetched_at in enumerate(reversed(fetches)):
+        run = history[history['fetched_at'] == fetched_at]
+        latest = age == 0
+        fig.add_trace(_line(
+            run['time'],
+            run['temp'] * TEMPERATURE_SCALE,
+            _webgl(len(history)),
+            traces=len(fetches),
+            mode='lines',
+            name=run['fetched'].iloc[0].strftime('%b %d %H:%M'),
+            line=dict(color='#3b82f6' if latest else f'rgba(100,116,139,{0.75 - 0.6 * age / runs:.2f})',
+                      width=3 if latest else 1.5)
+        ), row=1, col=1)
+    fig.add_trace(go.Bar(x=[f"{int(days)}d" for days in drift.index], y=drift['mean'],
+                         customdata=drift['count'], marker_color='#f59e0b', showlegend=False,
+                         hovertemplate='%{y:.2f} °C over %{customdata} values<extra></extra>'),
+                  row=2, col=1)
+    fig.update_layout(
+        template=TEMPLATE,
+        title=dict(text=f"Forecast Drift - {place}", font=dict(size=24), x=0.5),
+        height=800,
+        legend_title_text='Fetched (UTC)'
+    )
+    fig.update_yaxes(title_text="Temperature (°C)", row=1, col=1)
+    fig.update_yaxes(title_text="Mean |change| (°C)", row=2, col=1)
+    return fig
+
+
+def map_figure(markers, cities, points, viewport):
+    """Temperature and condition per marker of a ``spatial.Markers`` query;
+    ``cities`` and ``points`` (``ForecastPoint`` or ``None``) are per marker
+    and clusters are sized by how many cities they stand for."""
+    west, south, east, north = viewport
+    has_data = np.array([point is not None for point in points], dtype=bool)
+    size = np.where(markers.count > 1, 10 + 4 * np.log2(np.maximum(markers.count, 1)), 9)
+    text = []
+    for city, point, count in zip(cities, points, markers.count):
+        name = f"{count:,} cities around {city.name}" if count > 1 else f"{city.name}, {city.country}"
+        weather = (f"{point.temp * TEMPERATURE_SCALE:.1f}°C · {point.condition}" if point is not None
+                   else "No forecast yet")
+        text.append(f"{name}<br>{weather}")
+    text = np.array(text, dtype=object)
+    fig = go.Figure()
+    fig.add_trace(go.Scattergeo(
+        lat=markers.lat[~has_data], lon=markers.lon[~has_data], text=text[~has_data], mode='markers',
+        marker=dict(size=size[~has_data], color='#cbd5e1', line=dict(width=0.5, color='white')),
+        hovertemplate='%{text}<extra></extra>'
+    ))
+    fig.add_trace(go.Scattergeo(
+        lat=markers.lat[has_data], lon=markers.lon[has_data], text=text[has_data], mode='markers',
+        marker=dict(size=size[has_data],
+                    color=[point.temp * TEMPERATURE_SCALE for point in points if point is not None],
+                    colorscale='RdYlBu_r', cmin=-20, cmax=40, colorbar=dict(title='°C'),
+                    line=dict(width=0.5, color='white')),
+        hovertemplate='%{text}<extra></extra>'
+    ))
+    fig.update_geos(
+        projection_type='equirectangular',
+        lonaxis_range=[west, east],
+        lataxis_range=[south, north],
+        showcountries=True, countrycolor=GRID_COLOR,
+        showland=True, landcolor='#f8fafc',
+        showocean=True, oceancolor='#e0f2fe',
+        showframe=False
+    )
+    fig.update_layout(
+        template=TEMPLATE,
+        title=dict(text="Regional Temperature", font=dict(size=24), x=0.5),
+        height=600,
+        margin=dict(l=0, r=0, t=60, b=0),
+        showlegend=False
+    )
+    return fig
+
+
+class FigureCache:
+    """LRU cache of built figures keyed by (place, days, view) and tagged
+    with the version of the forecast they were built from.
+
+    A lookup with the same version returns the cached figure as is. When
+    the version moved on and a ``refresh`` callable is given, a copy of the
+    cached figure gets its trace data swapped by ``refresh`` instead of
+    being rebuilt, so layout, template and annotations are reused. A
+    ``None`` version means the data is not tracked and the figure is built
+    without caching. Cached figures are shared between sessions and must
+    not be mutated by callers.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.refreshes = 0
+        self.builds = 0
+
+    def get(self, key, version, build, refresh=None):
+        if version is None:
+            self.builds += 1
+            return build()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry["version"] == version:
+                    self.hits += 1
+                    return entry["figure"]
+        if entry is not None and refresh is not None:
+            fig = go.Figure(entry["figure"])
+            refresh(fig)
+            self.refreshes += 1
+        else:
+            fig = build()
+            self.builds += 1
+        entry = {"version": version, "figure": fig, "bytes": len(fig.to_json())}
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fig
+
+    def size(self, key):
+        """Serialized JSON size in bytes of the cached figure for ``key``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry["bytes"] if entry is not None else None
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "refreshes": self.refreshes, "builds": self.builds,
+                    "size": len(self._entries)}
+
+
+figure_cache = FigureCache()
@@ -0,0 +1,221 @@
+"""Local forecast service shared by every dashboard process on the host.
+
+Each Streamlit worker process otherwise keeps its own forecast cache,
+upstream connection pool, coalescing and quota, so N workers fetch a
+popular place N times and each believes it has the whole call budget.
+This service owns all of them instead: dashboards started with
+``WEATHER_SERVICE_URL`` pointing here fetch through a thin
+``backend.ServiceSource``, which keeps its small in-process cache in front
+and falls back to fetching directly while the service is down.
+
+    python forecast_service.py --port 8765
+    WEATHER_SERVICE_URL=http://127.0.0.1:8765 streamlit run Main.py
+
+``POST /fetch`` takes ``{"worker", "priority", "queries": {label: query}}``
+with upstream queries as ``backend.resolve_place`` builds them and answers
+``{"results": {label: forecast}, "errors": {label: error}}``. ``GET
+/stats`` reports requests, cache hits and upstream calls per worker and in
+total, with the service's cache, coalescing and quota counters. The
+service reads the same ``WEATHER_*`` settings as the dashboard, e.g.
+``WEATHER_REPLAY_DIR`` to serve recorded responses. It is the only process
+saving forecasts to ``WEATHER_STORE_PATH`` and ``WEATHER_ARCHIVE_DIR``;
+dashboards behind it only read from them.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import backend
+
+_local = threading.local()
+
+
+class WorkerStats:
+    """Requests, cache hits and upstream calls per dashboard process."""
+
+    FIELDS = ("requests", "hits", "upstream", "errors")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = {}
+
+    def add(self, worker, **counts):
+        with self._lock:
+            stats = self._workers.setdefault(worker, dict.fromkeys(self.FIELDS, 0))
+            for name, count in counts.items():
+                stats[name] += count
+            stats["last_seen"] = time.time()
+
+    def stats(self):
+        with self._lock:
+            workers = {worker: dict(stats) for worker, stats in self._workers.items()}
+        total = {name: sum(stats[name] for stats in workers.values()) for name in self.FIELDS}
+        for stats in [*workers.values(), total]:
+            stats["hit_rate"] = stats["hits"] / stats["requests"] if stats["requests"] else 0.0
+        return workers, total
+
+
+worker_stats = WorkerStats()
+
+
+class MeteredSource(backend.ForecastSource):
+    """Counts the upstream calls ``source`` makes against the worker whose
+    request is being served on the calling thread."""
+
+    def __init__(self, source):
+        self.source = source
+        self.latencies = source.latencies
+
+    @property
+    def retries(self):
+        return self.source.retries
+
+    def _count(self, calls):
+        worker = getattr(_local, "worker", None)
+        if worker is not None:
+            worker_stats.add(worker, upstream=calls)
+
+    def admit(self, priority=backend.INTERACTIVE):
+        self.source.admit(priority)
+
+    def forecast(self, place=None, priority=backend.INTERACTIVE, **query):
+        self._count(1)
+        return self.source.forecast(place, priority=priority, **query)
+
+    def forecast_many(self, queries, concurrency=10, rate_per_host=20.0, priority=backend.INTERACTIVE):
+        self._count(len(queries))
+        return self.source.forecast_many(queries, concurrency=concurrency, rate_per_host=rate_per_host,
+                                         priority=priority)
+
+    def close(self):
+        self.source.close()
+
+
+def serve_queries(worker, queries, priority):
+    """Answer ``{label: query}`` from the shared cache, fetching the misses.
+
+    A single miss goes through ``backend._fetch_shared`` and several go out
+    together through ``backend.fetch_queries``; both coalesce in-flight
+    fetches, so workers asking for the same place at once share one
+    upstream call.
+    """
+    _local.worker = worker
+    try:
+        return _serve(worker, queries, priority)
+    finally:
+        _local.worker = None
+
+
+def _serve(worker, queries, priority):
+    keys = {label: backend.query_key(query) for label, query in queries.items()}
+    results, errors, misses = {}, {}, {}
+    for label, key in keys.items():
+        forecast = backend.forecast_cache.get(key)
+        if forecast is None:
+            forecast = backend._warm_from_store(key)
+        if forecast is not None:
+            results[label] = forecast
+        else:
+            misses[label] = key
+    if len(misses) == 1:
+        (label, key), = misses.items()
+        try:
+            results[label] = backend._fetch_shared(key, queries[label], priority)
+        except Exception as e:
+            errors[label] = e
+    elif misses:
+        fetched, fetch_errors = backend.fetch_queries({key: queries[label] for label, key in misses.items()},
+                                                      priority)
+        for label, key in misses.items():
+            if key in fetched:
+                results[label] = fetched[key]
+            else:
+                errors[label] = fetch_errors[key]
+    worker_stats.add(worker, requests=len(queries), hits=len(queries) - len(misses), errors=len(errors))
+    return results, errors
+
+
+def service_stats():
+    workers, total = worker_stats.stats()
+    return {
+        "workers": workers,
+        "total": total,
+        "cache": backend.cache_stats(),
+        "coalescing": backend.coalescing_stats(),
+        "quota": backend.quota_stats(),
+        "upstream": backend.get_client().latency_stats(),
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status, obj):
+        body = json.dumps(obj, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._reply(200, service_stats())
+        elif self.path == "/health":
+            self._reply(200, {"ok": True})
+        else:
+            self._reply(404, {"error": f"no such endpoint {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/fetch":
+            self._reply(404, {"error": f"no such endpoint {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            worker, queries = str(request["worker"]), request["queries"]
+            priority = int(request.get("priority", backend.INTERACTIVE))
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {"error": f"bad request: {e}"})
+            return
+        results, errors = serve_queries(worker, queries, priority)
+        self._reply(200, {"results": {label: forecast.to_json() for label, forecast in results.items()},
+                          "errors": {label: backend.encode_error(e) for label, e in errors.items()}})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host="127.0.0.1", port=8765):
+    """Bind the service, with the process-wide client wrapped for per-worker
+    accounting. Call ``serve_forever`` on the result."""
+    # The service fetches upstream itself rather than through another service
+    os.environ.pop("WEATHER_SERVICE_URL", None)
+    backend.set_client(MeteredSource(backend.get_client()))
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve forecasts to the dashboard processes on this host.")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port)
+    print(f"forecast service on http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
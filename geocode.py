@@ -0,0 +1,133 @@
+"""Offline geocoding index over an OpenWeatherMap city list.
+
+Load the index from OpenWeatherMap's ``city.list.json`` (optionally
+gzipped) or any JSON list of ``{"id", "name", "country", "coord": {"lat",
+"lon"}}`` records; an optional ``population`` field breaks ties between
+cities of the same name. Free-text places resolve to a canonical ``City``
+without a network call, tolerating case, accents, extra whitespace, a
+``", CC"`` country qualifier and small typos. Qualifiers are ISO 3166
+alpha-2 codes or one of the ``COUNTRY_ALIASES``; the city list carries no
+country names, so other spellings such as "Canada" are not recognised.
+Unknown places, and qualifiers no city of that name matches, raise
+``PlaceNotFound`` (a ``KeyError``, like an unknown ``q=`` upstream).
+"""
+import bisect
+import difflib
+import gzip
+import json
+import unicodedata
+from collections import namedtuple
+
+City = namedtuple("City", "id name country lat lon population")
+
+# Qualifiers people type that are not ISO 3166 alpha-2 codes
+COUNTRY_ALIASES = {
+    "uk": "GB", "u.k.": "GB", "great britain": "GB", "united kingdom": "GB",
+    "england": "GB", "scotland": "GB", "wales": "GB",
+    "usa": "US", "u.s.": "US", "u.s.a.": "US", "united states": "US",
+}
+
+
+class PlaceNotFound(KeyError):
+    def __init__(self, place, suggestions=()):
+        super().__init__(place)
+        self.place = place
+        self.suggestions = list(suggestions)
+
+
+def fold(name):
+    """Case-, accent- and whitespace-insensitive form of a place name."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.split()).casefold()
+
+
+def label(city):
+    return f"{city.name}, {city.country}" if city.country else city.name
+
+
+class GeoIndex:
+    def __init__(self, cities):
+        by_name = {}
+        for city in cities:
+            by_name.setdefault(fold(city.name), []).append(city)
+        for candidates in by_name.values():
+            candidates.sort(key=lambda city: -city.population)
+        self._by_name = by_name
+        self._names = sorted(by_name)
+        self._by_id = {city.id: city for candidates in by_name.values() for city in candidates}
+        # Fuzzy lookups scan a slice of the name list, so remember their outcome
+        self._fuzzy = {}
+
+    @classmethod
+    def load(cls, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            records = json.load(f)
+        return cls(
+            City(int(r["id"]), r["name"], r.get("country", ""), float(r["coord"]["lat"]),
+                 float(r["coord"]["lon"]), int(r.get("population") or 0))
+            for r in records if r.get("name")
+        )
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, city_id):
+        return self._by_id.get(city_id)
+
+    def cities(self):
+        return self._by_id.values()
+
+    def _prefix_range(self, prefix):
+        lo = bisect.bisect_left(self._names, prefix)
+        hi = bisect.bisect_left(self._names, prefix + "￿", lo)
+        return lo, hi
+
+    def _split(self, place):
+        name, _, qualifier = place.partition(",")
+        qualifier = fold(qualifier)
+        # An unrecognised qualifier stays as typed so it matches no city rather than being ignored
+        country = COUNTRY_ALIASES.get(qualifier, qualifier.upper()) if qualifier else None
+        return fold(name), country
+
+    def _pick(self, place, candidates, country):
+        if not country:
+            return candidates[0]
+        for city in candidates:
+            if city.country == country:
+                return city
+        raise PlaceNotFound(place, [label(city) for city in candidates[:8]])
+
+    def resolve(self, place):
+        name, country = self._split(place)
+        candidates = self._by_name.get(name)
+        if candidates is None:
+            match = self._fuzzy.get(name, "")
+            if match == "":
+                # Fuzzy match among names sharing the first two letters
+                lo, hi = self._prefix_range(name[:2])
+                close = difflib.get_close_matches(name, self._names[lo:hi], n=1, cutoff=0.8)
+                match = close[0] if close else None
+                if len(self._fuzzy) >= 4096:
+                    self._fuzzy.clear()
+                self._fuzzy[name] = match
+            if match is None:
+                raise PlaceNotFound(place, self.suggest(place))
+            candidates = self._by_name[match]
+        return self._pick(place, candidates, country)
+
+    def suggest(self, text, limit=8):
+        """Type-ahead labels for names starting with ``text``, most populous first."""
+        name, country = self._split(text)
+        if not name:
+            return []
+        lo, hi = self._prefix_range(name)
+        matches = [city for candidates in (self._by_name[n] for n in self._names[lo:hi])
+                   for city in candidates if not country or city.country == country]
+        if not matches and len(name) > 2:
+            close = difflib.get_close_matches(name, self._names[slice(*self._prefix_range(name[:2]))],
+                                              n=limit, cutoff=0.75)
+            matches = [city for n in close for city in self._by_name[n]]
+        matches.sort(key=lambda city: -city.population)
+        return [label(city) for city in matches[:limit]]
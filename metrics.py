@@ -0,0 +1,260 @@
+"""Vectorized forecast metrics.
+
+Conditions are handled as small integer codes into a sorted list of
+condition names (``backend.forecast_frame`` produces them that way), so
+"most frequent condition" is a ``bincount`` + ``argmax``. Ties go to the
+alphabetically first condition, matching ``Series.mode().iloc[0]``.
+
+``ForecastSummary`` and ``summary_cache`` keep per-day aggregates across
+forecast refreshes and recompute only the days a refresh touched. The
+dashboard reads its metrics from those alone; the array and frame
+functions summarize whole frames in one pass, for offline reports over
+many cities, and are the reference the summaries are checked against.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from backend import TEMPERATURE_SCALE, condition_name, diff_forecasts
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def encode_conditions(conditions):
+    """Return ``(codes, categories)`` for a sequence of condition names."""
+    categories, codes = np.unique(np.asarray(conditions, dtype=object), return_inverse=True)
+    return codes.astype(np.int8), list(categories)
+
+
+def dominant_condition(codes, categories):
+    counts = np.bincount(codes, minlength=len(categories))
+    return categories[int(counts.argmax())]
+
+
+def temperature_metrics(temperatures, codes, categories):
+    """Average, max and min temperature plus the dominant condition of one forecast."""
+    temperatures = np.asarray(temperatures, dtype=np.float64)
+    return {
+        "avg": float(temperatures.mean()),
+        "max": float(temperatures.max()),
+        "min": float(temperatures.min()),
+        "dominant": dominant_condition(codes, categories),
+    }
+
+
+def batch_metrics(temperatures, codes, categories):
+    """``temperature_metrics`` for many forecasts at once.
+
+    ``temperatures`` and ``codes`` are ``(cities, slots)`` arrays. Returns a
+    dict of per-city arrays; ``dominant`` holds condition names.
+    """
+    temperatures = np.asarray(temperatures, dtype=np.float64)
+    codes = np.asarray(codes)
+    cities, k = codes.shape[0], len(categories)
+    # Offset each row's codes so one bincount counts every city separately
+    offsets = (np.arange(cities) * k)[:, None]
+    counts = np.bincount((codes + offsets).ravel(), minlength=cities * k).reshape(cities, k)
+    return {
+        "avg": temperatures.mean(axis=1),
+        "max": temperatures.max(axis=1),
+        "min": temperatures.min(axis=1),
+        "dominant": np.asarray(categories, dtype=object)[counts.argmax(axis=1)],
+    }
+
+
+def daily_summary(dt, temperature, humidity, pressure, codes, categories):
+    """Per-day (UTC) mean/min/max temperature, mean humidity and pressure and
+    dominant condition. ``dt`` is epoch seconds in ascending order, as the
+    forecast API returns it.
+    """
+    dt = np.asarray(dt, dtype=np.int64)
+    temperature = np.asarray(temperature, dtype=np.float64)
+    days, starts, inverse = np.unique(dt // SECONDS_PER_DAY, return_index=True, return_inverse=True)
+    sizes = np.bincount(inverse)
+    k = len(categories)
+    counts = np.bincount(inverse * k + codes, minlength=len(days) * k).reshape(len(days), k)
+    return pd.DataFrame({
+        "temp_mean": np.bincount(inverse, weights=temperature) / sizes,
+        "temp_min": np.minimum.reduceat(temperature, starts),
+        "temp_max": np.maximum.reduceat(temperature, starts),
+        "humidity_mean": np.bincount(inverse, weights=humidity) / sizes,
+        "pressure_mean": np.bincount(inverse, weights=pressure) / sizes,
+        "condition": np.asarray(categories, dtype=object)[counts.argmax(axis=1)],
+    }, index=pd.Index(pd.to_datetime(days * SECONDS_PER_DAY, unit="s").date, name="date"))
+
+
+def frame_metrics(frame, temperature="temperature"):
+    codes = frame["condition"].cat.codes.to_numpy()
+    categories = list(frame["condition"].cat.categories)
+    return temperature_metrics(frame[temperature].to_numpy(), codes, categories)
+
+
+def frame_daily_summary(frame, temperature="temperature"):
+    return daily_summary(
+        frame["dt"].to_numpy(),
+        frame[temperature].to_numpy(),
+        frame["humidity"].to_numpy(np.float64),
+        frame["pressure"].to_numpy(np.float64),
+        frame["condition"].cat.codes.to_numpy(),
+        list(frame["condition"].cat.categories),
+    )
+
+
+def forecast_drift(history, temperature_scale=TEMPERATURE_SCALE):
+    """How far earlier forecasts were from the latest one for the same slot.
+
+    ``history`` is ``backend.forecast_history`` output. Each archived value
+    is compared with the newest fetch of its slot, the best stand-in for
+    what actually happened. Returns the mean absolute temperature change
+    and the number of values per whole day of lead time (slot time minus
+    fetch time).
+    """
+    by_slot = history.groupby("dt")
+    newest = by_slot["fetched_at"].transform("max")
+    latest_temp = history["temp"].where(history["fetched_at"] == newest).groupby(history["dt"]).transform("max")
+    earlier = history["fetched_at"] < newest
+    return pd.DataFrame({
+        "lead_days": ((history["dt"] - history["fetched_at"]) // SECONDS_PER_DAY)[earlier],
+        "change": ((history["temp"] - latest_temp).abs() * temperature_scale)[earlier],
+    }).groupby("lead_days")["change"].agg(["mean", "count"])
+
+
+def _group_days(forecast, only=None):
+    groups = {}
+    for i, dt in enumerate(forecast.dt):
+        day = dt // SECONDS_PER_DAY
+        if only is None or day in only:
+            groups.setdefault(day, []).append(i)
+    return groups
+
+
+# Per-day sums and extremes a summary is built from; ``conditions`` maps
+# interned condition codes to slot counts
+DayAggregate = namedtuple("DayAggregate", "slots temp_sum temp_min temp_max humidity_sum pressure_sum conditions")
+
+
+def _day_aggregate(forecast, indices, scale):
+    # A day holds at most 8 slots, too few for numpy's per-call overhead to pay off
+    temperatures = [forecast.temp[i] * scale for i in indices]
+    counts = {}
+    for i in indices:
+        code = forecast.condition[i]
+        counts[code] = counts.get(code, 0) + 1
+    return DayAggregate(len(indices), sum(temperatures), min(temperatures), max(temperatures),
+                        sum(forecast.humidity[i] for i in indices), sum(forecast.pressure[i] for i in indices),
+                        counts)
+
+
+def _dominant(counts):
+    return condition_name(min(counts, key=lambda code: (-counts[code], condition_name(code))))
+
+
+class ForecastSummary:
+    """Per-day (UTC) aggregates of a ``backend.Forecast``, giving the same
+    numbers as ``daily_summary`` and ``temperature_metrics``.
+
+    ``refreshed`` carries the summary over to a newer forecast of the same
+    place, recomputing only the days that hold added, dropped or changed
+    slots. Temperatures are multiplied by ``scale``. Summaries are shared
+    between sessions and never modified after construction.
+    """
+
+    def __init__(self, forecast, scale=1.0, days=None):
+        self.forecast = forecast
+        self.scale = scale
+        if days is None:
+            days = {day: _day_aggregate(forecast, indices, scale)
+                    for day, indices in _group_days(forecast).items()}
+        self.days = days
+
+    def refreshed(self, forecast, diff=None):
+        diff = diff or diff_forecasts(self.forecast, forecast)
+        touched = {dt // SECONDS_PER_DAY for dt in diff.added + diff.dropped + diff.changed}
+        days = {day: aggregate for day, aggregate in self.days.items() if day not in touched}
+        for day, indices in _group_days(forecast, touched).items():
+            days[day] = _day_aggregate(forecast, indices, self.scale)
+        return ForecastSummary(forecast, self.scale, dict(sorted(days.items())))
+
+    def metrics(self):
+        """Like ``temperature_metrics`` for the whole forecast."""
+        aggregates = self.days.values()
+        counts = {}
+        for aggregate in aggregates:
+            for code, n in aggregate.conditions.items():
+                counts[code] = counts.get(code, 0) + n
+        return {
+            "avg": sum(a.temp_sum for a in aggregates) / sum(a.slots for a in aggregates),
+            "max": max(a.temp_max for a in aggregates),
+            "min": min(a.temp_min for a in aggregates),
+            "dominant": _dominant(counts),
+        }
+
+    def daily(self):
+        """Like ``daily_summary``: one row per day, indexed by date."""
+        days = np.fromiter(self.days, dtype=np.int64, count=len(self.days))
+        rows = list(self.days.values())
+        return pd.DataFrame({
+            "temp_mean": [a.temp_sum / a.slots for a in rows],
+            "temp_min": [a.temp_min for a in rows],
+            "temp_max": [a.temp_max for a in rows],
+            "humidity_mean": [a.humidity_sum / a.slots for a in rows],
+            "pressure_mean": [a.pressure_sum / a.slots for a in rows],
+            "condition": [_dominant(a.conditions) for a in rows],
+        }, index=pd.Index(pd.to_datetime(days * SECONDS_PER_DAY, unit="s").date, name="date"))
+
+
+class SummaryCache:
+    """``ForecastSummary`` objects keyed like ``charts.FigureCache`` and
+    tagged with the forecast version they describe. A newer version is
+    folded into the cached summary with ``refreshed`` instead of being
+    summarized from scratch; a ``None`` version is summarized uncached, and
+    so is one older than the cached version, so a session still showing an
+    earlier forecast never pins the entry back to it.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.updates = 0
+        self.builds = 0
+
+    def get(self, key, version, forecast, scale=1.0):
+        if version is None:
+            self.builds += 1
+            return ForecastSummary(forecast, scale)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry[0] == version:
+                    self.hits += 1
+                    return entry[1]
+        if entry is not None and entry[0] > version:
+            self.builds += 1
+            return ForecastSummary(forecast, scale)
+        if entry is not None and entry[1].scale == scale:
+            summary = entry[1].refreshed(forecast)
+            self.updates += 1
+        else:
+            summary = ForecastSummary(forecast, scale)
+            self.builds += 1
+        with self._lock:
+            # Another session may have stored a newer version meanwhile
+            current = self._entries.get(key)
+            if current is None or current[0] < version:
+                self._entries[key] = (version, summary)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return summary
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "updates": self.updates, "builds": self.builds,
+                    "size": len(self._entries)}
+
+
+summary_cache = SummaryCache()
@@ -0,0 +1,100 @@
+"""Grid pyramid over city coordinates for map viewport queries.
+
+Level ``z`` cuts the globe into square cells ``180 / 2**z`` degrees wide.
+Each level keeps the cities sorted by cell, so a cell's members are one
+slice, plus the count, centroid and most populous city of every
+non-empty cell. A viewport query picks the finest level at which the
+viewport spans at most ``max_markers`` cells and finds those cells with
+one binary search per grid row. It returns the individual cities when
+there are few enough, otherwise one cluster per cell, so its cost
+follows the markers returned rather than the number of cities indexed.
+
+    grid = CityGrid(geo_index.cities())
+    markers = grid.query(west=-10, south=35, east=30, north=60)
+"""
+from collections import namedtuple
+
+import numpy as np
+
+MAX_ZOOM = 14
+
+# ``city`` indexes ``CityGrid.cities``; for clusters it is the most populous
+# city of the cell and ``lat``/``lon`` are the cell's centroid
+Markers = namedtuple("Markers", "zoom clustered city lat lon count")
+
+
+class _Level:
+    __slots__ = ("cell", "columns", "keys", "starts", "counts", "lat", "lon", "top", "order")
+
+
+class CityGrid:
+    def __init__(self, cities, max_zoom=MAX_ZOOM):
+        self.cities = list(cities)
+        self.lat = np.array([city.lat for city in self.cities], dtype=np.float64)
+        self.lon = np.array([city.lon for city in self.cities], dtype=np.float64)
+        population = np.array([city.population for city in self.cities], dtype=np.int64)
+        by_population = np.argsort(-population, kind="stable")
+        self.levels = [self._level(zoom, by_population) for zoom in range(max_zoom + 1)]
+
+    def __len__(self):
+        return len(self.cities)
+
+    def _cell(self, level, lat, lon):
+        rows = np.minimum(((np.asarray(lat) + 90) // level.cell).astype(np.int64), level.columns // 2 - 1)
+        columns = np.minimum(((np.asarray(lon) + 180) // level.cell).astype(np.int64), level.columns - 1)
+        return np.maximum(rows, 0), np.maximum(columns, 0)
+
+    def _level(self, zoom, by_population):
+        level = _Level()
+        level.cell = 180.0 / 2 ** zoom
+        level.columns = 2 ** (zoom + 1)
+        rows, columns = self._cell(level, self.lat[by_population], self.lon[by_population])
+        keys = rows * level.columns + columns
+        # A stable sort keeps the most populous city first in each cell
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        order = by_population[order].astype(np.int32)
+        level.starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else \
+            np.empty(0, np.int64)
+        level.keys = keys[level.starts]
+        level.counts = np.diff(np.append(level.starts, len(keys)))
+        level.order = order
+        if len(order):
+            level.lat = np.add.reduceat(self.lat[order], level.starts) / level.counts
+            level.lon = np.add.reduceat(self.lon[order], level.starts) / level.counts
+        else:
+            level.lat = level.lon = np.empty(0)
+        level.top = order[level.starts]
+        return level
+
+    def zoom_for(self, west, south, east, north, max_markers):
+        """Finest level at which the viewport spans at most ``max_markers`` cells."""
+        for zoom in range(len(self.levels) - 1, 0, -1):
+            cell = self.levels[zoom].cell
+            if (np.floor(east / cell) - np.floor(west / cell) + 1) * \
+                    (np.floor(north / cell) - np.floor(south / cell) + 1) <= max_markers:
+                return zoom
+        return 0
+
+    def _cells(self, level, west, south, east, north):
+        (row0, row1), (col0, col1) = self._cell(level, [south, north], [west, east])
+        rows = np.arange(row0, row1 + 1, dtype=np.int64) * level.columns
+        lo = np.searchsorted(level.keys, rows + col0, side="left")
+        hi = np.searchsorted(level.keys, rows + col1, side="right")
+        return np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)]) if len(rows) else np.empty(0, int)
+
+    def query(self, west, south, east, north, max_markers=200):
+        """Markers for the viewport ``[west, east] x [south, north]`` (degrees)."""
+        west, east = max(min(west, east), -180.0), min(max(west, east), 180.0)
+        south, north = max(min(south, north), -90.0), min(max(south, north), 90.0)
+        zoom = self.zoom_for(west, south, east, north, max_markers)
+        level = self.levels[zoom]
+        cells = self._cells(level, west, south, east, north).astype(np.int64)
+        if level.counts[cells].sum() <= max_markers:
+            members = np.concatenate([level.order[level.starts[i]:level.starts[i] + level.counts[i]]
+                                      for i in cells]) if len(cells) else np.empty(0, np.int32)
+            lat, lon = self.lat[members], self.lon[members]
+            inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+            members = members[inside]
+            return Markers(zoom, False, members, lat[inside], lon[inside], np.ones(len(members), np.int64))
+        return Markers(zoom, True, level.top[cells], level.lat[cells], level.lon[cells], level.counts[cells])
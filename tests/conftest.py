@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The stub server answers with the benchmarks' synthetic payloads
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+os.environ.setdefault("WEATHER_PREFETCH", "0")
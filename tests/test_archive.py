@@ -0,0 +1,41 @@
+"""ForecastArchive."""
+import numpy as np
+
+from archive import ForecastArchive
+from backend import Forecast
+from payloads import forecast_payload
+
+START = 19675 * 24 * 60 * 60  # midnight UTC, so 16 three-hour slots span two days
+
+
+def forecast(conditions, slots=16, seed=0):
+    records = forecast_payload(slots=slots, start=START, seed=seed)["list"]
+    for i, record in enumerate(records):
+        record["weather"][0]["main"] = conditions[i % len(conditions)]
+    return Forecast.from_records(records)
+
+
+def test_archive_round_trip(tmp_path):
+    archive = ForecastArchive(str(tmp_path))
+    fetched = forecast(["Clear", "Rain", "Snow"])
+    archive.append("london", fetched, fetched_at=START - 60)
+    frame = archive.frame("london", START, START + 16 * 10800)
+    assert len(frame) == 16 and len(archive.partitions()) == 2
+    assert list(frame["dt"]) == list(fetched.dt)
+    assert np.allclose(frame["temp"], np.frombuffer(fetched.temp, dtype=np.float32))
+    assert list(frame["condition"]) == fetched.conditions()
+    assert archive.query("paris", START, START + 16 * 10800).size == 0
+
+
+def test_archive_writers_share_condition_codes(tmp_path):
+    first, second = ForecastArchive(str(tmp_path)), ForecastArchive(str(tmp_path))
+    first.append("london", forecast(["Clear", "Rain"]), fetched_at=START - 120)
+    second.append("tokyo", forecast(["Snow", "Mist"], seed=1), fetched_at=START - 60)
+    first.append("tokyo", forecast(["Rain", "Snow"], seed=2), fetched_at=START)
+    end = START + 16 * 10800
+    for reader in (first, second, ForecastArchive(str(tmp_path))):
+        assert set(reader.frame("london", START, end)["condition"]) == {"Clear", "Rain"}
+        tokyo = reader.frame("tokyo", START, end)
+        assert set(tokyo[tokyo["fetched_at"] == START - 60]["condition"]) == {"Snow", "Mist"}
+        assert set(tokyo[tokyo["fetched_at"] == START]["condition"]) == {"Rain", "Snow"}
+    assert first.conditions == second.conditions == ["Clear", "Rain", "Snow", "Mist"]
@@ -0,0 +1,53 @@
+"""ForecastCache."""
+import backend
+from backend import ForecastCache
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_expires_after_ttl():
+    clock = Clock(0.0)
+    cache = ForecastCache(ttl=60, align=False, clock=clock)
+    cache.put("london", "forecast")
+    clock.now = 59
+    assert cache.get("london") == "forecast"
+    clock.now = 60
+    assert cache.get("london") is None
+    assert cache.get_stale("london") == ("forecast", False, cache.version("london"))
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_cache_expires_at_forecast_boundary():
+    clock = Clock(backend.FORECAST_CADENCE - 10)
+    cache = ForecastCache(ttl=3600, clock=clock)
+    cache.put("london", "forecast")
+    clock.now = backend.FORECAST_CADENCE
+    assert cache.get("london") is None
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ForecastCache(max_entries=2, clock=Clock())
+    cache.put("london", 1)
+    cache.put("tokyo", 2)
+    cache.get("london")
+    cache.put("paris", 3)
+    assert cache.peek("tokyo") is None
+    assert cache.peek("london") == 1 and cache.peek("paris") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_version_belongs_to_the_value():
+    cache = ForecastCache(clock=Clock())
+    old, new = object(), object()
+    cache.put("london", old)
+    version = cache.version("london")
+    cache.put("london", new)
+    assert cache.version("london") != version
+    assert cache.version("london", old) is None
+    assert cache.version("london", new) == cache.version("london")
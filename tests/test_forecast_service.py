@@ -0,0 +1,72 @@
+"""forecast_service behind backend.ServiceSource."""
+import json
+import threading
+
+import pytest
+
+import backend
+import forecast_service
+from payloads import forecast_payload
+
+
+class NoDirect(backend.ForecastSource):
+    """Fallback that fails the test if the service was not used."""
+
+    def admit(self, priority=backend.INTERACTIVE):
+        pass
+
+    def forecast(self, place=None, priority=backend.INTERACTIVE, **query):
+        raise AssertionError("fetched directly")
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    for city in ("London", "Paris", "Tokyo"):
+        (tmp_path / backend.fixture_name({"q": city})).write_text(json.dumps(forecast_payload(city)))
+    replay = backend.ReplaySource(str(tmp_path), latency=0.05)
+    for name, value in [("_client", replay), ("forecast_cache", backend.ForecastCache()),
+                        ("_flights", backend.SingleFlight()), ("_store", None), ("_archive", None),
+                        ("quota", backend.QuotaGovernor(per_minute=None, per_day=None))]:
+        monkeypatch.setattr(backend, name, value)
+    monkeypatch.setattr(forecast_service, "worker_stats", forecast_service.WorkerStats())
+    monkeypatch.delenv("WEATHER_SERVICE_URL", raising=False)
+    server = forecast_service.make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield lambda worker: backend.ServiceSource(url, NoDirect(), worker=worker)
+    server.shutdown()
+    server.server_close()
+
+
+def test_workers_share_one_upstream_fetch(service):
+    workers = [service(f"worker {i}") for i in range(4)]
+    results = [None] * len(workers)
+
+    def fetch(i):
+        results[i] = workers[i].forecast("London")
+
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(len(workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert all(result.to_json() == results[0].to_json() for result in results)
+    stats = workers[0].service_stats()
+    assert stats["total"]["requests"] == 4 and stats["total"]["upstream"] == 1
+    assert set(stats["workers"]) == {f"worker {i}" for i in range(4)}
+
+
+def test_batches_report_errors_per_place(service):
+    worker = service("batch")
+    results, errors = worker.forecast_many({"a": {"q": "Paris"}, "b": {"q": "Tokyo"}, "c": {"q": "Atlantis"}})
+    assert set(results) == {"a", "b"} and isinstance(errors["c"], KeyError)
+    with pytest.raises(KeyError):
+        worker.forecast("Atlantis")
+    assert worker.service_stats()["workers"]["batch"]["errors"] == 2
+
+
+def test_falls_back_to_direct_fetches_while_the_service_is_down(tmp_path):
+    (tmp_path / backend.fixture_name({"q": "London"})).write_text(json.dumps(forecast_payload()))
+    source = backend.ServiceSource("http://127.0.0.1:9", backend.ReplaySource(str(tmp_path)), retry_interval=60)
+    assert len(source.forecast("London")) == 40
+    assert source.fallbacks == 1 and source.service_stats() is None
@@ -0,0 +1,64 @@
+"""ForecastStore."""
+import pytest
+
+from backend import Forecast, ForecastCache, ForecastStore
+from payloads import forecast_payload
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def forecast(seed=0):
+    return Forecast.from_records(forecast_payload(seed=seed)["list"])
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    store = ForecastStore(str(tmp_path / "forecasts.db"), compact_every=1000,
+                          cache=ForecastCache(ttl=600, align=False, clock=clock))
+    store.schedule_compaction().result()
+    yield store
+    store.close()
+
+
+def test_store_loads_the_newest_fresh_forecast(store, clock):
+    store.save("london", forecast(0), clock.now - 60)
+    store.save("london", forecast(1), clock.now - 30)
+    loaded, fetched_at = store.load("london")
+    assert fetched_at == clock.now - 30
+    assert loaded.to_json() == forecast(1).to_json()
+    assert store.load("tokyo") == (None, None)
+    clock.now += 600
+    assert store.load("london") == (None, None)
+    assert store.stats()["hits"] == 1 and store.stats()["misses"] == 2
+
+
+def test_compaction_drops_expired_and_superseded_rows(store, clock):
+    store.save("london", forecast(0), clock.now - 900)
+    store.save("paris", forecast(1), clock.now - 120)
+    store.save("paris", forecast(2), clock.now - 60)
+    store.save("tokyo", forecast(3), clock.now - 30)
+    store.schedule_compaction().result()
+    assert store.stats()["rows"] == 2
+    assert store.load("paris")[1] == clock.now - 60
+
+
+def test_compaction_trims_the_oldest_rows_to_fit(store, clock):
+    for i in range(50):
+        store.save(f"place-{i}", forecast(i), clock.now - 100 + i)
+    store.max_bytes = store.stats()["bytes"] // 2
+    store.schedule_compaction().result()
+    stats = store.stats()
+    assert stats["bytes"] <= store.max_bytes and 0 < stats["rows"] < 50
+    # The newest fetches are the ones kept
+    assert store.load("place-49")[0] is not None and store.load("place-0") == (None, None)
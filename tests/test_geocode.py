@@ -0,0 +1,48 @@
+"""GeoIndex."""
+import pytest
+
+from geocode import City, GeoIndex, PlaceNotFound
+
+
+@pytest.fixture
+def index():
+    return GeoIndex([
+        City(2643743, "London", "GB", 51.51, -0.13, 8_900_000),
+        City(6058560, "London", "CA", 42.98, -81.23, 380_000),
+        City(2988507, "Paris", "FR", 48.85, 2.35, 2_100_000),
+        City(4717560, "Paris", "US", 33.66, -95.56, 25_000),
+        City(2950159, "Berlin", "DE", 52.52, 13.41, 3_600_000),
+        City(3117735, "Málaga", "ES", 36.72, -4.42, 570_000),
+    ])
+
+
+def test_resolve_prefers_the_most_populous_city(index):
+    assert index.resolve("London").id == 2643743
+    assert index.resolve("  paris ").country == "FR"
+
+
+def test_resolve_tolerates_accents_and_typos(index):
+    assert index.resolve("malaga").id == 3117735
+    assert index.resolve("Berlinn").id == 2950159
+
+
+def test_resolve_honours_country_qualifiers(index):
+    assert index.resolve("London, CA").id == 6058560
+    assert index.resolve("Paris, usa").country == "US"
+    assert index.resolve("London, England").id == 2643743
+
+
+@pytest.mark.parametrize("place", ["London, FR", "London, Canada"])
+def test_unmatched_qualifier_raises_with_the_cities_of_that_name(index, place):
+    with pytest.raises(PlaceNotFound) as missing:
+        index.resolve(place)
+    assert missing.value.place == place
+    assert missing.value.suggestions == ["London, GB", "London, CA"]
+
+
+def test_unknown_place_raises_with_suggestions(index):
+    with pytest.raises(PlaceNotFound) as missing:
+        index.resolve("Atlantis")
+    assert missing.value.suggestions == []
+    assert index.suggest("par") == ["Paris, FR", "Paris, US"]
+    assert index.suggest("par, us") == ["Paris, US"]
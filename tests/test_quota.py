@@ -0,0 +1,57 @@
+"""QuotaGovernor."""
+import time
+
+import pytest
+
+from backend import BACKGROUND, BATCH, INTERACTIVE, QuotaExceeded, QuotaGovernor
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_quota_keeps_reserve_for_interactive_fetches():
+    governor = QuotaGovernor(per_minute=10, per_day=None, clock=Clock())
+    for _ in range(8):
+        governor.acquire(BACKGROUND)
+    with pytest.raises(QuotaExceeded):
+        governor.acquire(BACKGROUND)
+    governor.acquire(INTERACTIVE)
+    governor.acquire(INTERACTIVE)
+    with pytest.raises(QuotaExceeded) as shed:
+        governor.acquire(INTERACTIVE)
+    assert shed.value.priority == INTERACTIVE and shed.value.retry_after > 0
+    classes = governor.stats()["classes"]
+    assert classes["background"]["admitted"] == 8 and classes["background"]["shed"] == 1
+    assert classes["interactive"]["admitted"] == 2 and classes["interactive"]["shed"] == 1
+
+
+def test_quota_refills_over_time():
+    clock = Clock()
+    governor = QuotaGovernor(per_minute=10, per_day=None, clock=clock)
+    for _ in range(10):
+        governor.acquire(INTERACTIVE)
+    clock.now += 60
+    assert governor.stats()["minute"] == 10
+    governor.acquire(BATCH)
+
+
+def test_quota_waits_when_a_token_arrives_in_time():
+    governor = QuotaGovernor(per_minute=600, per_day=None, policies={INTERACTIVE: (0.0, 1.0)})
+    for _ in range(600):
+        governor.acquire(INTERACTIVE)
+    start = time.monotonic()
+    governor.acquire(INTERACTIVE)
+    assert 0.05 <= time.monotonic() - start < 1.0
+    assert governor.stats()["classes"]["interactive"]["queued"] == 1
+
+
+def test_quota_without_limits_admits_everything():
+    governor = QuotaGovernor(per_minute=None, per_day=None)
+    for _ in range(1000):
+        governor.acquire(BACKGROUND)
+    assert governor.stats()["classes"]["background"]["admitted"] == 1000
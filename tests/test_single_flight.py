@@ -0,0 +1,155 @@
+"""SingleFlight and the fetch paths coalescing through it."""
+import threading
+import time
+
+import backend
+from backend import BATCH, INTERACTIVE, ForecastCache, QuotaExceeded, SingleFlight
+
+
+def run_concurrently(n, fn):
+    results, errors = [None] * n, [None] * n
+
+    def run(i):
+        try:
+            results[i] = fn(i)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results, errors
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    flights, release, calls = SingleFlight(), threading.Event(), []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "forecast"
+
+    def call(i):
+        return flights.do("london", fetch)
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    results, errors = run_concurrently(8, call)
+    assert results == ["forecast"] * 8 and errors == [None] * 8
+    assert len(calls) == 1
+    assert flights.stats() == {"calls": 8, "upstream": 1, "coalesced": 7, "in_flight": 0}
+
+
+def test_single_flight_shares_errors_and_forgets_the_key():
+    flights, release = SingleFlight(), threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise KeyError("nowhere")
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    _, errors = run_concurrently(4, lambda i: flights.do("nowhere", fail))
+    assert all(isinstance(e, KeyError) for e in errors)
+    assert flights.do("nowhere", lambda: "found") == "found"
+
+
+def test_do_many_waits_for_keys_already_in_flight():
+    flights, started, release = SingleFlight(), threading.Event(), threading.Event()
+    batches = []
+
+    def single():
+        started.set()
+        release.wait(5)
+        return "london"
+
+    def batch(keys):
+        batches.append(sorted(keys))
+        return {key: key for key in keys if key != "nowhere"}, {}
+
+    thread = threading.Thread(target=flights.do, args=("london", single))
+    thread.start()
+    started.wait(5)
+    threading.Timer(0.2, release.set).start()
+    results, errors = flights.do_many(["london", "tokyo", "nowhere"], batch)
+    thread.join(5)
+    assert batches == [["nowhere", "tokyo"]]
+    assert results == {"london": "london", "tokyo": "tokyo"}
+    assert isinstance(errors["nowhere"], KeyError)
+    assert flights.stats()["coalesced"] == 1
+
+
+def test_urgent_caller_does_not_wait_on_a_lower_priority_flight():
+    flights, release = SingleFlight(), threading.Event()
+    batch = threading.Thread(target=flights.do, args=("london", lambda: release.wait(5) and "batch", BATCH))
+    batch.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    assert flights.do("london", lambda: "interactive", INTERACTIVE) == "interactive"
+    assert time.monotonic() - start < 1
+    release.set()
+    batch.join(5)
+    assert flights.stats()["coalesced"] == 0
+
+
+def test_callers_do_not_wait_on_a_call_still_being_admitted():
+    flights, admitting, release = SingleFlight(), threading.Event(), threading.Event()
+
+    def admit():
+        admitting.set()
+        release.wait(5)
+
+    slow = threading.Thread(target=flights.do, args=("london", lambda: "slow", INTERACTIVE, admit))
+    slow.start()
+    admitting.wait(5)
+    assert flights.do("london", lambda: "fast", INTERACTIVE) == "fast"
+    release.set()
+    slow.join(5)
+
+
+def test_shed_admission_registers_nothing():
+    flights = SingleFlight()
+
+    def shed(keys):
+        return [], {key: QuotaExceeded(BATCH, 30) for key in keys}
+
+    results, errors = flights.do_many(["london"], lambda keys: ({}, {}), BATCH, shed)
+    assert results == {} and isinstance(errors["london"], QuotaExceeded)
+    assert flights.stats()["in_flight"] == 0
+
+
+class StalledSource(backend.ForecastSource):
+    """Holds every fetch until ``release`` is set, then sheds it."""
+
+    def __init__(self):
+        super().__init__()
+        self.started, self.release = threading.Event(), threading.Event()
+
+    def admit(self, priority=INTERACTIVE):
+        pass
+
+    def forecast(self, place=None, priority=INTERACTIVE, **query):
+        self.started.set()
+        self.release.wait(5)
+        raise QuotaExceeded(priority, 30)
+
+
+def test_follower_falls_back_to_stale_at_its_own_priority(monkeypatch):
+    cache = ForecastCache()
+    cache.put("london", "stale forecast", fetched_at=0)
+    source = StalledSource()
+    monkeypatch.setattr(backend, "forecast_cache", cache)
+    monkeypatch.setattr(backend, "_client", source)
+    flights = SingleFlight()
+    monkeypatch.setattr(backend, "_flights", flights)
+    # A background refresh leads and, having no stale fallback, fails when shed
+    leader = threading.Thread(target=run_concurrently, args=(1, lambda i: backend._fetch_shared(
+        "london", {"q": "London"}, backend.BACKGROUND)))
+    leader.start()
+    source.started.wait(5)
+    threading.Timer(0.1, source.release.set).start()
+    assert backend._fetch_shared("london", {"q": "London"}, BATCH) == "stale forecast"
+    leader.join(5)
+    assert flights.stats()["coalesced"] == 1
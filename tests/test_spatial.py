@@ -0,0 +1,52 @@
+"""CityGrid viewport queries against a brute-force scan."""
+import random
+
+import numpy as np
+import pytest
+
+from geocode import City
+from spatial import CityGrid
+
+
+@pytest.fixture(scope="module")
+def grid():
+    rng = random.Random(0)
+    return CityGrid(City(i, f"City {i}", "", rng.uniform(-60, 70), rng.uniform(-180, 180), rng.randint(0, 10**6))
+                    for i in range(5000))
+
+
+def inside(grid, west, south, east, north):
+    return np.flatnonzero((grid.lat >= south) & (grid.lat <= north) & (grid.lon >= west) & (grid.lon <= east))
+
+
+def test_small_viewport_returns_every_city_inside(grid):
+    markers = grid.query(west=10, south=40, east=14, north=44)
+    assert not markers.clustered
+    assert sorted(markers.city) == list(inside(grid, 10, 40, 14, 44))
+    assert markers.count.sum() == len(markers.city)
+
+
+def test_large_viewport_clusters_cover_every_city_once(grid):
+    markers = grid.query(west=-180, south=-90, east=180, north=90, max_markers=50)
+    assert markers.clustered and len(markers.city) <= 50
+    assert markers.count.sum() == len(grid)
+    # Each cluster is labelled with its most populous city
+    level = grid.levels[markers.zoom]
+    rows, columns = grid._cell(level, grid.lat, grid.lon)
+    cells = rows * level.columns + columns
+    for top, count in zip(markers.city, markers.count):
+        members = np.flatnonzero(cells == cells[top])
+        assert len(members) == count
+        assert grid.cities[top].population == max(grid.cities[i].population for i in members)
+
+
+def test_swapped_and_out_of_range_bounds_are_normalised(grid):
+    markers = grid.query(west=14, south=44, east=10, north=40)
+    assert sorted(markers.city) == list(inside(grid, 10, 40, 14, 44))
+    assert grid.query(-500, -100, 500, 100, max_markers=50).count.sum() == len(grid)
+
+
+def test_empty_grid_and_empty_viewport():
+    empty = CityGrid([])
+    assert len(empty.query(-10, -10, 10, 10).city) == 0
+    assert len(CityGrid([City(1, "A", "", 0.0, 0.0, 1)]).query(50, 50, 60, 60).city) == 0
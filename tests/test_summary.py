@@ -0,0 +1,59 @@
+"""ForecastSummary and SummaryCache against the full-frame metrics."""
+import random
+
+import numpy as np
+import pytest
+
+from backend import Forecast, forecast_frame
+from metrics import ForecastSummary, SummaryCache, frame_daily_summary, frame_metrics
+from payloads import forecast_payload
+
+SCALE = 0.5
+
+
+def next_cycle(records, seed):
+    """The following fetch: shifted one slot, with a few revised slots."""
+    rng = random.Random(seed)
+    shifted = forecast_payload(slots=len(records) + 1, start=records[0]["dt"], seed=seed)["list"]
+    records = [dict(d) for d in records[1:]] + [shifted[-1]]
+    for i in rng.sample(range(len(records) - 1), 3):
+        records[i] = dict(records[i], main=dict(records[i]["main"], temp=records[i]["main"]["temp"] + 1),
+                          weather=[dict(records[i]["weather"][0], main="Snow")])
+    return records
+
+
+def assert_matches_full_frame(summary, forecast):
+    df = forecast_frame(forecast)
+    df["temperature"] = df["temp"] * SCALE
+    daily, incremental = frame_daily_summary(df), summary.daily()
+    assert list(incremental.index) == list(daily.index)
+    assert list(incremental["condition"]) == list(daily["condition"])
+    assert np.allclose(incremental.drop(columns="condition").to_numpy(float),
+                       daily.drop(columns="condition").to_numpy(float), atol=1e-4)
+    metrics, expected = summary.metrics(), frame_metrics(df)
+    assert metrics["dominant"] == expected["dominant"]
+    assert metrics["avg"] == pytest.approx(expected["avg"], abs=1e-4)
+    assert (metrics["min"], metrics["max"]) == pytest.approx((expected["min"], expected["max"]), abs=1e-4)
+
+
+def test_refreshed_summary_matches_a_full_rebuild():
+    records = forecast_payload(seed=1)["list"]
+    summary = ForecastSummary(Forecast.from_records(records), SCALE)
+    assert_matches_full_frame(summary, summary.forecast)
+    for cycle in range(8):
+        records = next_cycle(records, cycle)
+        forecast = Forecast.from_records(records)
+        summary = summary.refreshed(forecast)
+        assert_matches_full_frame(summary, forecast)
+
+
+def test_summary_cache_refreshes_newer_versions_only():
+    cache = SummaryCache()
+    first = Forecast.from_records(forecast_payload(seed=1)["list"])
+    second = Forecast.from_records(next_cycle(forecast_payload(seed=1)["list"], 0))
+    assert cache.get("london", 1, first, SCALE) is cache.get("london", 1, first, SCALE)
+    assert_matches_full_frame(cache.get("london", 2, second, SCALE), second)
+    # A session still on the older forecast gets its own summary without pinning the entry back
+    assert_matches_full_frame(cache.get("london", 1, first, SCALE), first)
+    assert cache.get("london", 2, second, SCALE).forecast is second
+    assert cache.stats() == {"hits": 2, "updates": 1, "builds": 2, "size": 1}
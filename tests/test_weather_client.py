@@ -0,0 +1,135 @@
+"""WeatherClient against a local stub of the forecast endpoint."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import backend
+from payloads import forecast_payload
+
+
+class StubServer:
+    """Answers each GET with the next scripted ``(status, headers, delay)``;
+    200s carry a synthetic forecast. The last script entry repeats."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(self.path)
+                status, headers, delay = stub.script[min(len(stub.requests), len(stub.script)) - 1]
+                time.sleep(delay)
+                body = json.dumps(forecast_payload()).encode() if status == 200 else b"{}"
+                try:
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/forecast"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(*script):
+        servers.append(StubServer(script))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_quota(monkeypatch):
+    monkeypatch.setattr(backend, "quota", backend.QuotaGovernor(per_minute=None, per_day=None))
+
+
+def client_for(server, **kwargs):
+    sleeps = []
+    client = backend.WeatherClient(api_key="test", base_url=server.url, sleep=sleeps.append, **kwargs)
+    return client, sleeps
+
+
+def test_forecast_decodes_response(stub):
+    server = stub((200, {}, 0))
+    client, sleeps = client_for(server)
+    forecast = client.forecast("London")
+    assert len(forecast) == 40
+    assert "q=London" in server.requests[0] and "appid=test" in server.requests[0]
+    assert sleeps == [] and client.retries == 0
+
+
+def test_retries_server_errors_with_backoff(stub):
+    server = stub((503, {}, 0), (502, {}, 0), (200, {}, 0))
+    client, sleeps = client_for(server, backoff=0.5)
+    assert len(client.forecast("London")) == 40
+    assert len(server.requests) == 3
+    assert sleeps == [0.5, 1.0]
+    assert client.retries == 2
+
+
+def test_honors_retry_after(stub):
+    server = stub((429, {"Retry-After": "7"}, 0), (429, {"Retry-After": "120"}, 0), (200, {}, 0))
+    client, sleeps = client_for(server, max_backoff=30.0)
+    client.forecast("London")
+    assert sleeps == [7.0, 30.0]
+
+
+def test_returns_last_response_when_retries_run_out(stub):
+    server = stub((503, {}, 0))
+    client, sleeps = client_for(server, max_retries=2)
+    response = client.get({"q": "London"})
+    assert response.status_code == 503
+    assert len(server.requests) == 3 and len(sleeps) == 2
+
+
+def test_does_not_retry_client_errors(stub):
+    server = stub((404, {}, 0))
+    client, _ = client_for(server)
+    with pytest.raises(KeyError):
+        client.forecast("Nowhere")
+    assert len(server.requests) == 1
+
+
+def test_read_timeout_is_retried_then_raised(stub):
+    server = stub((200, {}, 0.5))
+    client, sleeps = client_for(server, read_timeout=0.1, max_retries=1)
+    with pytest.raises(requests.Timeout):
+        client.forecast("London")
+    assert len(server.requests) == 2 and len(sleeps) == 1
+
+
+def test_retries_take_calls_from_the_quota(stub, monkeypatch):
+    governor = backend.QuotaGovernor(per_minute=2, per_day=None)
+    monkeypatch.setattr(backend, "quota", governor)
+    server = stub((503, {}, 0))
+    client, _ = client_for(server)
+    client.admit()
+    with pytest.raises(backend.QuotaExceeded):
+        client.forecast("London")
+    # The first attempt and one retry fit the budget of two; the next retry is shed
+    assert len(server.requests) == 2
+    assert governor.stats()["classes"]["interactive"]["admitted"] == 2
@@ -0,0 +1,120 @@
+"""In-process stage timings for fetches and reruns.
+
+Wrap a stage with ``with timing.stage("name"):`` or decorate a function
+with ``@timing.timed("name")``. Samples are kept per stage in a bounded
+window and summarized as p50/p95/p99. Timing is off unless
+``WEATHER_PROFILE=1`` is set or ``enable()`` is called; while off,
+``stage`` hands back a shared no-op context manager, so the hooks cost a
+flag check.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+
+WINDOW = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+_enabled = os.environ.get("WEATHER_PROFILE") == "1"
+_samples = {}
+_lock = threading.Lock()
+_NULL = nullcontext()
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+
+def enabled():
+    return _enabled
+
+
+def record(name, seconds):
+    with _lock:
+        samples = _samples.get(name)
+        if samples is None:
+            samples = _samples[name] = deque(maxlen=WINDOW)
+        samples.append(seconds)
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name):
+    if not _enabled:
+        return _NULL
+    return _Stage(name)
+
+
+def timed(name):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summary():
+    """Return ``{stage: {"count", "mean", "p50", "p95", "p99"}}`` in seconds."""
+    with _lock:
+        snapshot = {name: sorted(samples) for name, samples in _samples.items()}
+    result = {}
+    for name, ordered in sorted(snapshot.items()):
+        if not ordered:
+            continue
+        stats = {"count": len(ordered), "mean": sum(ordered) / len(ordered)}
+        for q in QUANTILES:
+            stats[f"p{round(q * 100)}"] = _quantile(ordered, q)
+        result[name] = stats
+    return result
+
+
+def prometheus_text():
+    """Render the summary in the Prometheus text exposition format."""
+    lines = [
+        "# HELP weather_stage_seconds Time spent per dashboard stage.",
+        "# TYPE weather_stage_seconds summary",
+    ]
+    for name, stats in summary().items():
+        for q in QUANTILES:
+            lines.append(f'weather_stage_seconds{{stage="{name}",quantile="{q}"}} '
+                         f'{stats[f"p{round(q * 100)}"]:.6f}')
+        lines.append(f'weather_stage_seconds_sum{{stage="{name}"}} {stats["mean"] * stats["count"]:.6f}')
+        lines.append(f'weather_stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def json_lines():
+    """One JSON object per stage, suitable for appending to a log."""
+    now = time.time()
+    return "".join(json.dumps({"ts": now, "stage": name, **stats}) + "\n"
+                   for name, stats in summary().items())
+
+
+def reset():
+    with _lock:
+        _samples.clear()